@@ -0,0 +1,183 @@
+import argparse
+import glob
+import hashlib
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from chip8 import CHIP8
+from headless import CYCLES_PER_FRAME, load_input_script, run_headless
+
+__all__ = ['make_jobs', 'run_job', 'load_completed', 'run_batch', 'main']
+
+
+def make_jobs(roms, seeds, input_scripts, cycles,
+              cycles_per_frame=CYCLES_PER_FRAME):
+    """
+    Составить задания для всех сочетаний ROM, зерна и сценария нажатий
+    :param roms: пути к ROM файлам
+    :param seeds: зёрна генератора случайных чисел
+    :param input_scripts: пути к сценариям нажатий (None - без нажатий)
+    :param cycles: число команд в каждом задании
+    :param cycles_per_frame: число команд между уменьшениями таймеров
+    :return: список заданий-словарей
+    """
+    jobs = []
+    for rom in roms:
+        for seed in seeds:
+            for inputs in input_scripts:
+                job = {"rom": rom, "seed": seed, "inputs": inputs,
+                       "cycles": cycles, "cycles_per_frame": cycles_per_frame}
+                job["id"] = "{}|{}|{}|{}|{}".format(
+                    rom, seed, inputs or "-", cycles, cycles_per_frame)
+                jobs.append(job)
+    return jobs
+
+
+def run_job(job):
+    """
+    Выполнить одно задание (вызывается в процессе-исполнителе)
+    :param job: задание из make_jobs
+    :return: словарь с результатом: хеш кадра, регистры, скорость
+    """
+    result = {"id": job["id"], "rom": job["rom"], "seed": job["seed"],
+              "inputs": job["inputs"]}
+    try:
+        game = CHIP8(seed=job["seed"])
+        game.load_rom(job["rom"])
+        events = load_input_script(job["inputs"]) if job["inputs"] else ()
+        start = time.perf_counter()
+        reason, cycles, frames = run_headless(
+            game, game, cycles=job["cycles"],
+            cycles_per_frame=job["cycles_per_frame"], events=events)
+        seconds = time.perf_counter() - start
+    except Exception as err:
+        result["error"] = "{}: {}".format(type(err).__name__, err)
+        return result
+    result.update({
+        "stop_reason": reason,
+        "cycles": cycles,
+        "frames": frames,
+        "frame_sha1": hashlib.sha1(game.display.tobytes()).hexdigest(),
+        "registers": game.get_reg_dump(),
+        "seconds": seconds,
+        "cycles_per_second": cycles / seconds if seconds else None,
+    })
+    return result
+
+
+def load_completed(path):
+    """
+    Прочитать уже записанные результаты. Если прошлый запуск был прерван
+    посреди записи, неполная последняя строка отрезается. Задания,
+    завершившиеся ошибкой, не считаются выполненными и запускаются снова
+    :param path: путь к JSONL файлу с результатами
+    :return: множество идентификаторов выполненных заданий
+    """
+    completed = set()
+    if not os.path.exists(path):
+        return completed
+    good_size = 0
+    with open(path, "rb") as file:
+        for line in file:
+            if not line.endswith(b"\n"):
+                break
+            try:
+                result = json.loads(line)
+                job_id = result["id"]
+            except (ValueError, KeyError):
+                break
+            good_size += len(line)
+            if "error" not in result:
+                completed.add(job_id)
+    if good_size != os.path.getsize(path):
+        with open(path, "r+b") as file:
+            file.truncate(good_size)
+    return completed
+
+
+def run_batch(jobs, output, workers=None):
+    """
+    Разослать задания по процессам и записывать результаты в JSONL по
+    мере готовности. Задания, результаты которых уже есть в output,
+    пропускаются, поэтому прерванный запуск можно продолжить
+    :param jobs: задания из make_jobs
+    :param output: путь к JSONL файлу с результатами
+    :param workers: число процессов (None - по числу ядер)
+    :return: генератор результатов в порядке готовности
+    """
+    completed = load_completed(output)
+    pending = [job for job in jobs if job["id"] not in completed]
+    if not pending:
+        return
+    with open(output, "a") as file, \
+            ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [pool.submit(run_job, job) for job in pending]
+        for future in as_completed(futures):
+            result = future.result()
+            file.write(json.dumps(result) + "\n")
+            file.flush()
+            yield result
+
+
+def parse_seeds(text):
+    """
+    Разобрать список зёрен вида "0-99,200,300-310"
+    :param text:
+    :return: список чисел
+    """
+    seeds = []
+    for part in text.split(","):
+        first, _, last = part.partition("-")
+        seeds.extend(range(int(first), int(last or first) + 1))
+    return seeds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        usage='{} [options]'.format(os.path.basename(sys.argv[0])),
+        description='Run many CHIP8 ROM/seed/input combinations in parallel.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    parser.add_argument('--roms', nargs='+', default=None,
+                        help='ROM files (default: every file in games/)')
+    parser.add_argument('--seeds', type=parse_seeds, default=[0],
+                        help='seeds, e.g. "0-99,200"')
+    parser.add_argument('--inputs', nargs='+', default=None,
+                        help='input scripts; every job runs without input '
+                             'if omitted')
+    parser.add_argument('-c', '--cycles', type=int, default=100000,
+                        help='instructions per job')
+    parser.add_argument('--cycles-per-frame', type=int,
+                        default=CYCLES_PER_FRAME,
+                        help='instructions executed between timer ticks')
+    parser.add_argument('-w', '--workers', type=int, default=None,
+                        help='worker processes (default: CPU count)')
+    parser.add_argument('-o', '--output', type=str, default='batch.jsonl',
+                        help='JSONL file for results; existing results are '
+                             'skipped')
+
+    args = parser.parse_args(argv)
+    roms = args.roms
+    if roms is None:
+        games = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "games")
+        roms = sorted(glob.glob(os.path.join(games, "*")))
+    jobs = make_jobs(roms, args.seeds, args.inputs or [None], args.cycles,
+                     args.cycles_per_frame)
+
+    skipped = len(load_completed(args.output) & {job["id"] for job in jobs})
+    total = len(jobs) - skipped
+    if skipped:
+        print("skipping {} completed jobs".format(skipped), file=sys.stderr)
+    for done, result in enumerate(run_batch(jobs, args.output,
+                                            args.workers), 1):
+        status = result.get("error") or "{:.0f} cycles/s".format(
+            result["cycles_per_second"] or 0)
+        print("[{}/{}] {}: {}".format(done, total, result["id"], status),
+              file=sys.stderr)
+
+
+if __name__ == '__main__':
+    main()
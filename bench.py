@@ -0,0 +1,496 @@
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import timeit
+import tracemalloc
+import zlib
+from array import array
+
+from chip8 import CHIP8, STOP_CYCLES
+from codec import FrameEncoder, FrameDecoder
+from emuprocess import EmulatorProcess
+from scheduler import Scheduler
+
+
+def measure_instances(count):
+    """
+    Измерить, сколько памяти занимает один экземпляр CHIP8 и сколько
+    времени уходит на его создание
+    :param count: число создаваемых экземпляров
+    :return: словарь с результатами
+    """
+    tracemalloc.start()
+    before, _ = tracemalloc.get_traced_memory()
+    instances = [CHIP8() for _ in range(count)]
+    after, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del instances
+
+    timings = timeit.repeat(CHIP8, number=count, repeat=5)
+    return {
+        "instances": count,
+        "bytes_per_instance": (after - before) / count,
+        "construction_us": min(timings) / count * 1e6,
+    }
+
+
+def measure_emulator(rom, seconds, ips, gui_load, in_thread):
+    """
+    Измерить скорость игры в потоке или в отдельном процессе, пока
+    главный поток изображает GUI: 60 раз в секунду забирает кадр и
+    занимает процессор кодом на Python долю gui_load каждого кадра
+    :param rom: путь к ROM файлу
+    :param seconds: длительность измерения
+    :param ips: сколько команд в секунду просить у планировщика (больше,
+                чем может интерпретатор, чтобы мерить предел)
+    :param gui_load: доля кадра, которую занимает работа GUI (0-1)
+    :param in_thread: выполнять игру в потоке, а не в процессе
+    :return: словарь с результатами
+    """
+    frame_seconds = 1 / 60
+    with EmulatorProcess(rom, ips, in_thread=in_thread) as emulator:
+        # Процесс запускается не сразу
+        time.sleep(0.2)
+        first = emulator.get_status()
+        start = time.perf_counter()
+        gui_frames = 0
+        while time.perf_counter() - start < seconds:
+            frame_start = time.perf_counter()
+            emulator.frames.take()
+            busy_until = frame_start + frame_seconds * gui_load
+            while time.perf_counter() < busy_until:
+                pass
+            gui_frames += 1
+            delay = frame_start + frame_seconds - time.perf_counter()
+            if delay > 0:
+                time.sleep(delay)
+        last = emulator.get_status()
+        elapsed = time.perf_counter() - start
+        error = emulator.poll()
+    if error is not None:
+        raise Exception(error)
+    return {
+        "mode": "thread" if in_thread else "process",
+        "cycles_per_second": (last["cycles"] - first["cycles"]) / elapsed,
+        "gui_fps": gui_frames / elapsed,
+        "frames": emulator.frames.get_stats(),
+    }
+
+
+def record_frames(rom, frames, seed=0):
+    """
+    Выполнить игру без окна и запомнить кадр на каждом тике таймеров.
+    Каждые 30 тиков нажимается следующая клавиша, чтобы игра не стояла
+    на заставке
+    :param rom: путь к ROM файлу
+    :param frames: число кадров
+    :param seed: зерно генератора случайных чисел
+    :return: список кадров в формате Display.tobytes
+    """
+    game = CHIP8(seed=seed)
+    game.load_rom(rom)
+    scheduler = Scheduler(game)
+    recorded = []
+    for frame in range(frames):
+        if frame % 30 == 0:
+            key = frame // 30 % 16
+            game.keys[(key - 1) % 16] = False
+            game.keys[key] = True
+        scheduler.run_frame()
+        recorded.append(game.display.tobytes())
+    return recorded
+
+
+def measure_codec(rom, frames, keyframe_interval):
+    """
+    Измерить степень сжатия и скорость FrameEncoder и FrameDecoder на
+    кадрах игры; для сравнения - сжатие каждого кадра zlib
+    :param rom: путь к ROM файлу
+    :param frames: число кадров
+    :param keyframe_interval: через сколько кадров повторяется опорный
+    :return: словарь с результатами
+    """
+    recorded = record_frames(rom, frames)
+    encoder = FrameEncoder(keyframe_interval)
+    start = time.perf_counter()
+    packets = [encoder.encode(frame) for frame in recorded]
+    encode_seconds = time.perf_counter() - start
+
+    decoder = FrameDecoder()
+    start = time.perf_counter()
+    decoded = [decoder.decode(packet) for packet in packets]
+    decode_seconds = time.perf_counter() - start
+    if decoded != recorded:
+        raise Exception("Decoded frames differ from the original ones")
+
+    zlib_bytes = sum(len(zlib.compress(frame)) for frame in recorded)
+    stats = encoder.get_stats()
+    return {
+        "rom": os.path.basename(rom),
+        "frames": frames,
+        "ratio": stats["ratio"],
+        "bytes_per_frame": stats["encoded_bytes"] / frames,
+        "zlib_ratio": stats["raw_bytes"] / zlib_bytes,
+        "encode_frames_per_second": frames / encode_seconds,
+        "decode_frames_per_second": frames / decode_seconds,
+    }
+
+
+# Сколько команд выполняется между тиками таймеров в наборе тестов
+SUITE_CYCLES_PER_FRAME = 10
+# Метрики набора тестов: True - чем больше, тем лучше
+SUITE_METRICS = {
+    "cycles_per_second": True,
+    "frames_per_second": True,
+    "median_cycle_ns": False,
+    "p99_cycle_ns": False,
+    "median_ns": False,
+}
+
+
+def get_suite_inputs(cycles, cycles_per_frame=SUITE_CYCLES_PER_FRAME):
+    """
+    Сценарий нажатий для набора тестов: каждые 60 кадров нажимается
+    следующая клавиша и держится 30 кадров, чтобы игры не стояли на
+    заставке
+    :param cycles: длина сценария в командах
+    :return: список событий (номер команды, клавиша, нажата ли)
+    """
+    events = []
+    period = 60 * cycles_per_frame
+    for number, cycle in enumerate(range(period, cycles, period)):
+        key = number % 16
+        events.append((cycle, key, True))
+        events.append((cycle + period // 2, key, False))
+    return events
+
+
+def get_percentile(values, share):
+    ordered = sorted(values)
+    return ordered[int(share * (len(ordered) - 1))]
+
+
+def measure_rom(rom, cycles, cycles_per_frame=SUITE_CYCLES_PER_FRAME):
+    """
+    Выполнить ROM без окна по сценарию get_suite_inputs и измерить
+    скорость. Время отдельной команды слишком мало, чтобы мерить его без
+    искажений, поэтому время одной команды - время кадра, делённое на
+    число команд в нём; медиана и 99-й процентиль считаются по кадрам
+    :param rom: путь к ROM файлу
+    :param cycles: число команд
+    :param cycles_per_frame: число команд за кадр
+    :return: словарь с результатами
+    """
+    game = CHIP8(seed=0)
+    game.load_rom(rom)
+    events = get_suite_inputs(cycles, cycles_per_frame)
+    next_event = 0
+    frame_ns = array('q')
+    clock = time.perf_counter_ns
+    start = clock()
+    while game.cycles < cycles:
+        while next_event < len(events) \
+                and events[next_event][0] <= game.cycles:
+            _, key, pressed = events[next_event]
+            game.keys[key] = pressed
+            next_event += 1
+        frame_start = clock()
+        reason, done = game.run(min(cycles_per_frame, cycles - game.cycles))
+        frame_ns.append(clock() - frame_start)
+        if reason != STOP_CYCLES:
+            break
+        game.tick_timers()
+    seconds = (clock() - start) / 1e9
+    return {
+        "cycles": game.cycles,
+        "seconds": seconds,
+        "cycles_per_second": game.cycles / seconds,
+        "frames_per_second": len(frame_ns) / seconds,
+        "median_cycle_ns": statistics.median(frame_ns) / cycles_per_frame,
+        "p99_cycle_ns": get_percentile(frame_ns, 0.99) / cycles_per_frame,
+    }
+
+
+def measure_calls(function, number, repeat=5):
+    """
+    Время одного вызова function по timeit
+    :return: словарь: лучшее и медианное время вызова в наносекундах
+    """
+    timings = timeit.repeat(function, number=number, repeat=repeat)
+    return {
+        "best_ns": min(timings) / number * 1e9,
+        "median_ns": statistics.median(timings) / number * 1e9,
+    }
+
+
+def measure_micro(rom, number=20000):
+    """
+    Микротесты: одна команда (emulate_cycle), рисование спрайта высотой
+    5 строк (draw_sprite), очистка экрана (clear_screen), загрузка ROM
+    (load_rom) и создание машины (CHIP8())
+    :param rom: ROM для emulate_cycle и load_rom
+    :param number: сколько раз вызывать функцию в одном повторе
+    :return: словарь имя -> measure_calls
+    """
+    game = CHIP8(seed=0)
+    game.load_rom(rom)
+    sprite = CHIP8(seed=0)
+    # D015: спрайт цифры из шрифта (I = 0) по координатам V0, V1
+    sprite.opcode = 0xD015
+    return {
+        "emulate_cycle": measure_calls(game.emulate_cycle, number),
+        "draw_sprite": measure_calls(sprite.draw_sprite, number),
+        "clear_screen": measure_calls(sprite.clear_screen, number),
+        "load_rom": measure_calls(lambda: game.load_rom(rom), number // 20),
+        "construction": measure_calls(CHIP8, number // 20),
+    }
+
+
+def get_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True,
+            text=True, check=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_suite(roms, cycles, micro_rom, label=None):
+    """
+    Выполнить весь набор тестов
+    :param roms: пути к ROM файлам
+    :param cycles: сколько команд выполнять каждый ROM
+    :param micro_rom: ROM для микротестов
+    :param label: подпись запуска в истории
+    :return: словарь - запись истории
+    """
+    return {
+        "date": datetime.datetime.now().isoformat(timespec='seconds'),
+        "label": label,
+        "commit": get_commit(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "cycles": cycles,
+        "roms": {os.path.basename(rom): measure_rom(rom, cycles)
+                 for rom in roms},
+        "micro": measure_micro(micro_rom),
+    }
+
+
+def load_history(path):
+    """
+    :param path: файл истории (JSON со списком запусков "runs")
+    :return: список запусков, пустой, если файла нет
+    """
+    try:
+        with open(path) as file:
+            return json.load(file)["runs"]
+    except FileNotFoundError:
+        return []
+
+
+def save_history(path, runs):
+    with open(path, "w") as file:
+        json.dump({"runs": runs}, file, indent=2)
+
+
+def get_suite_metrics(run):
+    """
+    Все сравниваемые метрики запуска
+    :return: словарь "раздел/имя/метрика" -> (значение, больше ли лучше)
+    """
+    metrics = {}
+    for section in ("roms", "micro"):
+        for name, result in run.get(section, {}).items():
+            for metric, value in result.items():
+                if metric in SUITE_METRICS:
+                    metrics["{}/{}/{}".format(section, name, metric)] = \
+                        (value, SUITE_METRICS[metric])
+    return metrics
+
+
+def compare_runs(base, head, threshold):
+    """
+    Сравнить два запуска набора тестов
+    :param base: прежний запуск
+    :param head: новый запуск
+    :param threshold: на сколько (доля, например 0.1) метрика может
+                      ухудшиться, не считаясь регрессией
+    :return: список (метрика, было, стало, изменение в долях, регрессия
+             ли); изменение положительно, если стало лучше
+    """
+    base_metrics = get_suite_metrics(base)
+    rows = []
+    for name, (value, higher_is_better) in sorted(
+            get_suite_metrics(head).items()):
+        if name not in base_metrics or not base_metrics[name][0]:
+            continue
+        old = base_metrics[name][0]
+        change = (value - old) / old
+        if not higher_is_better:
+            change = -change
+        rows.append((name, old, value, change, change < -threshold))
+    return rows
+
+
+def find_run(runs, name):
+    """
+    Найти запуск по номеру в истории (отрицательный - с конца) или подписи
+    """
+    try:
+        return runs[int(name)]
+    except ValueError:
+        for run in reversed(runs):
+            if run.get("label") == name:
+                return run
+    except IndexError:
+        pass
+    raise Exception("No run {} in the history".format(name))
+
+
+def main():
+    games = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'games')
+    parser = argparse.ArgumentParser(
+        usage='{} command'.format(os.path.basename(sys.argv[0])),
+        description='CHIP8 benchmarks',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    instance = commands.add_parser(
+        'instance', help='measure memory and construction time of CHIP8')
+    instance.add_argument('-n', '--count', type=int, default=1000,
+                          help='number of instances to create')
+
+    process = commands.add_parser(
+        'process', help='compare emulation and GUI speed when the emulator '
+                        'runs in a thread and in a separate process',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    process.add_argument('rom', type=str, help='way to rom file')
+    process.add_argument('-s', '--seconds', type=float, default=5,
+                         help='duration of each measurement')
+    process.add_argument('-i', '--ips', type=int, default=10 ** 7,
+                         help='requested instructions per second; the '
+                              'default is more than the interpreter can do')
+    process.add_argument('--gui-load', type=float, default=0.5,
+                         help='share of every 60 Hz frame the simulated GUI '
+                              'spends running Python code')
+
+    codec = commands.add_parser(
+        'codec', help='measure compression ratio and speed of the frame '
+                      'codec on recorded games',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    codec.add_argument('roms', type=str, nargs='*',
+                       help='ROM files (default: every file in games)')
+    codec.add_argument('-f', '--frames', type=int, default=3600,
+                       help='frames to record from each ROM')
+    codec.add_argument('-k', '--keyframe-interval', type=int, default=60,
+                       help='frames between keyframes')
+
+    suite = commands.add_parser(
+        'suite', help='run every ROM with scripted inputs and the '
+                      'microbenchmarks, append results to the history',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    suite.add_argument('roms', type=str, nargs='*',
+                       help='ROM files (default: every file in games)')
+    suite.add_argument('-c', '--cycles', type=int, default=1000000,
+                       help='instructions to execute for each ROM')
+    suite.add_argument('--micro-rom', type=str,
+                       default=os.path.join(games, 'BRIX'),
+                       help='ROM for the emulate_cycle and load_rom '
+                            'microbenchmarks')
+    suite.add_argument('--history', type=str, default='bench_history.json',
+                       help='JSON file the results are appended to')
+    suite.add_argument('-l', '--label', type=str, default=None,
+                       help='name of this run in the history')
+
+    compare = commands.add_parser(
+        'compare', help='compare two runs from the history and flag '
+                        'regressions',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    compare.add_argument('base', type=str, nargs='?', default='-2',
+                         help='run index in the history (negative counts '
+                              'from the end) or label')
+    compare.add_argument('head', type=str, nargs='?', default='-1',
+                         help='run index or label')
+    compare.add_argument('--history', type=str,
+                         default='bench_history.json',
+                         help='JSON file with the runs')
+    compare.add_argument('-t', '--threshold', type=float, default=10,
+                         help='percent a metric may get worse before it is '
+                              'reported as a regression')
+
+    args = parser.parse_args()
+    if args.command == 'suite':
+        roms = args.roms or [os.path.join(games, name) for name
+                             in sorted(os.listdir(games))]
+        run = run_suite(roms, args.cycles, args.micro_rom, args.label)
+        print("{:10} {:>12} {:>10} {:>14} {:>12}".format(
+            "rom", "cycles/s", "frames/s", "median ns/cyc", "p99 ns/cyc"))
+        for name, result in run["roms"].items():
+            print("{:10} {cycles_per_second:12.0f} {frames_per_second:10.0f} "
+                  "{median_cycle_ns:14.0f} {p99_cycle_ns:12.0f}".format(
+                      name, **result))
+        for name, result in run["micro"].items():
+            print("{:14} best {best_ns:9.0f} ns, median {median_ns:9.0f} "
+                  "ns".format(name, **result))
+        runs = load_history(args.history)
+        runs.append(run)
+        save_history(args.history, runs)
+        print("run {} saved to {}".format(len(runs) - 1, args.history))
+    elif args.command == 'compare':
+        runs = load_history(args.history)
+        if len(runs) < 2:
+            print("{} has {} runs, nothing to compare".format(
+                args.history, len(runs)))
+            return
+        base = find_run(runs, args.base)
+        head = find_run(runs, args.head)
+        rows = compare_runs(base, head, args.threshold / 100)
+        regressions = 0
+        for name, old, new, change, regression in rows:
+            print("{:40} {:14.1f} {:14.1f} {:+7.1f}%{}".format(
+                name, old, new, change * 100,
+                "  REGRESSION" if regression else ""))
+            regressions += regression
+        print("{} regressions beyond {}% ({} -> {})".format(
+            regressions, args.threshold, base.get("commit"),
+            head.get("commit")))
+        if regressions:
+            sys.exit(1)
+    elif args.command == 'codec':
+        roms = args.roms or [os.path.join(games, name) for name
+                             in sorted(os.listdir(games))]
+        print("{:10} {:>7} {:>11} {:>10} {:>12} {:>12}".format(
+            "rom", "ratio", "bytes/frame", "zlib ratio", "encode fps",
+            "decode fps"))
+        for rom in roms:
+            result = measure_codec(rom, args.frames, args.keyframe_interval)
+            print("{rom:10} {ratio:7.1f} {bytes_per_frame:11.1f} "
+                  "{zlib_ratio:10.1f} {encode_frames_per_second:12.0f} "
+                  "{decode_frames_per_second:12.0f}".format(**result))
+    elif args.command == 'process':
+        for in_thread in (True, False):
+            result = measure_emulator(args.rom, args.seconds, args.ips,
+                                      args.gui_load, in_thread)
+            print("{}: {:.0f} instructions/s, GUI {:.1f} fps, "
+                  "frames {}".format(result["mode"],
+                                     result["cycles_per_second"],
+                                     result["gui_fps"], result["frames"]))
+    elif args.command == 'instance':
+        result = measure_instances(args.count)
+        print("bytes per instance: {:.0f}".format(
+            result["bytes_per_instance"]))
+        print("construction time: {:.1f} us".format(
+            result["construction_us"]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,411 @@
+import re
+from contextlib import contextmanager
+
+from chip8 import BreakpointHit, STOP_BREAKPOINT, STOP_WATCHPOINT
+from profiler import get_opcode_pattern
+
+__all__ = ['Breakpoints', 'Condition']
+
+# Сравнение в условии: "V3 == 7", "I >= 0x300", "DT != VF"
+COMPARISON = re.compile(r'^\s*(\w+)\s*(==|!=|<=|>=|<|>)\s*(\w+)\s*$')
+OPERATORS = {
+    "==": lambda a, b: a == b,
+    "!=": lambda a, b: a != b,
+    "<": lambda a, b: a < b,
+    "<=": lambda a, b: a <= b,
+    ">": lambda a, b: a > b,
+    ">=": lambda a, b: a >= b,
+}
+# Регистры, которые можно упоминать в условиях, кроме V0-VF
+REGISTERS = {"PC": "pc", "I": "index", "SP": "sp", "DT": "delay_timer",
+             "ST": "sound_timer"}
+# Класс команды, как у profiler.get_opcode_pattern: DXYN, 8XY4, FX33
+OPCODE_PATTERN = re.compile(r'^[0-9A-F][0-9A-FXYN]{3}$')
+# Точка в текстовом виде (как в describe): "0x248", "pc 0x248 if V3 == 7",
+# "DXYN", "FX33 if I >= 0x300", "write 0x300-0x30F"
+BREAK_TEXT = re.compile(r'^\s*(?:(pc|write)\s+)?(\S+?)(?:-(\S+))?'
+                        r'(?:\s+if\s+(.+?))?\s*$', re.I)
+
+
+def is_opcode_pattern(pattern):
+    """
+    Можно ли получить такой класс из get_opcode_pattern
+    :param pattern: строка в верхнем регистре
+    :return:
+    """
+    if not OPCODE_PATTERN.match(pattern):
+        return False
+    opcode = int(re.sub('[XYN]', '0', pattern), 16)
+    return get_opcode_pattern(opcode) == pattern
+
+
+def get_operand(token):
+    """
+    Функция, читающая операнд условия из машины
+    :param token: V0-VF, PC, I, SP, DT, ST или число (10, 0x1F, 0b101)
+    :return: функция от машины
+    """
+    name = token.upper()
+    if re.match(r'^V[0-9A-F]$', name):
+        register = int(name[1], 16)
+        return lambda game: game.v[register]
+    if name in REGISTERS:
+        slot = REGISTERS[name]
+        return lambda game: getattr(game, slot)
+    try:
+        value = int(token, 0)
+    except ValueError:
+        raise ValueError("Unknown operand {!r}".format(token)) from None
+    return lambda game: value
+
+
+def parse_address(text):
+    try:
+        return int(text, 0)
+    except ValueError:
+        raise ValueError("Bad address {!r}".format(text)) from None
+
+
+def describe_break(name, condition):
+    return name if condition is None else name + " if " + condition.text
+
+
+class Condition:
+    """
+    Условие точки останова: сравнения регистров и чисел, соединённые
+    "and", например "V3 == 7 and I >= 0x300". Разбирается один раз,
+    проверяется без eval
+    :param text: текст условия
+    """
+
+    def __init__(self, text):
+        self.text = text
+        self.checks = []
+        for part in re.split(r'\s+and\s+', text.strip(), flags=re.I):
+            match = COMPARISON.match(part)
+            if match is None:
+                raise ValueError("Bad condition {!r}".format(text))
+            left, operator, right = match.groups()
+            self.checks.append((get_operand(left), OPERATORS[operator],
+                                get_operand(right)))
+
+    def __call__(self, game):
+        return all(operator(left(game), right(game))
+                   for left, operator, right in self.checks)
+
+    def __repr__(self):
+        return "Condition({!r})".format(self.text)
+
+
+class BreakpointCache(dict):
+    """
+    Кэш декодированных команд, в котором по адресам с точками останова
+    (и по командам отслеживаемых классов) лежат ловушки вместо
+    обработчиков. Кэш сбрасывается при изменении кода, и ловушки заново
+    ставятся при следующем декодировании, так что проверка в самом цикле
+    CHIP8.run не нужна
+    """
+
+    def __init__(self, breakpoints):
+        super().__init__()
+        self.breakpoints = breakpoints
+
+    def __missing__(self, pc):
+        game = self.breakpoints.game
+        memory = game.memory
+        opcode, handler = game.decode((memory[pc] << 8) | memory[pc + 1])
+        if self.breakpoints.is_trapped(pc, opcode):
+            handler = self.breakpoints.make_trap(pc, handler)
+        entry = (opcode, handler)
+        self[pc] = entry
+        return entry
+
+    def clear(self):
+        # Весь кэш сбрасывает load_state: машина оказалась в другом
+        # состоянии, и команда, на которой стояли, выполняется заново
+        # с проверкой
+        self.breakpoints.resume_pc = None
+        super().clear()
+
+
+class Breakpoints:
+    """
+    Точки останова и отслеживание записи в память для CHIP8.run и
+    run_until (и всего, что на них построено: Scheduler, run_headless,
+    режим отладки в окне):
+        * по адресу (PC), в том числе с условием (Condition);
+        * по классу команды, например любая DXYN;
+        * на запись командами FX55 и FX33 в диапазоны памяти.
+    Адреса отмечены в битовой карте pc_map, и по этим адресам (и для
+    отслеживаемых классов) в кэш декодированных команд кладутся ловушки,
+    поэтому остальные команды выполняются с обычной скоростью, а условия
+    проверяются только на своих адресах. Запись в память машина проверяет
+    по карте watch_map только в FX55 и FX33.
+    При срабатывании run возвращает STOP_BREAKPOINT (PC указывает на
+    команду, она ещё не выполнена) или STOP_WATCHPOINT (команда записи
+    выполнена), подробности - в last_hit. Следующий run начинается с
+    этой же команды и на ней не останавливается.
+    С BlockCompiler не работает: блоки не обращаются к кэшу команд
+    :param game: экземпляр CHIP8
+    """
+
+    def __init__(self, game):
+        if game.block_compiler is not None:
+            raise Exception("Breakpoints do not work with the block compiler")
+        if game.breakpoints is not None \
+                or type(game.decode_cache) is not dict:
+            raise Exception("The decode cache is already replaced")
+        self.game = game
+        self.pc_map = bytearray(len(game.memory))
+        self.watch_map = bytearray(len(game.memory))
+        # Адрес -> условие (None - без условия)
+        self.pc_breaks = {}
+        # Класс команды (DXYN) -> условие (None - без условия)
+        self.opcode_breaks = {}
+        # Отслеживаемые диапазоны [start, end)
+        self.watches = []
+        # Команда, на которой сработала точка: при продолжении она
+        # выполняется без остановки
+        self.resume_pc = None
+        self.last_hit = None
+        self.hits = 0
+        # Выключенные точки не срабатывают (например, пока перемотка
+        # выполняет команды заново)
+        self.enabled = True
+        self.cache = BreakpointCache(self)
+        game.decode_cache = self.cache
+        game.breakpoints = self
+
+    def detach(self):
+        """
+        Убрать все точки и вернуть машине обычный кэш команд
+        :return:
+        """
+        if self.game.breakpoints is self:
+            self.game.breakpoints = None
+            self.game.decode_cache = {}
+
+    def is_trapped(self, pc, opcode):
+        return self.pc_map[pc] or (
+            self.opcode_breaks and
+            get_opcode_pattern(opcode) in self.opcode_breaks)
+
+    def make_trap(self, pc, handler):
+        """
+        Обработчик для адреса с точкой останова: проверяет точку и либо
+        останавливает машину перед командой, либо выполняет её
+        :param pc: адрес команды
+        :param handler: настоящий обработчик
+        :return: функция с тем же интерфейсом
+        """
+        def trap(game):
+            resume = self.resume_pc == pc
+            self.resume_pc = None
+            if not resume and self.enabled:
+                description = self.check(pc, game)
+                if description is not None:
+                    game.pc = pc
+                    self.resume_pc = pc
+                    self.hit(STOP_BREAKPOINT, pc, description)
+            handler(game)
+        return trap
+
+    def check(self, pc, game):
+        """
+        Какая точка срабатывает на команде pc
+        :return: описание точки или None
+        """
+        if self.pc_map[pc]:
+            condition = self.pc_breaks[pc]
+            if condition is None or condition(game):
+                return describe_break("pc 0x{:03X}".format(pc), condition)
+        if self.opcode_breaks:
+            pattern = get_opcode_pattern(game.opcode)
+            if pattern in self.opcode_breaks:
+                condition = self.opcode_breaks[pattern]
+                if condition is None or condition(game):
+                    return describe_break(pattern, condition)
+        return None
+
+    def check_write(self, start, end):
+        """
+        Вызывается машиной после записи в память [start, end) командами
+        FX55 и FX33
+        :return:
+        """
+        if not self.enabled:
+            return
+        watch_map = self.watch_map
+        for address in range(start, end):
+            if watch_map[address]:
+                self.hit(STOP_WATCHPOINT, self.game.pc - 2,
+                         "write 0x{:03X}".format(address), address)
+
+    def hit(self, reason, pc, description, address=None):
+        self.hits += 1
+        self.last_hit = {
+            "reason": reason,
+            "pc": pc,
+            "breakpoint": description,
+            "address": address,
+        }
+        raise BreakpointHit(reason, reason == STOP_WATCHPOINT)
+
+    def add(self, pc, condition=None):
+        """
+        Поставить точку останова по адресу (заменяет прежнюю на нём)
+        :param pc: адрес команды
+        :param condition: Condition, текст условия или None
+        :return:
+        """
+        if not 0 <= pc < len(self.pc_map) - 1:
+            raise ValueError("Address out of memory: {}".format(pc))
+        if isinstance(condition, str):
+            condition = Condition(condition)
+        self.pc_breaks[pc] = condition
+        self.pc_map[pc] = 1
+        self.cache.pop(pc, None)
+
+    def remove(self, pc):
+        if self.pc_breaks.pop(pc, False) is not False:
+            self.pc_map[pc] = 0
+            self.cache.pop(pc, None)
+
+    def add_opcode(self, pattern, condition=None):
+        """
+        Останавливаться на любой команде класса pattern
+        :param pattern: класс как у profiler.get_opcode_pattern: DXYN,
+                        8XY4, FX33...
+        :param condition: Condition, текст условия или None
+        :return:
+        """
+        pattern = pattern.upper()
+        if not is_opcode_pattern(pattern):
+            raise ValueError("Bad opcode class {!r}".format(pattern))
+        if isinstance(condition, str):
+            condition = Condition(condition)
+        self.opcode_breaks[pattern] = condition
+        self.flush()
+
+    def remove_opcode(self, pattern):
+        if self.opcode_breaks.pop(pattern.upper(), False) is not False:
+            self.flush()
+
+    def watch(self, start, end=None):
+        """
+        Останавливаться после записи в память [start, end)
+        :param start: первый адрес
+        :param end: адрес после последнего, по умолчанию - start + 1
+        :return:
+        """
+        if end is None:
+            end = start + 1
+        if not 0 <= start < end <= len(self.watch_map):
+            raise ValueError("Bad range {}-{}".format(start, end))
+        self.watches.append((start, end))
+        self.update_watch_map()
+
+    def unwatch(self, start, end=None):
+        if end is None:
+            end = start + 1
+        self.watches = [watch for watch in self.watches
+                        if watch != (start, end)]
+        self.update_watch_map()
+
+    def update_watch_map(self):
+        self.watch_map[:] = bytes(len(self.watch_map))
+        for start, end in self.watches:
+            self.watch_map[start:end] = b"\x01" * (end - start)
+
+    def add_text(self, text):
+        """
+        Добавить точку, записанную текстом, как в describe:
+            0x248, pc 0x248, 0x248 if V3 == 7 - по адресу;
+            DXYN, FX33 if I >= 0x300 - по классу команды;
+            write 0x30E, write 0x300-0x30F - запись в память (конец
+            диапазона включается)
+        :param text: строка
+        :return:
+        """
+        match = BREAK_TEXT.match(text)
+        if match is None:
+            raise ValueError("Bad breakpoint {!r}".format(text))
+        kind, target, end, condition = match.groups()
+        kind = (kind or "").lower()
+        if kind == "write":
+            if condition is not None:
+                raise ValueError("Watchpoints have no conditions")
+            start = parse_address(target)
+            self.watch(start, parse_address(end) + 1 if end else None)
+        elif end is not None:
+            raise ValueError("Bad breakpoint {!r}".format(text))
+        elif not kind and is_opcode_pattern(target.upper()):
+            self.add_opcode(target, condition)
+        else:
+            self.add(parse_address(target), condition)
+
+    def remove_text(self, text):
+        """
+        Убрать точку, записанную текстом, как в add_text (условие не
+        важно)
+        :param text: строка
+        :return:
+        """
+        match = BREAK_TEXT.match(text)
+        if match is None:
+            raise ValueError("Bad breakpoint {!r}".format(text))
+        kind, target, end, _ = match.groups()
+        kind = (kind or "").lower()
+        if kind == "write":
+            start = parse_address(target)
+            self.unwatch(start, parse_address(end) + 1 if end else None)
+        elif not kind and is_opcode_pattern(target.upper()):
+            self.remove_opcode(target)
+        else:
+            self.remove(parse_address(target))
+
+    @contextmanager
+    def suspended(self):
+        """
+        Контекст, в котором точки не срабатывают
+        :return:
+        """
+        enabled = self.enabled
+        self.enabled = False
+        try:
+            yield self
+        finally:
+            self.enabled = enabled
+
+    def clear(self):
+        """
+        Убрать все точки останова и отслеживания
+        :return:
+        """
+        self.pc_breaks.clear()
+        self.opcode_breaks.clear()
+        self.pc_map[:] = bytes(len(self.pc_map))
+        self.watches = []
+        self.update_watch_map()
+        self.flush()
+
+    def flush(self):
+        # Ловушки перестанут или начнут ставиться при декодировании;
+        # команда, на которой стоим, при этом по-прежнему пропускается
+        dict.clear(self.cache)
+
+    def describe(self):
+        """
+        Список всех точек в текстовом виде
+        :return: список строк
+        """
+        lines = [describe_break("pc 0x{:03X}".format(pc), self.pc_breaks[pc])
+                 for pc in sorted(self.pc_breaks)]
+        lines += [describe_break(pattern, self.opcode_breaks[pattern])
+                  for pattern in sorted(self.opcode_breaks)]
+        for start, end in self.watches:
+            if end - start == 1:
+                lines.append("write 0x{:03X}".format(start))
+            else:
+                lines.append("write 0x{:03X}-0x{:03X}".format(start, end - 1))
+        return lines
@@ -0,0 +1,266 @@
+import time
+import zlib
+from array import array
+from random import Random
+
+from chip8 import SHARED_RNG, STATE_SIZE, STOP_CYCLES
+
+__all__ = ['CheckpointStore']
+
+TICK_EVENT = -1
+# Сколько байт занимает одно событие
+EVENT_SIZE = array('q').itemsize + array('b').itemsize
+
+
+def xor_bytes(left, right):
+    """
+    Сложить по модулю 2 две строки байт одинаковой длины
+    :return:
+    """
+    size = len(left)
+    return (int.from_bytes(left, 'little')
+            ^ int.from_bytes(right, 'little')).to_bytes(size, 'little')
+
+
+class Checkpoint:
+    """
+    Снимок машины. Самый новый снимок и опорные снимки (каждый
+    keyframe_interval-й) хранят состояние целиком, остальные - разность
+    (XOR) с более новым соседом. Всё, кроме самого нового, сжато zlib.
+    events - сколько событий было записано к моменту снимка
+    """
+    __slots__ = ('cycle', 'events', 'keyframe', 'data')
+
+    def __init__(self, cycle, events, keyframe, data):
+        self.cycle = cycle
+        self.events = events
+        self.keyframe = keyframe
+        self.data = data
+
+
+class CheckpointStore:
+    """
+    Хранилище снимков для перемотки назад. Каждые interval команд
+    сохраняется снимок машины (CHIP8.save_state), а все внешние события -
+    нажатия клавиш и уменьшения таймеров - записываются с номером команды,
+    поэтому их нужно передавать через set_key и tick_timers.
+    seek(cycle) восстанавливает ближайший более ранний снимок и заново
+    выполняет команды с записанными событиями до нужной команды.
+    Старые снимки хранятся как сжатая разность с более новыми; когда
+    занятая память превышает max_bytes, самые старые снимки удаляются
+    :param game: экземпляр CHIP8
+    :param interval: число команд между снимками
+    :param max_bytes: наибольший объём памяти под снимки и события
+    :param keyframe_interval: каждый какой снимок хранится целиком, чтобы
+                              восстановление не разворачивало длинную цепочку
+                              разностей
+    """
+
+    def __init__(self, game, interval=1000, max_bytes=4 * 1024 * 1024,
+                 keyframe_interval=16):
+        self.game = game
+        self.interval = interval
+        self.max_bytes = max_bytes
+        self.keyframe_interval = keyframe_interval
+        # Общий генератор мог бы потратить кто-то ещё, и повтор разошёлся
+        # бы с оригиналом, поэтому машине выдаётся собственная копия
+        if game.rng is SHARED_RNG:
+            game.rng = Random.__new__(Random)
+            game.rng.setstate(SHARED_RNG.getstate())
+        self.last_seek_seconds = None
+        self.reset()
+
+    def reset(self):
+        """
+        Забыть все снимки и события и начать запись с текущего состояния
+        машины (например, после CHIP8.load_state)
+        :return:
+        """
+        # События: номер команды и код события - TICK_EVENT для таймеров,
+        # номер клавиши для нажатия и номер + 16 для отпускания
+        self.event_cycles = array('q')
+        self.event_codes = array('b')
+        self.checkpoints = []
+        self.taken = 0
+        self.stored_bytes = 0
+        self.checkpoint()
+
+    @property
+    def oldest_cycle(self):
+        return self.checkpoints[0].cycle
+
+    def set_key(self, key, pressed):
+        """
+        Нажать или отпустить клавишу и запомнить это
+        :param key: номер клавиши 0-f
+        :param pressed:
+        :return:
+        """
+        self.game.keys[key] = pressed
+        self.add_event(key if pressed else key + 16)
+
+    def tick_timers(self):
+        """
+        Уменьшить таймеры машины и запомнить это
+        :return:
+        """
+        self.game.tick_timers()
+        self.add_event(TICK_EVENT)
+
+    def add_event(self, code):
+        self.event_cycles.append(self.game.cycles)
+        self.event_codes.append(code)
+        self.stored_bytes += EVENT_SIZE
+
+    def update(self):
+        """
+        Сделать снимок, если с прошлого прошло не меньше interval команд.
+        Вызывается после выполнения очередной порции команд
+        :return:
+        """
+        if self.game.cycles - self.checkpoints[-1].cycle >= self.interval:
+            self.checkpoint()
+
+    def checkpoint(self):
+        """
+        Сделать снимок текущего состояния
+        :return:
+        """
+        state = self.game.save_state()
+        checkpoints = self.checkpoints
+        if checkpoints:
+            newest = checkpoints[-1]
+            if newest.cycle == self.game.cycles:
+                self.stored_bytes -= len(newest.data)
+                newest.data = state
+                newest.events = len(self.event_codes)
+                self.stored_bytes += len(state)
+                return
+            # Прошлый самый новый снимок становится разностью с текущим
+            previous = newest.data
+            if not newest.keyframe:
+                previous = xor_bytes(previous, state)
+            compressed = zlib.compress(previous, 1)
+            self.stored_bytes += len(compressed) - len(newest.data)
+            newest.data = compressed
+        keyframe = self.taken % self.keyframe_interval == 0
+        checkpoints.append(Checkpoint(self.game.cycles,
+                                      len(self.event_codes), keyframe, state))
+        self.taken += 1
+        self.stored_bytes += len(state)
+        while self.stored_bytes > self.max_bytes and len(checkpoints) > 1:
+            self.drop_oldest()
+
+    def drop_oldest(self):
+        oldest = self.checkpoints.pop(0)
+        self.stored_bytes -= len(oldest.data)
+        # События до нового самого старого снимка больше не нужны
+        dropped = self.checkpoints[0].events
+        del self.event_cycles[:dropped]
+        del self.event_codes[:dropped]
+        self.stored_bytes -= dropped * EVENT_SIZE
+        for checkpoint in self.checkpoints:
+            checkpoint.events -= dropped
+
+    def get_state(self, position):
+        """
+        Восстановить полное состояние снимка номер position, разворачивая
+        разности от ближайшего более нового полного снимка
+        :param position: индекс в self.checkpoints
+        :return: bytes в формате CHIP8.save_state
+        """
+        checkpoints = self.checkpoints
+        newest = len(checkpoints) - 1
+        full = position
+        while full < newest and not checkpoints[full].keyframe:
+            full += 1
+        if full == newest:
+            state = checkpoints[full].data
+        else:
+            state = zlib.decompress(checkpoints[full].data)
+        for index in range(full - 1, position - 1, -1):
+            state = xor_bytes(state, zlib.decompress(checkpoints[index].data))
+        return state
+
+    def seek(self, cycle):
+        """
+        Вернуть машину в состояние после cycle команд (с учётом всех
+        событий, записанных на этой команде). Всё, что было записано
+        позже, забывается
+        :param cycle: номер команды, не меньше oldest_cycle и не больше
+                      текущего
+        :return:
+        """
+        game = self.game
+        if not self.oldest_cycle <= cycle <= game.cycles:
+            raise Exception("Cycle {} is out of recorded range {}-{}".format(
+                cycle, self.oldest_cycle, game.cycles))
+        start = time.perf_counter()
+        checkpoints = self.checkpoints
+        position = len(checkpoints) - 1
+        while checkpoints[position].cycle > cycle:
+            position -= 1
+        paused = game.is_paused
+        state = self.get_state(position)
+        game.load_state(state)
+        game.is_paused = False
+
+        cycles, codes = self.event_cycles, self.event_codes
+        count = len(codes)
+        index = checkpoints[position].events
+        while True:
+            while index < count and cycles[index] <= game.cycles:
+                code = codes[index]
+                if code == TICK_EVENT:
+                    game.tick_timers()
+                else:
+                    game.keys[code & 15] = code < 16
+                index += 1
+            if game.cycles >= cycle:
+                break
+            budget = cycle - game.cycles
+            if index < count:
+                budget = min(budget, cycles[index] - game.cycles)
+            reason, _ = game.run(budget)
+            if reason != STOP_CYCLES:
+                break
+        game.is_paused = paused
+        game.draw_flag = True
+
+        del cycles[index:]
+        del codes[index:]
+        self.stored_bytes -= (count - index) * EVENT_SIZE
+        if position < len(checkpoints) - 1:
+            for dropped in checkpoints[position + 1:]:
+                self.stored_bytes -= len(dropped.data)
+            del checkpoints[position + 1:]
+            # Самый новый снимок всегда хранится целиком
+            newest = checkpoints[position]
+            self.stored_bytes += len(state) - len(newest.data)
+            newest.data = state
+        self.last_seek_seconds = time.perf_counter() - start
+
+    def step_back(self, cycles=1):
+        """
+        Перемотать назад на cycles команд (не дальше самого старого снимка)
+        :param cycles:
+        :return:
+        """
+        self.seek(max(self.game.cycles - cycles, self.oldest_cycle))
+
+    def get_stats(self):
+        """
+        Сколько снимков хранится, сколько памяти они занимают и сколько
+        длилась последняя перемотка
+        :return: словарь
+        """
+        count = len(self.checkpoints)
+        return {
+            "checkpoints": count,
+            "oldest_cycle": self.oldest_cycle,
+            "events": len(self.event_codes),
+            "stored_bytes": self.stored_bytes,
+            "uncompressed_bytes": count * STATE_SIZE,
+            "last_seek_ms": None if self.last_seek_seconds is None
+            else self.last_seek_seconds * 1000,
+        }
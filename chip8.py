@@ -1,8 +1,14 @@
-from random import randint
+import struct
+from array import array
+from collections.abc import Mapping
+from random import Random
 
 from config import PC, V, SP, INDEX, SOUND, DELAY
+from display import Display
 
-__all__ = ['CHIP8']
+__all__ = ['CHIP8', 'BreakpointHit', 'STOP_CYCLES', 'STOP_PAUSED',
+           'STOP_PC', 'STOP_DRAW', 'STOP_SOUND', 'STOP_KEY_WAIT',
+           'STOP_BREAKPOINT', 'STOP_WATCHPOINT']
 
 FONTS = [
     0xF0, 0x90, 0x90, 0x90, 0xF0,  # 0
@@ -23,85 +29,306 @@ FONTS = [
     0xF0, 0x80, 0xF0, 0x80, 0x80  # F
 ]
 
-NOT_A_KEY = -999
+# Причины остановки run, run_frames и run_until
+STOP_CYCLES = "cycles"  # выполнено заданное число команд
+STOP_PAUSED = "paused"  # игра поставлена на паузу
+STOP_PC = "pc"  # PC достиг заданного адреса
+STOP_DRAW = "draw"  # выполнена команда DXYN
+STOP_SOUND = "sound"  # звуковой таймер запущен командой FX18
+STOP_KEY_WAIT = "key_wait"  # FX0A ждёт нажатия клавиши
+STOP_BREAKPOINT = "breakpoint"  # точка останова (см. breakpoints.py)
+STOP_WATCHPOINT = "watchpoint"  # запись в отслеживаемую память
+
+# Генератор случайных чисел для экземпляров, созданных без seed
+SHARED_RNG = Random()
+
+# Формат сохранённого состояния (save_state/load_state): заголовок, затем
+# V (16 байт), стек (17 по 2 байта), память (4096 байт), кадр (256 байт
+# в формате Display.tobytes) и состояние генератора случайных чисел.
+# Все числа - little-endian. При изменении формата нужно увеличить версию
+STATE_MAGIC = b'C8ST'
+STATE_VERSION = 1
+# magic, версия, PC, I, SP, опкод, таймеры задержки и звука, маска клавиш,
+# флаги (STATE_DRAW_FLAG, STATE_PAUSED), число выполненных команд
+STATE_HEADER = struct.Struct('<4sHHHhHBBHBQ')
+STATE_STACK = struct.Struct('<17H')
+# Версия Random, 625 слов состояния Mersenne Twister, gauss_next и
+# признак того, что gauss_next не None
+STATE_RNG = struct.Struct('<i625Id?')
+STATE_DRAW_FLAG = 1
+STATE_PAUSED = 2
+STATE_V = STATE_HEADER.size
+STATE_STACK_OFFSET = STATE_V + 16
+STATE_MEMORY = STATE_STACK_OFFSET + STATE_STACK.size
+STATE_FRAME = STATE_MEMORY + 4096
+STATE_RNG_OFFSET = STATE_FRAME + 256
+STATE_SIZE = STATE_RNG_OFFSET + STATE_RNG.size
+
+
+class BreakpointHit(Exception):
+    """
+    Сработала точка останова. Выбрасывается из обработчиков команд,
+    run и run_until перехватывают его и возвращают reason
+    :param reason: STOP_BREAKPOINT или STOP_WATCHPOINT
+    :param completed: выполнена ли команда, на которой сработала точка
+                      (запись в память - да, остановка перед командой - нет)
+    """
+
+    def __init__(self, reason, completed):
+        super().__init__(reason)
+        self.reason = reason
+        self.completed = completed
+
+
+class RegistersView(Mapping):
+    """
+    Представление регистров CHIP8 в виде словаря {PC, INDEX, SP, V}, как
+    они хранились раньше. Значения читаются и записываются прямо в слоты
+    машины
+    """
+    __slots__ = ('game',)
+    SLOTS = {PC: 'pc', INDEX: 'index', SP: 'sp', V: 'v'}
+
+    def __init__(self, game):
+        self.game = game
+
+    def __getitem__(self, name):
+        return getattr(self.game, self.SLOTS[name])
+
+    def __setitem__(self, name, value):
+        if name == V:
+            self.game.v[:] = bytes(value[i] for i in range(16))
+        else:
+            setattr(self.game, self.SLOTS[name], value)
+
+    def __iter__(self):
+        return iter(self.SLOTS)
+
+    def __len__(self):
+        return len(self.SLOTS)
+
+
+class TimersView(RegistersView):
+    """
+    Представление таймеров CHIP8 в виде словаря {DELAY, SOUND}
+    """
+    __slots__ = ()
+    SLOTS = {DELAY: 'delay_timer', SOUND: 'sound_timer'}
+
+
+class KeysView(Mapping):
+    """
+    Представление битовой маски клавиш в виде словаря {номер: нажата ли}
+    """
+    __slots__ = ('game',)
+
+    def __init__(self, game):
+        self.game = game
+
+    def __getitem__(self, key):
+        if not 0 <= key < 16:
+            raise KeyError(key)
+        return bool(self.game.key_mask >> key & 1)
+
+    def __setitem__(self, key, pressed):
+        if not 0 <= key < 16:
+            raise KeyError(key)
+        if pressed:
+            self.game.key_mask |= 1 << key
+        else:
+            self.game.key_mask &= ~(1 << key)
+
+    def __iter__(self):
+        return iter(range(16))
+
+    def __len__(self):
+        return 16
 
 
 class CHIP8:
-    def __init__(self):
+    """
+    Интерпретатор CHIP8.
+    :param display: экран (display.Display или display.NumpyDisplay),
+                    по умолчанию - Display
+    :param seed: зерно генератора случайных чисел для CXNN. Без него все
+                 экземпляры пользуются общим генератором SHARED_RNG
+    """
+    __slots__ = ('opcode', 'draw_flag', 'running', 'is_paused', 'memory',
+                 'stack', 'pc', 'index', 'sp', 'v', 'delay_timer',
+                 'sound_timer', 'key_mask', 'display', 'decode_cache',
+                 'block_compiler', 'breakpoints', 'cycles', 'rng')
+
+    def __init__(self, display=None, seed=None):
         self.opcode = 0
-        self.__delay_sync = 0
         self.draw_flag = False
         self.running = True
         self.is_paused = False
         self.memory = bytearray(4096)
         self.__load_fonts()
-        self.stack = [0] * 17
-        self.registers = {
-            PC: 512,  # 16 bit
-            INDEX: 0,  # 16 bit
-            SP: 0,  # 16 bit
-            V: {key: 0 for key in range(16)}  # 8 bit
-        }
-        self.timers = {
-            DELAY: 0,  # 8 bit
-            SOUND: 0,  # 8 bit
-        }
-        self.screen = self.__init_screen()
-        self.keys = {key: False for key in range(0, 16)}
-
-        self.operation_table = {
-            0x0: self.return_clear,
-            0x1: self.jump_to_address,
-            0x2: self.call_subroutine,
-            0x3: self.skip_if_vx_equals_value,
-            0x4: self.skip_if_vx_not_equals_value,
-            0x5: self.skip_if_vx_equals_vy,
-            0x6: self.put_value_to_vx,
-            0x7: self.sum_value_and_vx,
-            0x8: self.call_logical_operation,
-            0x9: self.skip_if_vx_not_equals_vy,
-            0xa: self.put_value_to_index,
-            0xb: self.jump_to_address_plus_v0,
-            0xc: self.put_rnd_to_vx,
-            0xd: self.draw_sprite,
-            0xe: self.skip_if_key,
-            0xf: self.call_f_operations,
-        }
-        self.logical_operations_table = {
-            0x0: self.put_vy_to_vx,
-            0x1: self.vx_or_vy,
-            0x2: self.vx_and_vy,
-            0x3: self.vx_xor_vy,
-            0x4: self.sum_vx_and_vy,
-            0x5: self.subtract_vx_and_vy,
-            0x6: self.shift_right_vx,
-            0x7: self.subtract_vy_and_vx,
-            0xE: self.shift_left_vx,
-        }
-        self.f_operations_table = {
-            0x7: self.put_delay_to_vx,
-            0xa: self.put_key_to_vx,
-            0x15: self.put_vx_to_delay,
-            0x18: self.put_vx_to_sound,
-            0x1e: self.sum_idx_and_vx,
-            0x29: self.put_vx_sprite_to_idx,
-            0x33: self.store_vx_in_bcd,
-            0x55: self.put_v_reg_to_memory,
-            0x65: self.put_memory_to_v_reg,
-        }
+        self.stack = array('H', bytes(34))  # 17 * 16 bit
+        self.pc = 512  # 16 bit
+        self.index = 0  # 16 bit
+        self.sp = 0  # 16 bit
+        self.v = bytearray(16)  # 16 * 8 bit
+        self.delay_timer = 0  # 8 bit
+        self.sound_timer = 0  # 8 bit
+        self.key_mask = 0  # 16 bit, по биту на клавишу
+        self.display = display if display is not None else Display()
+        # Кэш декодированных команд: для каждого адреса хранится пара
+        # (опкод, обработчик), чтобы не разбирать опкод заново
+        self.decode_cache = {}
+        # Необязательный движок, компилирующий код в блоки (см. compiler.py)
+        self.block_compiler = None
+        # Необязательные точки останова (см. breakpoints.py). Сама машина
+        # проверяет только запись в отслеживаемую память в FX55 и FX33
+        self.breakpoints = None
+        # Сколько команд выполнено с момента создания
+        self.cycles = 0
+        self.rng = SHARED_RNG if seed is None else Random(seed)
+
+    @property
+    def registers(self):
+        return RegistersView(self)
+
+    @property
+    def screen(self):
+        """
+        Экран в старом виде screen[x][y], только для чтения
+        :return:
+        """
+        return self.display.screen
+
+    @property
+    def timers(self):
+        return TimersView(self)
+
+    @property
+    def keys(self):
+        return KeysView(self)
+
+    def get_frame(self, packed=None):
+        """
+        Получить текущий кадр без копирования (см. get_frame у экранов
+        в display.py)
+        :param packed: упакованный (по биту на пиксель) или нет кадр,
+                       по умолчанию - тот, что экран хранит сам
+        :return:
+        """
+        if packed is None:
+            return self.display.get_frame()
+        return self.display.get_frame(packed)
 
     def get_reg_dump(self):
         result = {}
-        v_regs = {i: bin(self.registers["v"][i]) for i in range(16)}
-        result["v"] = v_regs
+        v_regs = {i: bin(self.v[i]) for i in range(16)}
+        result[V] = v_regs
         result["current_opcode"] = hex(self.opcode)
-        for register in self.registers:
-            if register == "v":
-                continue
-            result[register] = str(self.registers[register])
-        result["timers"] = {key: str(val) for key, val in self.timers.items()}
+        result[PC] = str(self.pc)
+        result[INDEX] = str(self.index)
+        result[SP] = str(self.sp)
+        result["timers"] = {DELAY: str(self.delay_timer),
+                            SOUND: str(self.sound_timer)}
         return result
 
+    def save_state(self):
+        """
+        Сохранить всё состояние машины в двоичном виде (формат описан у
+        STATE_HEADER). Кэши декодированных команд и блоков не сохраняются
+        :return: bytes длиной STATE_SIZE
+        """
+        data = bytearray(STATE_SIZE)
+        flags = (STATE_DRAW_FLAG if self.draw_flag else 0) \
+            | (STATE_PAUSED if self.is_paused else 0)
+        STATE_HEADER.pack_into(data, 0, STATE_MAGIC, STATE_VERSION, self.pc,
+                               self.index, self.sp, self.opcode,
+                               self.delay_timer, self.sound_timer,
+                               self.key_mask, flags, self.cycles)
+        view = memoryview(data)
+        view[STATE_V:STATE_STACK_OFFSET] = self.v
+        STATE_STACK.pack_into(data, STATE_STACK_OFFSET, *self.stack)
+        view[STATE_MEMORY:STATE_FRAME] = self.memory
+        view[STATE_FRAME:STATE_RNG_OFFSET] = self.display.tobytes()
+        version, words, gauss_next = self.rng.getstate()
+        STATE_RNG.pack_into(data, STATE_RNG_OFFSET, version, *words,
+                            gauss_next or 0.0, gauss_next is not None)
+        return bytes(data)
+
+    def load_state(self, data):
+        """
+        Восстановить состояние, сохранённое save_state. Машина после этого
+        получает собственный генератор случайных чисел с сохранённым
+        состоянием, даже если до этого пользовалась общим
+        :param data: bytes, bytearray или memoryview
+        :return:
+        """
+        view = memoryview(data)
+        if len(view) < STATE_HEADER.size:
+            raise Exception("Save state is too short!")
+        (magic, version, pc, index, sp, opcode, delay_timer, sound_timer,
+         key_mask, flags, cycles) = STATE_HEADER.unpack_from(view)
+        if magic != STATE_MAGIC:
+            raise Exception("Not a CHIP8 save state!")
+        if version != STATE_VERSION:
+            raise Exception(
+                "Unsupported save state version {}".format(version))
+        if len(view) != STATE_SIZE:
+            raise Exception("Save state has wrong size!")
+        rng_state = STATE_RNG.unpack_from(view, STATE_RNG_OFFSET)
+        rng = Random.__new__(Random) if self.rng is SHARED_RNG else self.rng
+        rng.setstate((rng_state[0], rng_state[1:626],
+                      rng_state[626] if rng_state[627] else None))
+
+        self.pc = pc
+        self.index = index
+        self.sp = sp
+        self.opcode = opcode
+        self.delay_timer = delay_timer
+        self.sound_timer = sound_timer
+        self.key_mask = key_mask
+        self.draw_flag = bool(flags & STATE_DRAW_FLAG)
+        self.is_paused = bool(flags & STATE_PAUSED)
+        self.cycles = cycles
+        self.rng = rng
+        self.v[:] = view[STATE_V:STATE_STACK_OFFSET]
+        self.stack[:] = array('H', STATE_STACK.unpack_from(
+            view, STATE_STACK_OFFSET))
+        self.memory[:] = view[STATE_MEMORY:STATE_FRAME]
+        self.display.frombytes(view[STATE_FRAME:STATE_RNG_OFFSET])
+        self.invalidate_code(0, 4096)
+
+    def clone(self):
+        """
+        Копия машины в памяти (быстрее, чем save_state и load_state).
+        У копии свой экран и свой генератор случайных чисел в том же
+        состоянии, поэтому от одного состояния можно запускать много
+        независимых продолжений. Компилятор блоков не копируется
+        :return: новый экземпляр CHIP8
+        """
+        game = CHIP8.__new__(CHIP8)
+        for name in self.CLONED_SLOTS:
+            setattr(game, name, getattr(self, name))
+        game.memory = bytearray(self.memory)
+        game.stack = array('H', self.stack)
+        game.v = bytearray(self.v)
+        game.display = self.display.copy()
+        # Записи кэша неизменяемы, поэтому их можно разделять. Подменённый
+        # кэш (профилировщик, точки останова) хранит обёртки, привязанные
+        # к этой машине, и не копируется
+        game.decode_cache = self.decode_cache.copy() \
+            if type(self.decode_cache) is dict else {}
+        game.block_compiler = None
+        game.breakpoints = None
+        # Без __init__, чтобы не тратить время на начальное заполнение
+        # генератора из os.urandom: состояние всё равно будет заменено
+        game.rng = Random.__new__(Random)
+        game.rng.setstate(self.rng.getstate())
+        return game
+
+    # Слоты с неизменяемыми значениями, которые clone копирует как есть
+    CLONED_SLOTS = ('opcode', 'draw_flag', 'running', 'is_paused', 'pc',
+                    'index', 'sp', 'delay_timer', 'sound_timer', 'key_mask',
+                    'cycles')
+
     def get_memory_dump(self):
         return [hex(b) for b in self.memory]
 
@@ -115,6 +342,63 @@ class CHIP8:
         y_num = (self.opcode & 0x00F0) >> 4
         return x_num, y_num
 
+    def decode(self, opcode):
+        """
+        Разбирает опкод и находит конечный обработчик команды, минуя
+        промежуточные таблицы (8XY*, FX**, EX**, 00**)
+        :param opcode: 16 битный опкод
+        :return: пара (опкод, обработчик)
+        """
+        operation = (opcode & 0xF000) >> 12
+        handler = self.operation_table[operation]
+        if operation == 0x0:
+            if opcode & 0x0FFF == 0x00E0:
+                handler = CHIP8.clear_screen
+            elif opcode & 0x0FFF == 0x00EE:
+                handler = CHIP8.return_from_subroutine
+        elif operation == 0x8:
+            handler = self.logical_operations_table.get(
+                opcode & 0x000F, CHIP8.unsupported_operation)
+        elif operation == 0xe:
+            if opcode & 0x00FF == 0x9e:
+                handler = CHIP8.skip_if_key_pressed
+            elif opcode & 0x00FF == 0xa1:
+                handler = CHIP8.skip_if_key_not_pressed
+            else:
+                handler = CHIP8.unsupported_operation
+        elif operation == 0xf:
+            handler = self.f_operations_table.get(
+                opcode & 0x00FF, CHIP8.unsupported_operation)
+        return opcode, handler
+
+    def invalidate_code(self, start, end):
+        """
+        Сбрасывает кэш декодированных команд для адресов [start, end).
+        Команда занимает два байта, поэтому сбрасывается и адрес start - 1
+        :param start: первый изменённый адрес
+        :param end: адрес, следующий за последним изменённым
+        :return:
+        """
+        start = max(start - 1, 0)
+        end = min(end, 4096)
+        if start >= end:
+            return
+        if end - start >= len(self.decode_cache):
+            self.decode_cache.clear()
+        else:
+            for address in range(start, end):
+                self.decode_cache.pop(address, None)
+        if self.block_compiler is not None:
+            self.block_compiler.invalidate(start, end)
+
+    def unsupported_operation(self):
+        """
+        Вызывается для опкодов, которые не поддерживаются интерпретатором
+        :return:
+        """
+        raise Exception(
+            "Operation {} is not supported".format(hex(self.opcode)))
+
     def set_pc_to_val(self, value):
         """
         Устанавливает значение Programm Counter в value
@@ -125,18 +409,7 @@ class CHIP8:
             raise Exception("You can't address negative memory!")
         if value > 4096:
             raise Exception("Out of memory!")
-        self.registers[PC] = value & 0xFFFF
-
-    @staticmethod
-    def __init_screen():
-        """
-        Возвращает список списков размером 64*32, заполненный нулями
-        :return:
-        """
-        screen = []
-        for i in range(64):
-            screen.append([0] * 32)
-        return screen
+        self.pc = value & 0xFFFF
 
     def __load_fonts(self):
         """
@@ -152,7 +425,7 @@ class CHIP8:
         Перейти по адресу NNN + V0
         :return:
         """
-        self.set_pc_to_val(self.registers[V][0] + (self.opcode & 0x0FFF))
+        self.set_pc_to_val(self.v[0] + (self.opcode & 0x0FFF))
 
     def sum_value_and_vx(self):
         """
@@ -162,8 +435,8 @@ class CHIP8:
         """
         number = self.opcode & 0x00FF
         reg_num = (self.opcode & 0x0F00) >> 8
-        temp = self.registers[V][reg_num] + number
-        self.registers[V][reg_num] = temp & 0x00FF
+        temp = self.v[reg_num] + number
+        self.v[reg_num] = temp & 0x00FF
 
     def put_vy_to_vx(self):
         """
@@ -172,7 +445,7 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        self.registers[V][x_num] = self.registers[V][y_num]
+        self.v[x_num] = self.v[y_num]
 
     def vx_or_vy(self):
         """
@@ -181,9 +454,9 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        x_value = self.registers[V][x_num]
-        y_value = self.registers[V][y_num]
-        self.registers[V][x_num] = x_value | y_value
+        x_value = self.v[x_num]
+        y_value = self.v[y_num]
+        self.v[x_num] = x_value | y_value
 
     def vx_and_vy(self):
         """
@@ -192,9 +465,9 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        x_value = self.registers[V][x_num]
-        y_value = self.registers[V][y_num]
-        self.registers[V][x_num] = x_value & y_value
+        x_value = self.v[x_num]
+        y_value = self.v[y_num]
+        self.v[x_num] = x_value & y_value
 
     def vx_xor_vy(self):
         """
@@ -203,9 +476,9 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        x_value = self.registers[V][x_num]
-        y_value = self.registers[V][y_num]
-        self.registers[V][x_num] = x_value ^ y_value
+        x_value = self.v[x_num]
+        y_value = self.v[y_num]
+        self.v[x_num] = x_value ^ y_value
 
     def sum_vx_and_vy(self):
         """
@@ -214,15 +487,15 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        x_value = self.registers[V][x_num]
-        y_value = self.registers[V][y_num]
+        x_value = self.v[x_num]
+        y_value = self.v[y_num]
         temp = x_value + y_value
         if temp >= 256:
-            self.registers[V][15] = 1
-            self.registers[V][x_num] = temp & 0x00FF
+            self.v[15] = 1
+            self.v[x_num] = temp & 0x00FF
         else:
-            self.registers[V][15] = 0
-            self.registers[V][x_num] = temp
+            self.v[15] = 0
+            self.v[x_num] = temp
 
     def subtract_vx_and_vy(self):
         """
@@ -231,14 +504,14 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        x_value = self.registers[V][x_num]
-        y_value = self.registers[V][y_num]
+        x_value = self.v[x_num]
+        y_value = self.v[y_num]
         if x_value >= y_value:
-            self.registers[V][15] = 1
-            self.registers[V][x_num] = x_value - y_value
+            self.v[15] = 1
+            self.v[x_num] = x_value - y_value
         else:
-            self.registers[V][15] = 0
-            self.registers[V][x_num] = 256 + x_value - y_value
+            self.v[15] = 0
+            self.v[x_num] = 256 + x_value - y_value
 
     def subtract_vy_and_vx(self):
         """
@@ -247,14 +520,14 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        x_value = self.registers[V][x_num]
-        y_value = self.registers[V][y_num]
+        x_value = self.v[x_num]
+        y_value = self.v[y_num]
         if y_value >= x_value:
-            self.registers[V][15] = 1
-            self.registers[V][x_num] = y_value - x_value
+            self.v[15] = 1
+            self.v[x_num] = y_value - x_value
         else:
-            self.registers[V][15] = 0
-            self.registers[V][x_num] = 256 + y_value - x_value
+            self.v[15] = 0
+            self.v[x_num] = 256 + y_value - x_value
 
     def shift_right_vx(self):
         """
@@ -263,12 +536,12 @@ class CHIP8:
         :return:
         """
         x_num = (self.opcode & 0x0F00) >> 8
-        x_value = self.registers[V][x_num]
+        x_value = self.v[x_num]
         if x_value & 1 == 1:
-            self.registers[V][15] = 1
+            self.v[15] = 1
         else:
-            self.registers[V][15] = 0
-        self.registers[V][x_num] = x_value >> 1
+            self.v[15] = 0
+        self.v[x_num] = x_value >> 1
 
     def shift_left_vx(self):
         """
@@ -277,12 +550,12 @@ class CHIP8:
         :return:
         """
         x_num = (self.opcode & 0x0F00) >> 8
-        x_value = self.registers[V][x_num]
+        x_value = self.v[x_num]
         if (bin(x_value))[2:].zfill(8)[0] == '1':
-            self.registers[V][15] = 1
+            self.v[15] = 1
         else:
-            self.registers[V][15] = 0
-        self.registers[V][x_num] = (x_value << 1) & 0x00FF
+            self.v[15] = 0
+        self.v[x_num] = (x_value << 1) & 0x00FF
 
     def put_v_reg_to_memory(self):
         """
@@ -292,9 +565,13 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        idx = self.registers[INDEX]
-        for i in range(x_num + 1):
-            self.memory[idx + i] = self.registers[V][i]
+        idx = self.index
+        if idx + x_num >= 4096:
+            raise Exception("Out of memory!")
+        self.memory[idx:idx + x_num + 1] = self.v[:x_num + 1]
+        self.invalidate_code(idx, idx + x_num + 1)
+        if self.breakpoints is not None:
+            self.breakpoints.check_write(idx, idx + x_num + 1)
 
     def put_memory_to_v_reg(self):
         """
@@ -304,9 +581,10 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        idx = self.registers[INDEX]
-        for i in range(x_num + 1):
-            self.registers[V][i] = self.memory[idx + i]
+        idx = self.index
+        if idx + x_num >= 4096:
+            raise Exception("Out of memory!")
+        self.v[:x_num + 1] = self.memory[idx:idx + x_num + 1]
 
     def put_key_to_vx(self):
         """
@@ -315,16 +593,14 @@ class CHIP8:
         в VX.
         :return:
         """
-        pressed_key = NOT_A_KEY
-        for key in self.keys:
-            if self.keys[key]:
-                pressed_key = key
-        if pressed_key == NOT_A_KEY:
-            self.set_pc_to_val(self.registers[PC] - 2)
+        if not self.key_mask:
+            self.set_pc_to_val(self.pc - 2)
             return
+        # Если нажато несколько клавиш, берётся клавиша с наибольшим номером
+        pressed_key = self.key_mask.bit_length() - 1
         x_num, _ = self.get_x_and_y()
-        self.registers[V][x_num] = pressed_key
-        self.keys[pressed_key] = False
+        self.v[x_num] = pressed_key
+        self.key_mask &= ~(1 << pressed_key)
 
     def sum_idx_and_vx(self):
         """
@@ -333,8 +609,8 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        idx = self.registers[INDEX]
-        self.registers[INDEX] = (self.registers[V][x_num] + idx) & 0xFFFF
+        idx = self.index
+        self.index = (self.v[x_num] + idx) & 0xFFFF
 
     def jump_to_address(self):
         """
@@ -353,7 +629,7 @@ class CHIP8:
         """
         x_num, _ = self.get_x_and_y()
         value = self.opcode & 0x00FF
-        self.registers[V][x_num] = value & randint(0, 255)
+        self.v[x_num] = value & self.rng.randint(0, 255)
 
     def skip_if_vx_not_equals_value(self):
         """
@@ -363,8 +639,8 @@ class CHIP8:
         """
         x_num, _ = self.get_x_and_y()
         value = (self.opcode & 0x00FF)
-        if self.registers[V][x_num] != value:
-            self.set_pc_to_val(self.registers[PC] + 2)
+        if self.v[x_num] != value:
+            self.set_pc_to_val(self.pc + 2)
 
     def skip_if_vx_equals_value(self):
         """
@@ -374,8 +650,8 @@ class CHIP8:
         """
         x_num, _ = self.get_x_and_y()
         value = (self.opcode & 0x00FF)
-        if self.registers[V][x_num] == value:
-            self.set_pc_to_val(self.registers[PC] + 2)
+        if self.v[x_num] == value:
+            self.set_pc_to_val(self.pc + 2)
 
     def skip_if_vx_equals_vy(self):
         """
@@ -384,10 +660,10 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        x_value = self.registers[V][x_num]
-        y_value = self.registers[V][y_num]
+        x_value = self.v[x_num]
+        y_value = self.v[y_num]
         if x_value == y_value:
-            self.set_pc_to_val(self.registers[PC] + 2)
+            self.set_pc_to_val(self.pc + 2)
 
     def skip_if_vx_not_equals_vy(self):
         """
@@ -396,10 +672,10 @@ class CHIP8:
         :return:
         """
         x_num, y_num = self.get_x_and_y()
-        x_value = self.registers[V][x_num]
-        y_value = self.registers[V][y_num]
+        x_value = self.v[x_num]
+        y_value = self.v[y_num]
         if x_value != y_value:
-            self.set_pc_to_val(self.registers[PC] + 2)
+            self.set_pc_to_val(self.pc + 2)
 
     def put_delay_to_vx(self):
         """
@@ -408,7 +684,7 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        self.registers[V][x_num] = self.timers[DELAY]
+        self.v[x_num] = self.delay_timer
 
     def put_vx_to_delay(self):
         """
@@ -417,7 +693,7 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        self.timers[DELAY] = self.registers[V][x_num]
+        self.delay_timer = self.v[x_num]
 
     def put_vx_to_sound(self):
         """
@@ -426,7 +702,7 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        self.timers[SOUND] = self.registers[V][x_num]
+        self.sound_timer = self.v[x_num]
 
     def call_logical_operation(self):
         """
@@ -436,7 +712,7 @@ class CHIP8:
         """
         operation = self.opcode & 0x000F
         try:
-            self.logical_operations_table[operation]()
+            self.logical_operations_table[operation](self)
         except KeyError as err:
             raise Exception(
                 "Operation {} is not supported".format(hex(self.opcode)))
@@ -471,7 +747,7 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        self.registers[INDEX] = self.registers[V][x_num] * 5
+        self.index = self.v[x_num] * 5
 
     def store_vx_in_bcd(self):
         """
@@ -484,11 +760,14 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        source = self.registers[V][x_num]
-        idx = self.registers[INDEX]
+        source = self.v[x_num]
+        idx = self.index
         self.memory[idx] = source // 100
         self.memory[idx + 1] = ((source // 10) % 10)
         self.memory[idx + 2] = ((source % 100) % 10)
+        self.invalidate_code(idx, idx + 3)
+        if self.breakpoints is not None:
+            self.breakpoints.check_write(idx, idx + 3)
 
     def call_f_operations(self):
         """
@@ -498,7 +777,7 @@ class CHIP8:
         """
         operation = self.opcode & 0x00FF
         try:
-            self.f_operations_table[operation]()
+            self.f_operations_table[operation](self)
         except KeyError:
             raise Exception(
                 "Operation {} is not supported".format(hex(self.opcode)))
@@ -511,8 +790,8 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        if self.keys[self.registers[V][x_num]]:
-            self.set_pc_to_val(self.registers[PC] + 2)
+        if self.key_mask >> self.v[x_num] & 1:
+            self.set_pc_to_val(self.pc + 2)
 
     def skip_if_key_not_pressed(self):
         """
@@ -522,8 +801,8 @@ class CHIP8:
         :return:
         """
         x_num, _ = self.get_x_and_y()
-        if not self.keys[self.registers[V][x_num]]:
-            self.set_pc_to_val(self.registers[PC] + 2)
+        if not self.key_mask >> self.v[x_num] & 1:
+            self.set_pc_to_val(self.pc + 2)
 
     def skip_if_key(self):
         """
@@ -547,10 +826,10 @@ class CHIP8:
         РС присвоить значение NNN
         :return:
         """
-        if self.registers[SP] >= 16:
+        if self.sp >= 16:
             raise Exception("Stack Overflow!")
-        self.registers[SP] += 1
-        self.stack[self.registers[SP]] = self.registers[PC]
+        self.sp += 1
+        self.stack[self.sp] = self.pc
         self.set_pc_to_val(self.opcode & 0x0FFF)
 
     def return_from_subroutine(self):
@@ -561,8 +840,8 @@ class CHIP8:
         затем вычитает 1 из stack pointer
         :return:
         """
-        self.set_pc_to_val(self.stack[self.registers[SP]])
-        self.registers[SP] -= 1
+        self.set_pc_to_val(self.stack[self.sp])
+        self.sp -= 1
 
     def draw_sprite(self):
         """
@@ -572,11 +851,11 @@ class CHIP8:
         координатами VX, VY
         :return:
         """
-        x_coord = self.registers[V][(self.opcode & 0x0F00) >> 8]
-        y_coord = self.registers[V][(self.opcode & 0x00F0) >> 4]
+        x_coord = self.v[(self.opcode & 0x0F00) >> 8]
+        y_coord = self.v[(self.opcode & 0x00F0) >> 4]
         n_bytes = self.opcode & 0x000F
 
-        self.registers[V][15] = 0
+        self.v[15] = 0
 
         self.draw(x_coord, y_coord, n_bytes)
 
@@ -590,23 +869,10 @@ class CHIP8:
         :param height:
         :return:
         """
-        I = self.registers[INDEX]
-        for y_line in range(height):
-            pixel_byte = self.memory[I + y_line]
-            b = bin(pixel_byte)
-            pixel_byte = b[2:].zfill(8)
-            y_coord = (y + y_line) % 32
-            for x_idx in range(8):
-                x_coord = (x + x_idx) % 64
-
-                bit_at_idx = int(pixel_byte[x_idx])
-                prev_bit_at_idx = self.screen[x_coord][y_coord]
-
-                if bit_at_idx == prev_bit_at_idx == 1:
-                    self.registers[V][15] = 1
-
-                self.screen[x_coord][y_coord] ^= bit_at_idx
-
+        I = self.index
+        if I + height > 4096:
+            raise Exception("Out of memory!")
+        self.v[15] = self.display.draw(self.memory[I:I + height], x, y)
         self.draw_flag = True
 
     def clear_screen(self):
@@ -615,9 +881,7 @@ class CHIP8:
         Функция "очищает" экран, устанавливая каждый пиксель в ноль
         :return:
         """
-        for y in range(32):
-            for x in range(64):
-                self.screen[x][y] = 0
+        self.display.clear()
 
     def put_value_to_index(self):
         """
@@ -625,7 +889,7 @@ class CHIP8:
         Загрузить в регистр index (I) значение NNN
         :return:
         """
-        self.registers[INDEX] = self.opcode & 0x0FFF
+        self.index = self.opcode & 0x0FFF
 
     def put_value_to_vx(self):
         """
@@ -634,7 +898,7 @@ class CHIP8:
         :return:
         """
         idx = (self.opcode & 0x0F00) >> 8
-        self.registers[V][idx] = self.opcode & 0x00FF
+        self.v[idx] = self.opcode & 0x00FF
 
     def emulate_cycle(self, opcode=None):
         """
@@ -648,19 +912,133 @@ class CHIP8:
         if self.is_paused:
             return
 
-        pc = self.registers[PC]
+        pc = self.pc
         if not opcode:
-            self.opcode = (self.memory[pc] << 8) | self.memory[pc + 1]
+            try:
+                self.opcode, handler = self.decode_cache[pc]
+            except KeyError:
+                entry = self.decode(
+                    (self.memory[pc] << 8) | self.memory[pc + 1])
+                self.decode_cache[pc] = entry
+                self.opcode, handler = entry
+            # Адрес в кэше всегда меньше 4095, проверка границ не нужна
+            self.pc = pc + 2
         else:
-            self.opcode = opcode
+            self.opcode, handler = self.decode(opcode)
+            self.set_pc_to_val(pc + 2)
+        try:
+            handler(self)
+        except BreakpointHit as hit:
+            if hit.completed:
+                self.cycles += 1
+            raise
+        self.cycles += 1
 
-        operation = (self.opcode & 0xF000) >> 12
-        self.set_pc_to_val(self.registers[PC] + 2)
+    def run(self, n_cycles):
+        """
+        Выполнить подряд n_cycles команд. Пауза проверяется только перед
+        началом, поэтому паузу стоит ставить между вызовами
+        :param n_cycles: число команд
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        if self.is_paused:
+            return STOP_PAUSED, 0
+        memory = self.memory
+        cache = self.decode_cache
+        decode = self.decode
+        # В executed - число полностью выполненных команд, в том числе
+        # если очередная команда выбросила исключение
+        executed = 0
         try:
-            self.operation_table[operation]()
-        except KeyError:
-            raise Exception(
-                "Operation {} is not supported".format(hex(self.opcode)))
+            for executed in range(n_cycles):
+                pc = self.pc
+                try:
+                    self.opcode, handler = cache[pc]
+                except KeyError:
+                    entry = decode((memory[pc] << 8) | memory[pc + 1])
+                    cache[pc] = entry
+                    self.opcode, handler = entry
+                self.pc = pc + 2
+                handler(self)
+            executed = n_cycles
+        except BreakpointHit as hit:
+            executed += hit.completed
+            return hit.reason, executed
+        finally:
+            self.cycles += executed
+        return STOP_CYCLES, executed
+
+    def run_frames(self, n_frames, cycles_per_frame):
+        """
+        Выполнить n_frames кадров по cycles_per_frame команд, уменьшая
+        таймеры в конце каждого кадра
+        :param n_frames: число кадров
+        :param cycles_per_frame: число команд за кадр
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        executed = 0
+        for _ in range(n_frames):
+            reason, cycles = self.run(cycles_per_frame)
+            executed += cycles
+            if reason != STOP_CYCLES:
+                return reason, executed
+            self.tick_timers()
+        return STOP_CYCLES, executed
+
+    def run_until(self, max_cycles, pc=None, draw=False, sound=False,
+                  key_wait=False):
+        """
+        Выполнять команды, пока не выполнится одно из условий, но не больше
+        max_cycles команд. Условия проверяются после каждой команды
+        :param max_cycles: наибольшее число команд
+        :param pc: остановиться, когда PC станет равен этому адресу
+        :param draw: остановиться после команды DXYN
+        :param sound: остановиться, когда FX18 запустит звуковой таймер
+        :param key_wait: остановиться, когда FX0A начнёт ждать клавишу
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        if self.is_paused:
+            return STOP_PAUSED, 0
+        memory = self.memory
+        cache = self.decode_cache
+        decode = self.decode
+        stop_pc = -1 if pc is None else pc
+        reason = STOP_CYCLES
+        executed = 0
+        try:
+            for executed in range(max_cycles):
+                pc = self.pc
+                try:
+                    self.opcode, handler = cache[pc]
+                except KeyError:
+                    entry = decode((memory[pc] << 8) | memory[pc + 1])
+                    cache[pc] = entry
+                    self.opcode, handler = entry
+                self.pc = pc + 2
+                handler(self)
+
+                opcode = self.opcode
+                if self.pc == stop_pc:
+                    reason = STOP_PC
+                    break
+                if draw and opcode & 0xF000 == 0xD000:
+                    reason = STOP_DRAW
+                    break
+                if sound and opcode & 0xF0FF == 0xF018 and self.sound_timer:
+                    reason = STOP_SOUND
+                    break
+                if key_wait and opcode & 0xF0FF == 0xF00A and self.pc == pc:
+                    reason = STOP_KEY_WAIT
+                    break
+            else:
+                executed = max_cycles - 1
+            executed += 1
+        except BreakpointHit as hit:
+            executed += hit.completed
+            return hit.reason, executed
+        finally:
+            self.cycles += executed
+        return reason, executed
 
     def get_opcode_docstring(self, opcode):
         operation = (opcode & 0xF000) >> 12
@@ -679,12 +1057,22 @@ class CHIP8:
         return doc.replace(":return:", "").strip('\n')
 
     def decrement_sound_timer(self):
-        if self.timers[SOUND] > 0:
-            self.timers[SOUND] -= 1
+        if self.sound_timer > 0:
+            self.sound_timer -= 1
 
     def decrement_delay_timer(self):
-        if self.timers[DELAY] > 0:
-            self.timers[DELAY] -= 1
+        if self.delay_timer > 0:
+            self.delay_timer -= 1
+
+    def tick_timers(self):
+        """
+        Уменьшить оба таймера (происходит 60 раз в секунду)
+        :return:
+        """
+        if self.delay_timer > 0:
+            self.delay_timer -= 1
+        if self.sound_timer > 0:
+            self.sound_timer -= 1
 
     def load_rom(self, rom):
         """
@@ -696,3 +1084,53 @@ class CHIP8:
             data = file.read()
         for index, value in enumerate(data):
             self.memory[index + 0x200] = value
+        self.invalidate_code(0, 4096)
+
+    # Таблицы обработчиков общие для всех экземпляров: в них хранятся
+    # функции, а не связанные методы, поэтому вызываются как handler(self)
+    operation_table = {
+        0x0: return_clear,
+        0x1: jump_to_address,
+        0x2: call_subroutine,
+        0x3: skip_if_vx_equals_value,
+        0x4: skip_if_vx_not_equals_value,
+        0x5: skip_if_vx_equals_vy,
+        0x6: put_value_to_vx,
+        0x7: sum_value_and_vx,
+        0x8: call_logical_operation,
+        0x9: skip_if_vx_not_equals_vy,
+        0xa: put_value_to_index,
+        0xb: jump_to_address_plus_v0,
+        0xc: put_rnd_to_vx,
+        0xd: draw_sprite,
+        0xe: skip_if_key,
+        0xf: call_f_operations,
+    }
+    logical_operations_table = {
+        0x0: put_vy_to_vx,
+        0x1: vx_or_vy,
+        0x2: vx_and_vy,
+        0x3: vx_xor_vy,
+        0x4: sum_vx_and_vy,
+        0x5: subtract_vx_and_vy,
+        0x6: shift_right_vx,
+        0x7: subtract_vy_and_vx,
+        0xE: shift_left_vx,
+    }
+    f_operations_table = {
+        0x7: put_delay_to_vx,
+        0xa: put_key_to_vx,
+        0x15: put_vx_to_delay,
+        0x18: put_vx_to_sound,
+        0x1e: sum_idx_and_vx,
+        0x29: put_vx_sprite_to_idx,
+        0x33: store_vx_in_bcd,
+        0x55: put_v_reg_to_memory,
+        0x65: put_memory_to_v_reg,
+    }
+
+
+if __name__ == '__main__':
+    from headless import main
+
+    main()
@@ -5,6 +5,8 @@ import sys
 from PyQt5 import QtWidgets
 
 from gui.GameWindow import GameWindow
+from movie import Movie
+from scheduler import DEFAULT_IPS, DEFAULT_TIMER_HZ
 
 
 def main():
@@ -17,21 +19,47 @@ def main():
     parser.add_argument('rom', type=str, help='way to rom file')
     parser.add_argument('--debug', action="store_true",
                         help="enable debug mode")
-    parser.add_argument('-s', '--speed', type=int, default=12000,
-                        help='try to adjust CPU speed. The bigger the value '
-                             'is, the slower the game speed gets')
-    parser.add_argument('-d', '--delay', type=int, default=10,
-                        help='try to adjust delay timer. The bigger the '
-                             'value is, the slower things move')
+    parser.add_argument('-i', '--ips', type=int, default=DEFAULT_IPS,
+                        help='instructions executed per second')
+    parser.add_argument('-t', '--timer-hz', type=int,
+                        default=DEFAULT_TIMER_HZ,
+                        help='how many times per second the delay and sound '
+                             'timers count down')
+    parser.add_argument('--full-repaint', action="store_true",
+                        help='repaint the whole screen on every change '
+                             'instead of the changed regions only')
+    parser.add_argument('--paint-stats', action="store_true",
+                        help='print paint statistics on exit')
+    parser.add_argument('--process', action="store_true",
+                        help='run the emulator in a separate process so it '
+                             'does not share the GIL with the GUI')
+    parser.add_argument('-s', '--seed', type=int, default=None,
+                        help='seed for the random number generator (CXNN)')
+    parser.add_argument('--record', type=str, default=None,
+                        help='record the game into this movie file')
+    parser.add_argument('--play', type=str, default=None,
+                        help='play back this movie file instead of playing')
 
     args = parser.parse_args()
+    if args.process and args.debug:
+        parser.error("--process cannot be combined with --debug")
+    if args.process and (args.record or args.play):
+        parser.error("--process cannot be combined with --record or --play")
+    if args.record and args.play:
+        parser.error("--record cannot be combined with --play")
+    movie = Movie.load(args.play) if args.play else None
 
     app = QtWidgets.QApplication(sys.argv)
     GameWindow.DEBUG = args.debug
-    window = GameWindow(args.rom, args.speed + 1, args.delay + 1)
+    GameWindow.FULL_REPAINT = args.full_repaint
+    GameWindow.PROCESS = args.process
+    window = GameWindow(args.rom, args.ips, args.timer_hz, args.seed,
+                        args.record, movie)
     window.show()
 
     app.exec_()
+    if args.paint_stats or args.full_repaint:
+        print(window.get_paint_stats(), file=sys.stderr)
 
 
 if __name__ == '__main__':
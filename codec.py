@@ -0,0 +1,201 @@
+import re
+import struct
+
+from display import HEIGHT
+from framebuffer import FRAME_SIZE
+
+__all__ = ['FrameEncoder', 'FrameDecoder', 'is_keyframe', 'pack_runs',
+           'unpack_runs']
+
+ROW_SIZE = FRAME_SIZE // HEIGHT
+BLANK_FRAME = bytes(FRAME_SIZE)
+BLANK_ROW = bytes(ROW_SIZE)
+# Заголовок пакета: флаги и маска строк (бит y - строка y, как в
+# Display.take_dirty). За ним идут закодированные pack_runs строки из
+# маски: для опорного кадра - сами строки, для остальных - их XOR с
+# предыдущим кадром
+PACKET_HEADER = struct.Struct('<BI')
+FLAG_KEYFRAME = 1
+# Повтор из трёх и более одинаковых байт
+RUN = re.compile(rb'(.)\1{2,}', re.DOTALL)
+MAX_LITERALS = 128
+MIN_RUN = 3
+MAX_RUN = 255 - MAX_LITERALS + MIN_RUN
+
+
+def pack_runs(data):
+    """
+    Сжать байты кодированием длин серий (как PackBits): управляющий байт
+    c < 128 - дальше c + 1 байт как есть, иначе - следующий байт
+    повторяется c - 125 раз. Серии ищет регулярное выражение, поэтому
+    цикл на Python идёт по сериям, а не по байтам
+    :param data: bytes
+    :return: bytes
+    """
+    out = bytearray()
+    start = 0
+    for match in RUN.finditer(data):
+        put_literals(out, data, start, match.start())
+        count = match.end() - match.start()
+        value = match.group(1)
+        while count >= MIN_RUN:
+            length = min(count, MAX_RUN)
+            out.append(length - MIN_RUN + MAX_LITERALS)
+            out += value
+            count -= length
+        start = match.end() - count
+    put_literals(out, data, start, len(data))
+    return bytes(out)
+
+
+def put_literals(out, data, start, end):
+    for chunk in range(start, end, MAX_LITERALS):
+        literals = data[chunk:min(chunk + MAX_LITERALS, end)]
+        out.append(len(literals) - 1)
+        out += literals
+
+
+def unpack_runs(data, offset=0):
+    """
+    Развернуть байты, сжатые pack_runs
+    :param data: bytes
+    :param offset: откуда начинать
+    :return: bytes
+    """
+    out = bytearray()
+    size = len(data)
+    while offset < size:
+        control = data[offset]
+        if control < MAX_LITERALS:
+            end = offset + control + 2
+            if end > size:
+                raise ValueError("truncated literal run")
+            out += data[offset + 1:end]
+            offset = end
+        else:
+            if offset + 1 >= size:
+                raise ValueError("truncated repeated run")
+            out += data[offset + 1:offset + 2] * \
+                (control - MAX_LITERALS + MIN_RUN)
+            offset += 2
+    return bytes(out)
+
+
+def is_keyframe(packet):
+    """
+    Можно ли декодировать пакет без предыдущих кадров
+    :param packet: пакет FrameEncoder.encode
+    :return:
+    """
+    return bool(packet[0] & FLAG_KEYFRAME)
+
+
+class FrameEncoder:
+    """
+    Кодирование последовательности кадров (в формате Display.tobytes).
+    Кадр сравнивается с предыдущим одним XOR над 256 байтами как над
+    целым числом, и в пакет попадают только изменившиеся строки, сжатые
+    pack_runs. Каждый keyframe_interval-й кадр - опорный: он не зависит
+    от предыдущих, с него можно начинать декодирование (например, при
+    перемотке записи или после пропуска кадров)
+    :param keyframe_interval: через сколько кадров повторяется опорный
+    """
+
+    def __init__(self, keyframe_interval=60):
+        if keyframe_interval < 1:
+            raise ValueError("keyframe_interval must be positive")
+        self.keyframe_interval = keyframe_interval
+        self.previous = None
+        self.frames = 0
+        self.keyframes = 0
+        self.raw_bytes = 0
+        self.encoded_bytes = 0
+
+    def encode(self, frame, keyframe=False):
+        """
+        Закодировать следующий кадр
+        :param frame: 256 байт в формате Display.tobytes
+        :param keyframe: сделать кадр опорным вне очереди
+        :return: пакет (bytes)
+        """
+        if len(frame) != FRAME_SIZE:
+            raise ValueError("frame must be {} bytes".format(FRAME_SIZE))
+        frame = bytes(frame)
+        if self.previous is None or \
+                self.frames % self.keyframe_interval == 0:
+            keyframe = True
+        if keyframe:
+            delta = frame
+            self.keyframes += 1
+        else:
+            delta = (int.from_bytes(frame, 'big') ^
+                     int.from_bytes(self.previous, 'big')).to_bytes(
+                FRAME_SIZE, 'big')
+        mask = 0
+        rows = []
+        if delta != BLANK_FRAME:
+            for y in range(HEIGHT):
+                row = delta[y * ROW_SIZE:(y + 1) * ROW_SIZE]
+                if row != BLANK_ROW:
+                    mask |= 1 << y
+                    rows.append(row)
+        packet = PACKET_HEADER.pack(FLAG_KEYFRAME if keyframe else 0,
+                                    mask) + pack_runs(b"".join(rows))
+        self.previous = frame
+        self.frames += 1
+        self.raw_bytes += FRAME_SIZE
+        self.encoded_bytes += len(packet)
+        return packet
+
+    def get_stats(self):
+        """
+        Сколько кадров закодировано и во сколько раз они сжаты
+        :return: словарь
+        """
+        return {
+            "frames": self.frames,
+            "keyframes": self.keyframes,
+            "raw_bytes": self.raw_bytes,
+            "encoded_bytes": self.encoded_bytes,
+            "ratio": self.raw_bytes / self.encoded_bytes
+            if self.encoded_bytes else None,
+        }
+
+
+class FrameDecoder:
+    """
+    Декодирование пакетов FrameEncoder. Первым должен идти опорный кадр
+    """
+
+    def __init__(self):
+        self.frame = None
+
+    def decode(self, packet):
+        """
+        Декодировать следующий пакет
+        :param packet: bytes
+        :return: кадр (256 байт в формате Display.tobytes)
+        """
+        flags, mask = PACKET_HEADER.unpack_from(packet)
+        keyframe = flags & FLAG_KEYFRAME
+        if not keyframe and self.frame is None:
+            raise Exception("Delta frame without a preceding keyframe")
+        data = unpack_runs(packet, PACKET_HEADER.size)
+        if len(data) != bin(mask).count("1") * ROW_SIZE:
+            raise ValueError("packet rows do not match its row mask")
+        rows = []
+        position = 0
+        for y in range(HEIGHT):
+            if mask >> y & 1:
+                rows.append(data[position:position + ROW_SIZE])
+                position += ROW_SIZE
+            else:
+                rows.append(BLANK_ROW)
+        delta = b"".join(rows)
+        if keyframe:
+            self.frame = delta
+        elif mask:
+            self.frame = (int.from_bytes(delta, 'big') ^
+                          int.from_bytes(self.frame, 'big')).to_bytes(
+                FRAME_SIZE, 'big')
+        return self.frame
@@ -0,0 +1,336 @@
+import hashlib
+import marshal
+import os
+import sys
+
+from chip8 import STOP_CYCLES, STOP_PAUSED
+
+__all__ = ['BlockCompiler']
+
+# Версия формата кэша на диске: меняется вместе с генерируемым кодом
+CACHE_VERSION = 3
+
+# Максимальное число команд в одном блоке. Ограничение нужно, чтобы между
+# блоками можно было вовремя обновлять таймеры и проверять паузу
+MAX_BLOCK_LENGTH = 64
+
+# Команды, которые компилируются в тело блока. FX33, FX55 и FX65
+# обращаются к памяти по I: ими блок заканчивается, и они выполняются
+# обработчиками интерпретатора, с теми же проверками и ошибками
+BODY_OPERATIONS = {0x0, 0x6, 0x7, 0x8, 0xa, 0xc, 0xf}
+LOGICAL_OPERATIONS = {0x0, 0x1, 0x2, 0x3, 0x4, 0x5, 0x6, 0x7, 0xe}
+F_OPERATIONS = {0x07, 0x15, 0x18, 0x1e, 0x29}
+
+
+class BlockCompiler:
+    """
+    Альтернативный движок исполнения: находит линейные участки кода
+    (до переходов, пропусков, вызовов подпрограмм, DXYN и FX0A) и
+    компилирует каждый из них в одну функцию на Python, работающую с
+    локальными переменными.
+
+    Скомпилированные блоки сохраняются на диск в файл, имя которого зависит
+    от хеша ROM, поэтому при следующем запуске компиляция не нужна.
+    Если программа пишет в память, занятую блоком, блок выбрасывается.
+    """
+
+    def __init__(self, game, cache_dir=None):
+        self.game = game
+        self.cache_dir = cache_dir
+        self.blocks = [None] * 4096
+        # Для каждого адреса - список начал блоков, которые его покрывают
+        self.owners = [[] for _ in range(4096)]
+        self.code_cache = {}
+        self.rom_hash = hashlib.sha1(bytes(game.memory[0x200:])).hexdigest()
+        game.block_compiler = self
+        if self.cache_dir is not None:
+            self.load()
+
+    @property
+    def cache_path(self):
+        name = "{}.{}.v{}.blocks".format(self.rom_hash,
+                                         sys.implementation.cache_tag,
+                                         CACHE_VERSION)
+        return os.path.join(self.cache_dir, name)
+
+    def load(self):
+        """
+        Загрузить скомпилированные блоки с диска
+        :return:
+        """
+        try:
+            with open(self.cache_path, "rb") as file:
+                self.code_cache = marshal.load(file)
+        except (OSError, EOFError, ValueError, TypeError):
+            self.code_cache = {}
+
+    def save(self):
+        """
+        Сохранить скомпилированные блоки на диск
+        :return:
+        """
+        if self.cache_dir is None:
+            return
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = self.cache_path + ".tmp"
+        with open(tmp_path, "wb") as file:
+            marshal.dump(self.code_cache, file)
+        os.replace(tmp_path, self.cache_path)
+
+    def invalidate(self, start, end):
+        """
+        Выбросить блоки, которые покрывают адреса [start, end)
+        :param start:
+        :param end:
+        :return:
+        """
+        for address in range(max(start, 0), min(end, 4096)):
+            owners = self.owners[address]
+            while owners:
+                self.drop_block(owners[-1])
+
+    def drop_block(self, start):
+        _, _, end = self.blocks[start]
+        self.blocks[start] = None
+        for address in range(start, end):
+            self.owners[address].remove(start)
+
+    def run(self, n_cycles):
+        """
+        Выполнить n_cycles команд, по возможности целыми блоками
+        (см. CHIP8.run)
+        :param n_cycles:
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        game = self.game
+        blocks = self.blocks
+        executed = 0
+        while executed < n_cycles:
+            if game.is_paused:
+                return STOP_PAUSED, executed
+            pc = game.pc
+            block = blocks[pc] if pc < 4095 else None
+            if block is None and pc < 4095:
+                block = self.compile_block(pc)
+            if block is None or executed + block[1] > n_cycles:
+                game.emulate_cycle()
+                executed += 1
+                continue
+            try:
+                block[0](game)
+            except Exception:
+                # Ошибку может выбросить только последняя команда блока
+                # (обработчик интерпретатора), остальные выполнены, а
+                # регистры и PC уже записаны в машину
+                executed += block[1] - 1
+                game.cycles += block[1] - 1
+                raise
+            executed += block[1]
+            game.cycles += block[1]
+        return STOP_CYCLES, executed
+
+    def compile_block(self, start):
+        """
+        Найти линейный участок кода, начинающийся с адреса start, и
+        скомпилировать его
+        :param start:
+        :return: тройка (функция, число команд, конец блока)
+        """
+        memory = self.game.memory
+        end = start
+        count = 0
+        while end + 1 < 4096 and count < MAX_BLOCK_LENGTH:
+            opcode = (memory[end] << 8) | memory[end + 1]
+            end += 2
+            count += 1
+            if not is_body_operation(opcode):
+                break
+        block_bytes = bytes(memory[start:end])
+
+        cached = self.code_cache.get(start)
+        if cached is not None and cached[0] == block_bytes:
+            code = cached[1]
+        else:
+            source = generate_source(start, block_bytes, self.game.decode)
+            code = compile(source,
+                           "<chip8 block {}>".format(hex(start)), "exec")
+            self.code_cache[start] = (block_bytes, code)
+
+        namespace = {}
+        exec(code, namespace)
+        block = (namespace["block"], count, end)
+        self.blocks[start] = block
+        for address in range(start, end):
+            self.owners[address].append(start)
+        return block
+
+
+def is_body_operation(opcode):
+    """
+    Можно ли скомпилировать команду в тело блока (то есть команда не
+    меняет PC, не рисует и не ждёт нажатия клавиши)
+    :param opcode:
+    :return:
+    """
+    operation = (opcode & 0xF000) >> 12
+    if operation not in BODY_OPERATIONS:
+        return False
+    if operation == 0x0:
+        return opcode & 0x0FFF != 0x00EE
+    if operation == 0x8:
+        return opcode & 0x000F in LOGICAL_OPERATIONS
+    if operation == 0xf:
+        return opcode & 0x00FF in F_OPERATIONS
+    return True
+
+
+def generate_source(start, block_bytes, decode):
+    """
+    Сгенерировать исходный код функции block(game) для участка кода
+    :param start: адрес начала блока
+    :param block_bytes: байты команд блока
+    :param decode: функция, возвращающая обработчик команды по опкоду
+    :return:
+    """
+    body = []
+    used = set()
+    written = set()
+    uses_index = False
+    terminator = None
+    address = start
+    last_opcode = 0
+    for offset in range(0, len(block_bytes), 2):
+        opcode = (block_bytes[offset] << 8) | block_bytes[offset + 1]
+        address = start + offset
+        last_opcode = opcode
+        if not is_body_operation(opcode):
+            terminator = opcode
+            break
+        lines, regs_read, regs_written, index_used = emit(opcode)
+        body.extend(lines)
+        used |= regs_read | regs_written
+        written |= regs_written
+        uses_index = uses_index or index_used
+
+    next_address = address + 2
+    tail = []
+    if terminator is not None:
+        operation = (terminator & 0xF000) >> 12
+        x_num = (terminator & 0x0F00) >> 8
+        y_num = (terminator & 0x00F0) >> 4
+        value = terminator & 0x00FF
+        if operation == 0x1:
+            tail.append("game.pc = {}".format(terminator & 0x0FFF))
+        elif operation in (0x3, 0x4, 0x5, 0x9) and address + 4 <= 4096:
+            condition = {
+                0x3: "v{0} == {2}",
+                0x4: "v{0} != {2}",
+                0x5: "v{0} == v{1}",
+                0x9: "v{0} != v{1}",
+            }[operation].format(x_num, y_num, value)
+            used.add(x_num)
+            if operation in (0x5, 0x9):
+                used.add(y_num)
+            tail.append("game.pc = {} if {} else {}".format(
+                address + 4, condition, next_address))
+        else:
+            _, handler = decode(terminator)
+            tail.append("game.pc = {}".format(next_address))
+            tail.append("game.{}()".format(handler.__name__))
+    else:
+        tail.append("game.pc = {}".format(next_address))
+
+    lines = ["def block(game):",
+             "    v = game.v"]
+    lines.extend("    v{0} = v[{0}]".format(reg) for reg in sorted(used))
+    if uses_index:
+        lines.append("    i = game.index")
+    lines.extend("    " + line for line in body)
+    lines.extend("    v[{0}] = v{0}".format(reg) for reg in sorted(written))
+    if uses_index:
+        lines.append("    game.index = i")
+    lines.append("    game.opcode = {}".format(last_opcode))
+    lines.extend("    " + line for line in tail)
+    return "\n".join(lines) + "\n"
+
+
+def emit(opcode):
+    """
+    Сгенерировать строки кода для одной команды тела блока
+    :param opcode:
+    :return: (строки, читаемые регистры, изменяемые регистры,
+              используется ли I)
+    """
+    operation = (opcode & 0xF000) >> 12
+    x = (opcode & 0x0F00) >> 8
+    y = (opcode & 0x00F0) >> 4
+    value = opcode & 0x00FF
+    address = opcode & 0x0FFF
+
+    if operation == 0x0:
+        if address == 0x00E0:
+            return ["game.clear_screen()"], set(), set(), False
+        return [], set(), set(), False
+    if operation == 0x6:
+        return ["v{} = {}".format(x, value)], set(), {x}, False
+    if operation == 0x7:
+        return ["v{0} = (v{0} + {1}) & 0xFF".format(x, value)], \
+               {x}, {x}, False
+    if operation == 0xa:
+        return ["i = {}".format(address)], set(), set(), True
+    if operation == 0xc:
+        return ["v{} = {} & game.rng.randint(0, 255)".format(x, value)], \
+               set(), {x}, False
+    if operation == 0x8:
+        return emit_logical(opcode & 0x000F, x, y)
+    return emit_f(value, x)
+
+
+def emit_logical(operation, x, y):
+    vx = "v{}".format(x)
+    vy = "v{}".format(y)
+    if operation == 0x0:
+        lines = ["{} = {}".format(vx, vy)]
+    elif operation == 0x1:
+        lines = ["{0} = {0} | {1}".format(vx, vy)]
+    elif operation == 0x2:
+        lines = ["{0} = {0} & {1}".format(vx, vy)]
+    elif operation == 0x3:
+        lines = ["{0} = {0} ^ {1}".format(vx, vy)]
+    elif operation == 0x4:
+        lines = ["t = {} + {}".format(vx, vy),
+                 "v15 = t >> 8",
+                 "{} = t & 0xFF".format(vx)]
+    elif operation == 0x5:
+        lines = ["t = {} - {}".format(vx, vy),
+                 "v15 = 0 if t < 0 else 1",
+                 "{} = t & 0xFF".format(vx)]
+    elif operation == 0x7:
+        lines = ["t = {} - {}".format(vy, vx),
+                 "v15 = 0 if t < 0 else 1",
+                 "{} = t & 0xFF".format(vx)]
+    elif operation == 0x6:
+        lines = ["t = {}".format(vx),
+                 "v15 = t & 1",
+                 "{} = t >> 1".format(vx)]
+    else:
+        lines = ["t = {}".format(vx),
+                 "v15 = t >> 7",
+                 "{} = (t << 1) & 0xFF".format(vx)]
+    written = {x}
+    if operation in (0x4, 0x5, 0x6, 0x7, 0xe):
+        written.add(15)
+    return lines, {x, y}, written, False
+
+
+def emit_f(operation, x):
+    vx = "v{}".format(x)
+    if operation == 0x07:
+        return ["{} = game.delay_timer".format(vx)], set(), {x}, False
+    if operation == 0x15:
+        return ["game.delay_timer = {}".format(vx)], {x}, set(), False
+    if operation == 0x18:
+        return ["game.sound_timer = {}".format(vx)], {x}, set(), False
+    if operation == 0x1e:
+        return ["i = ({} + i) & 0xFFFF".format(vx)], {x}, set(), True
+    return ["i = {} * 5".format(vx)], {x}, set(), True
@@ -0,0 +1,65 @@
+__all__ = ['disassemble', 'disassemble_memory']
+
+# Мнемоники в записи Cowgod's Chip-8 Technical Reference
+LOGICAL = {0x0: "LD", 0x1: "OR", 0x2: "AND", 0x3: "XOR", 0x4: "ADD",
+           0x5: "SUB", 0x6: "SHR", 0x7: "SUBN", 0xE: "SHL"}
+F_OPERATIONS = {0x07: "LD V{x:X}, DT", 0x0a: "LD V{x:X}, K",
+                0x15: "LD DT, V{x:X}", 0x18: "LD ST, V{x:X}",
+                0x1e: "ADD I, V{x:X}", 0x29: "LD F, V{x:X}",
+                0x33: "LD B, V{x:X}", 0x55: "LD [I], V{x:X}",
+                0x65: "LD V{x:X}, [I]"}
+TEMPLATES = {0x1: "JP 0x{nnn:03X}", 0x2: "CALL 0x{nnn:03X}",
+             0x3: "SE V{x:X}, 0x{nn:02X}", 0x4: "SNE V{x:X}, 0x{nn:02X}",
+             0x6: "LD V{x:X}, 0x{nn:02X}", 0x7: "ADD V{x:X}, 0x{nn:02X}",
+             0xa: "LD I, 0x{nnn:03X}", 0xb: "JP V0, 0x{nnn:03X}",
+             0xc: "RND V{x:X}, 0x{nn:02X}", 0xd: "DRW V{x:X}, V{y:X}, {n}"}
+
+
+def disassemble(opcode):
+    """
+    Текст команды, например "DRW V1, V2, 5". Команды, которых
+    интерпретатор не знает, записываются как данные: "DW 0x5121"
+    :param opcode: 16 битный опкод
+    :return: строка
+    """
+    operation = opcode >> 12
+    fields = {"x": (opcode >> 8) & 0xf, "y": (opcode >> 4) & 0xf,
+              "n": opcode & 0xf, "nn": opcode & 0xff, "nnn": opcode & 0xfff}
+    text = None
+    if operation in TEMPLATES:
+        text = TEMPLATES[operation]
+    elif operation == 0x0:
+        if opcode == 0x00E0:
+            text = "CLS"
+        elif opcode == 0x00EE:
+            text = "RET"
+        else:
+            text = "SYS 0x{nnn:03X}"
+    elif operation in (0x5, 0x9) and fields["n"] == 0:
+        text = ("SE" if operation == 0x5 else "SNE") + " V{x:X}, V{y:X}"
+    elif operation == 0x8 and fields["n"] in LOGICAL:
+        text = LOGICAL[fields["n"]] + " V{x:X}, V{y:X}"
+    elif operation == 0xe and fields["nn"] in (0x9e, 0xa1):
+        text = ("SKP" if fields["nn"] == 0x9e else "SKNP") + " V{x:X}"
+    elif operation == 0xf:
+        text = F_OPERATIONS.get(fields["nn"])
+    if text is None:
+        return "DW 0x{:04X}".format(opcode)
+    return text.format(**fields)
+
+
+def disassemble_memory(memory, start=0x200, end=None):
+    """
+    Разобрать память подряд по два байта
+    :param memory: память машины
+    :param start: первый адрес
+    :param end: адрес после последнего, по умолчанию - конец памяти
+    :return: список троек (адрес, опкод, текст)
+    """
+    if end is None:
+        end = len(memory)
+    listing = []
+    for address in range(start, end - 1, 2):
+        opcode = (memory[address] << 8) | memory[address + 1]
+        listing.append((address, opcode, disassemble(opcode)))
+    return listing
@@ -0,0 +1,289 @@
+import sys
+from array import array
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+__all__ = ['Display', 'NumpyDisplay', 'ScreenView']
+
+WIDTH = 64
+HEIGHT = 32
+MASK64 = (1 << WIDTH) - 1
+BLANK_ROWS = array('Q', bytes(HEIGHT * 8))
+
+
+class Display:
+    """
+    Экран CHIP8: 32 строки, каждая строка - 64-битное число.
+    Старший бит строки соответствует левому пикселю (x = 0).
+    presented - кадр, каким он был при последнем вызове take_dirty
+    """
+    __slots__ = ('rows', 'presented')
+
+    def __init__(self):
+        self.rows = array('Q', BLANK_ROWS)
+        self.presented = array('Q', BLANK_ROWS)
+
+    @property
+    def screen(self):
+        return ScreenView(self.rows)
+
+    def draw(self, sprite, x, y):
+        """
+        Нарисовать спрайт, сложив каждую его строку по модулю 2 (XOR) с
+        соответствующей строкой экрана. Спрайт, вышедший за край экрана,
+        переносится на противоположную сторону
+        :param sprite: байты спрайта, по байту на строку
+        :param x: координата левого края
+        :param y: координата верхнего края
+        :return: 1, если какой-нибудь пиксель был стёрт, иначе 0
+        """
+        rows = self.rows
+        x %= WIDTH
+        shift = WIDTH - 8 - x
+        collision = 0
+        for line, byte in enumerate(sprite):
+            if shift >= 0:
+                bits = byte << shift
+            else:
+                bits = (byte >> -shift) | ((byte << (WIDTH + shift)) & MASK64)
+            y_coord = (y + line) % HEIGHT
+            row = rows[y_coord]
+            collision |= row & bits
+            rows[y_coord] = row ^ bits
+        return 1 if collision else 0
+
+    def clear(self):
+        """
+        Очистить экран
+        :return:
+        """
+        self.rows[:] = BLANK_ROWS
+
+    def take_dirty(self):
+        """
+        Узнать, что изменилось с прошлого вызова (с прошлого показа кадра).
+        Кадр сравнивается с запомненным, поэтому рисование не тратит время
+        на учёт изменений, а спрайт, стёртый и нарисованный заново между
+        показами, изменением не считается
+        :return: пара масок (строки, столбцы): бит y первой маски - строка
+                 y, вторая маска устроена как строка экрана
+        """
+        rows = self.rows
+        presented = self.presented
+        if rows == presented:
+            return 0, 0
+        dirty_rows = 0
+        dirty_columns = 0
+        for y in range(HEIGHT):
+            changed = rows[y] ^ presented[y]
+            if changed:
+                dirty_rows |= 1 << y
+                dirty_columns |= changed
+        presented[:] = rows
+        return dirty_rows, dirty_columns
+
+    def get_frame(self, packed=True):
+        """
+        Получить кадр без копирования.
+        В упакованном виде - memoryview из 32 строк по 64 бита (только для
+        чтения). Неупакованный кадр (массив uint8 размером 32x64) для этого
+        экрана приходится распаковывать, для этого нужен NumPy
+        :param packed:
+        :return:
+        """
+        if packed:
+            return memoryview(self.rows).toreadonly()
+        if numpy is None:
+            raise ImportError("NumPy is required for unpacked frames")
+        unpacked = numpy.unpackbits(
+            numpy.frombuffer(self.tobytes(), numpy.uint8))
+        return unpacked.reshape(HEIGHT, WIDTH)
+
+    def tobytes(self):
+        """
+        Кадр в виде 256 байт: по 8 байт на строку, старший бит первого
+        байта - левый пиксель
+        :return:
+        """
+        rows = array('Q', self.rows)
+        if sys.byteorder == 'little':
+            rows.byteswap()
+        return rows.tobytes()
+
+    def frombytes(self, data):
+        """
+        Загрузить кадр из 256 байт в формате tobytes
+        :param data:
+        :return:
+        """
+        rows = array('Q')
+        rows.frombytes(data)
+        if len(rows) != HEIGHT:
+            raise ValueError("frame must be {} bytes".format(HEIGHT * 8))
+        if sys.byteorder == 'little':
+            rows.byteswap()
+        self.rows[:] = rows
+
+    def copy(self):
+        """
+        Независимая копия экрана
+        :return:
+        """
+        display = Display.__new__(Display)
+        display.rows = array('Q', self.rows)
+        display.presented = array('Q', self.presented)
+        return display
+
+
+class NumpyDisplay:
+    """
+    Экран CHIP8 на основе NumPy: массив uint8 размером 32x64, по байту на
+    пиксель. Кадр можно отдавать в другие программы без преобразований
+    """
+    __slots__ = ('frame', 'frame_view', 'presented')
+
+    def __init__(self):
+        if numpy is None:
+            raise ImportError("NumPy is required for NumpyDisplay")
+        self.frame = numpy.zeros((HEIGHT, WIDTH), numpy.uint8)
+        self.frame_view = self.frame.view()
+        self.frame_view.flags.writeable = False
+        self.presented = numpy.zeros((HEIGHT, WIDTH), numpy.uint8)
+
+    @property
+    def screen(self):
+        return self.frame_view.T
+
+    def draw(self, sprite, x, y):
+        """
+        Нарисовать спрайт (см. Display.draw)
+        :param sprite: байты спрайта, по байту на строку
+        :param x: координата левого края
+        :param y: координата верхнего края
+        :return: 1, если какой-нибудь пиксель был стёрт, иначе 0
+        """
+        height = len(sprite)
+        bits = numpy.unpackbits(numpy.frombuffer(sprite, numpy.uint8))
+        bits = bits.reshape(height, 8)
+        y_coords = ((y + SPRITE_ROWS[:height]) % HEIGHT)[:, None]
+        x_coords = (x + SPRITE_COLUMNS) % WIDTH
+        region = self.frame[y_coords, x_coords]
+        self.frame[y_coords, x_coords] = region ^ bits
+        return 1 if (region & bits).any() else 0
+
+    def clear(self):
+        """
+        Очистить экран
+        :return:
+        """
+        self.frame.fill(0)
+
+    def take_dirty(self):
+        """
+        Узнать, что изменилось с прошлого вызова (см. Display.take_dirty)
+        :return: пара масок (строки, столбцы)
+        """
+        changed = self.frame != self.presented
+        if not changed.any():
+            return 0, 0
+        self.presented[:] = self.frame
+        dirty_rows = 0
+        for y in numpy.flatnonzero(changed.any(axis=1)):
+            dirty_rows |= 1 << int(y)
+        dirty_columns = int.from_bytes(
+            numpy.packbits(changed.any(axis=0)).tobytes(), 'big')
+        return dirty_rows, dirty_columns
+
+    def get_frame(self, packed=False):
+        """
+        Получить кадр: массив uint8 размером 32x64 только для чтения,
+        без копирования. Упакованный кадр (32x8, по биту на пиксель)
+        создаётся заново при каждом вызове
+        :param packed:
+        :return:
+        """
+        if packed:
+            return numpy.packbits(self.frame, axis=1)
+        return self.frame_view
+
+    def tobytes(self):
+        """
+        Кадр в виде 256 байт (см. Display.tobytes)
+        :return:
+        """
+        return numpy.packbits(self.frame, axis=1).tobytes()
+
+    def frombytes(self, data):
+        """
+        Загрузить кадр из 256 байт в формате tobytes
+        :param data:
+        :return:
+        """
+        if len(data) != HEIGHT * 8:
+            raise ValueError("frame must be {} bytes".format(HEIGHT * 8))
+        packed = numpy.frombuffer(data, numpy.uint8).reshape(HEIGHT, 8)
+        self.frame[:] = numpy.unpackbits(packed, axis=1)
+
+    def copy(self):
+        """
+        Независимая копия экрана
+        :return:
+        """
+        display = NumpyDisplay()
+        display.frame[:] = self.frame
+        display.presented[:] = self.presented
+        return display
+
+
+if numpy is not None:
+    SPRITE_ROWS = numpy.arange(16)
+    SPRITE_COLUMNS = numpy.arange(8)
+
+
+class ScreenView:
+    """
+    Доступ к экрану только для чтения в старом виде: screen[x][y]
+    """
+    __slots__ = ('rows',)
+
+    def __init__(self, rows):
+        self.rows = rows
+
+    def __getitem__(self, x):
+        if not 0 <= x < WIDTH:
+            raise IndexError("screen index out of range")
+        return ColumnView(self.rows, WIDTH - 1 - x)
+
+    def __len__(self):
+        return WIDTH
+
+    def __iter__(self):
+        for x in range(WIDTH):
+            yield self[x]
+
+
+class ColumnView:
+    """
+    Столбец экрана: column[y] - значение пикселя (0 или 1)
+    """
+    __slots__ = ('rows', 'shift')
+
+    def __init__(self, rows, shift):
+        self.rows = rows
+        self.shift = shift
+
+    def __getitem__(self, y):
+        if not 0 <= y < HEIGHT:
+            raise IndexError("screen index out of range")
+        return self.rows[y] >> self.shift & 1
+
+    def __len__(self):
+        return HEIGHT
+
+    def __iter__(self):
+        shift = self.shift
+        for row in self.rows:
+            yield row >> shift & 1
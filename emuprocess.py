@@ -0,0 +1,275 @@
+import multiprocessing
+import struct
+import threading
+from multiprocessing import shared_memory
+
+from checkpoints import CheckpointStore
+from chip8 import CHIP8, STOP_PAUSED
+from framebuffer import FrameBuffer
+from scheduler import Scheduler, DEFAULT_IPS, DEFAULT_TIMER_HZ
+
+__all__ = ['EmulatorProcess', 'run_emulator', 'read_status']
+
+# Состояние машины в общей памяти: счётчик записи (нечётный - идёт
+# запись), номер команды, текущая команда, pc, index, sp, таймеры,
+# флаги и регистры V. За ним в той же памяти лежит FrameBuffer
+STATUS = struct.Struct('<QQHHHBBBB16s')
+STATUS_RUNNING = 1
+STATUS_PAUSED = 2
+# Сколько раз читатель пробует прочитать состояние, пока его пишут
+STATUS_RETRIES = 100
+
+
+def write_status(view, game):
+    """
+    Записать регистры и таймеры машины в общую память
+    :param view: memoryview размером не меньше STATUS.size
+    :param game: экземпляр CHIP8
+    :return:
+    """
+    sequence = STATUS.unpack_from(view)[0]
+    flags = (STATUS_RUNNING if game.running else 0) | \
+            (STATUS_PAUSED if game.is_paused else 0)
+    values = (game.cycles, game.opcode, game.pc, game.index, game.sp,
+              game.delay_timer, game.sound_timer, flags, bytes(game.v))
+    STATUS.pack_into(view, 0, sequence + 1, *values)
+    STATUS.pack_into(view, 0, sequence + 2, *values)
+
+
+def read_status(view):
+    """
+    Прочитать состояние, записанное write_status. Если оно меняется во
+    время чтения, чтение повторяется
+    :param view: memoryview общей памяти
+    :return: словарь или None, если прочитать не удалось
+    """
+    for _ in range(STATUS_RETRIES):
+        fields = STATUS.unpack_from(view)
+        if fields[0] & 1 or STATUS.unpack_from(view)[0] != fields[0]:
+            continue
+        (_, cycles, opcode, pc, index, sp, delay_timer, sound_timer,
+         flags, v) = fields
+        return {
+            "cycles": cycles,
+            "opcode": opcode,
+            "pc": pc,
+            "index": index,
+            "sp": sp,
+            "delay_timer": delay_timer,
+            "sound_timer": sound_timer,
+            "running": bool(flags & STATUS_RUNNING),
+            "paused": bool(flags & STATUS_PAUSED),
+            "v": v,
+        }
+    return None
+
+
+def run_emulator(rom, memory_name, connection, ips=DEFAULT_IPS,
+                 timer_hz=DEFAULT_TIMER_HZ, seed=None, slots=3,
+                 rewind_speed=2):
+    """
+    Выполнять игру в реальном времени, публикуя кадры и состояние в общую
+    память и принимая команды из connection. Команды - кортежи:
+    ("key", номер, нажата), ("pause", стоит ли), ("rewind", перематывать
+    ли), ("save",) - ответ ("state", bytes), ("load", bytes), ("quit",).
+    При ошибке в connection отправляется ("error", текст)
+    :param rom: путь к ROM файлу
+    :param memory_name: имя общей памяти (EmulatorProcess)
+    :param connection: конец multiprocessing.Pipe
+    :param ips: команд в секунду
+    :param timer_hz: частота таймеров
+    :param seed: зерно генератора случайных чисел
+    :param slots: число ячеек FrameBuffer
+    :param rewind_speed: во сколько раз перемотка быстрее игры
+    :return:
+    """
+    memory = shared_memory.SharedMemory(memory_name)
+    status = memory.buf[:STATUS.size]
+    frames = FrameBuffer(slots, memory.buf[STATUS.size:])
+    try:
+        game = CHIP8(seed=seed)
+        game.load_rom(rom)
+        checkpoints = CheckpointStore(game)
+        display = game.display
+
+        def publish():
+            if display.take_dirty()[0]:
+                frames.publish(display.tobytes(), game.cycles)
+            write_status(status, game)
+
+        def tick():
+            checkpoints.tick_timers()
+            publish()
+
+        # Пока планировщик ждёт, команды будят процесс сразу
+        scheduler = Scheduler(game, ips, timer_hz, tick=tick,
+                              sleep=connection.poll)
+        rewinding = False
+        publish()
+        while game.running:
+            while connection.poll():
+                command = connection.recv()
+                name = command[0]
+                if name == "key":
+                    checkpoints.set_key(command[1], command[2])
+                elif name == "pause":
+                    game.is_paused = command[1]
+                elif name == "rewind":
+                    rewinding = command[1]
+                elif name == "save":
+                    connection.send(("state", game.save_state()))
+                elif name == "load":
+                    paused = game.is_paused
+                    game.load_state(command[1])
+                    game.is_paused = paused
+                    checkpoints.reset()
+                    scheduler.reset_clock()
+                elif name == "quit":
+                    game.running = False
+                else:
+                    raise Exception("Unknown command: {}".format(name))
+            if rewinding:
+                checkpoints.step_back(
+                    int(scheduler.cycles_per_tick * rewind_speed))
+                publish()
+                connection.poll(1 / timer_hz)
+                scheduler.reset_clock()
+                continue
+            reason, _ = scheduler.run_slice()
+            if reason == STOP_PAUSED:
+                publish()
+            checkpoints.update()
+            scheduler.wait()
+        write_status(status, game)
+    except Exception as err:
+        connection.send(("error", "{}: {}".format(type(err).__name__, err)))
+    finally:
+        frames.buffer.release()
+        status.release()
+        memory.close()
+        connection.close()
+
+
+class EmulatorProcess:
+    """
+    Игра, выполняемая в отдельном процессе (run_emulator), чтобы
+    интерпретатор и GUI не делили одну глобальную блокировку Python.
+    Кадры читаются из общей памяти через frames (FrameBuffer), регистры и
+    таймеры - через get_status, без сериализации; клавиши, пауза и
+    перемотка передаются командами через канал
+    :param rom: путь к ROM файлу
+    :param ips: команд в секунду
+    :param timer_hz: частота таймеров
+    :param seed: зерно генератора случайных чисел
+    :param slots: число ячеек FrameBuffer
+    :param in_thread: выполнять тот же цикл в потоке этого процесса (для
+                      сравнения скорости)
+    """
+
+    def __init__(self, rom, ips=DEFAULT_IPS, timer_hz=DEFAULT_TIMER_HZ,
+                 seed=None, slots=3, in_thread=False):
+        self.memory = shared_memory.SharedMemory(
+            create=True, size=STATUS.size + FrameBuffer.get_size(slots))
+        self.connection, child_connection = multiprocessing.Pipe()
+        self.in_thread = in_thread
+        runner = threading.Thread if in_thread else multiprocessing.Process
+        self.process = runner(
+            target=run_emulator, daemon=True,
+            args=(rom, self.memory.name, child_connection, ips, timer_hz,
+                  seed, slots))
+        self.process.start()
+        if not in_thread:
+            child_connection.close()
+        self.frames = FrameBuffer(slots, self.memory.buf[STATUS.size:])
+        self.error = None
+
+    def send(self, *command):
+        if self.error is not None or not self.process.is_alive():
+            return
+        self.connection.send(command)
+
+    def set_key(self, key, pressed):
+        self.send("key", key, pressed)
+
+    def set_paused(self, paused):
+        self.send("pause", paused)
+
+    def set_rewinding(self, rewinding):
+        self.send("rewind", rewinding)
+
+    def load_state(self, state):
+        self.send("load", state)
+
+    def save_state(self, timeout=5):
+        """
+        Получить состояние игры (CHIP8.save_state) из процесса
+        :param timeout: сколько секунд ждать ответа
+        :return: bytes
+        """
+        self.send("save")
+        while self.connection.poll(timeout):
+            reply = self.receive()
+            if reply is not None and reply[0] == "state":
+                return reply[1]
+        raise Exception(self.error or "Emulator process did not answer")
+
+    def receive(self):
+        """
+        Прочитать одно сообщение процесса. Ошибка запоминается в error
+        :return: сообщение или None, если канал закрыт
+        """
+        try:
+            reply = self.connection.recv()
+        except EOFError:
+            return None
+        if reply[0] == "error":
+            self.error = reply[1]
+        return reply
+
+    def poll(self):
+        """
+        Прочитать накопившиеся сообщения процесса
+        :return: текст ошибки процесса или None
+        """
+        while self.error is None and self.connection.poll():
+            if self.receive() is None:
+                break
+        return self.error
+
+    def get_status(self):
+        """
+        Регистры, таймеры и номер команды машины (см. read_status)
+        :return: словарь
+        """
+        return read_status(self.memory.buf)
+
+    def stop(self, timeout=1):
+        """
+        Остановить процесс и освободить общую память
+        :param timeout: сколько секунд ждать завершения процесса
+        :return:
+        """
+        if self.process.is_alive():
+            try:
+                self.connection.send(("quit",))
+            except (BrokenPipeError, OSError):
+                pass
+            self.process.join(timeout)
+            if self.process.is_alive() and not self.in_thread:
+                self.process.terminate()
+                self.process.join()
+        self.poll()
+        self.connection.close()
+        # Копия, чтобы счётчики кадров можно было прочитать и после
+        # освобождения общей памяти
+        view = self.frames.buffer
+        self.frames.buffer = bytes(view)
+        view.release()
+        self.memory.close()
+        self.memory.unlink()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
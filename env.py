@@ -0,0 +1,200 @@
+import numbers
+import time
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from chip8 import CHIP8
+from headless import CYCLES_PER_FRAME
+from vector import VectorCHIP8
+
+__all__ = ['Environment', 'BatchEnvironment', 'get_key_mask']
+
+
+def get_key_mask(action_keys):
+    """
+    Перевести действие в битовую маску клавиш
+    :param action_keys: маска (int) или набор номеров нажатых клавиш 0-f
+    :return: 16-битная маска
+    """
+    if isinstance(action_keys, numbers.Integral):
+        if not 0 <= action_keys <= 0xFFFF:
+            raise ValueError("key mask must fit in 16 bits")
+        return int(action_keys)
+    mask = 0
+    for key in action_keys:
+        if not 0 <= key < 16:
+            raise ValueError("no such key: {}".format(key))
+        mask |= 1 << key
+    return mask
+
+
+def rows_to_observation(rows, packed):
+    """
+    Превратить строки экрана (uint64, старший бит - левый пиксель) в
+    наблюдение: ... x 32 x 8 бит или ... x 32 x 64 байт
+    """
+    frames = rows.astype('>u8').view(numpy.uint8).reshape(
+        rows.shape[:-1] + (32, 8))
+    if packed:
+        return frames
+    return numpy.unpackbits(frames, axis=-1)
+
+
+class Environment:
+    """
+    Окружение в стиле Gym вокруг CHIP8: reset загружает игру, step
+    выполняет несколько кадров с одними и теми же нажатыми клавишами и
+    возвращает наблюдение - кадр в виде массива NumPy.
+    :param cycles_per_frame: число команд за кадр (60 Гц)
+    :param max_pool: брать поэлементный максимум двух последних кадров,
+                     чтобы не терять мерцающие спрайты
+    :param packed: наблюдение по биту на пиксель (32 x 8) вместо байта на
+                   пиксель (32 x 64)
+    :param max_frames: после стольких кадров эпизод считается законченным
+                       (None - без ограничения)
+    """
+
+    def __init__(self, cycles_per_frame=CYCLES_PER_FRAME, max_pool=True,
+                 packed=False, max_frames=None):
+        if numpy is None:
+            raise ImportError("NumPy is required for Environment")
+        self.cycles_per_frame = cycles_per_frame
+        self.max_pool = max_pool
+        self.packed = packed
+        self.max_frames = max_frames
+        self.game = None
+        self.frames = 0
+        self.done = True
+        self.steps = 0
+        self.step_seconds = 0.0
+
+    @property
+    def steps_per_second(self):
+        """
+        Сколько вызовов step выполняется в секунду (считается только время
+        внутри step)
+        :return:
+        """
+        if not self.step_seconds:
+            return None
+        return self.steps / self.step_seconds
+
+    def get_rows(self):
+        return numpy.frombuffer(self.game.display.rows, numpy.uint64)
+
+    def reset(self, rom, seed=None):
+        """
+        Начать новый эпизод
+        :param rom: путь к ROM файлу
+        :param seed: зерно генератора случайных чисел для CXNN
+        :return: первое наблюдение
+        """
+        self.game = CHIP8(seed=seed)
+        self.game.load_rom(rom)
+        self.frames = 0
+        self.done = False
+        return rows_to_observation(self.get_rows(), self.packed)
+
+    def step(self, action_keys, frameskip=1):
+        """
+        Нажать клавиши action_keys (остальные отпускаются) и выполнить
+        frameskip кадров. Клавиши задаются один раз на весь шаг
+        :param action_keys: маска клавиш или набор номеров клавиш
+        :param frameskip: число кадров за шаг
+        :return: (наблюдение, закончен ли эпизод, словарь с подробностями)
+        """
+        if self.done:
+            raise Exception("Episode is over, call reset()")
+        if frameskip < 1:
+            raise ValueError("frameskip must be at least 1")
+        start = time.perf_counter()
+        game = self.game
+        game.key_mask = get_key_mask(action_keys)
+        info = {}
+        previous = None
+        try:
+            if frameskip > 1:
+                game.run_frames(frameskip - 1, self.cycles_per_frame)
+            if self.max_pool:
+                previous = self.get_rows().copy()
+            game.run_frames(1, self.cycles_per_frame)
+            self.frames += frameskip
+        except Exception as err:
+            self.done = True
+            info["error"] = str(err)
+        if self.max_frames is not None and self.frames >= self.max_frames:
+            self.done = True
+        rows = self.get_rows()
+        if previous is not None:
+            rows = rows | previous
+        observation = rows_to_observation(rows, self.packed)
+
+        self.steps += 1
+        self.step_seconds += time.perf_counter() - start
+        info.update(frames=self.frames, cycles=game.cycles,
+                    sound=game.sound_timer > 0,
+                    steps_per_second=self.steps_per_second)
+        return observation, self.done, info
+
+
+class BatchEnvironment(Environment):
+    """
+    Окружение для многих игр сразу на основе vector.VectorCHIP8: действия,
+    наблюдения и флаги окончания - массивы по машинам. Машина, на которой
+    произошла ошибка, считается закончившей эпизод
+    """
+
+    def get_rows(self):
+        return self.game.rows
+
+    def reset(self, rom, seeds):
+        """
+        Начать новые эпизоды на len(seeds) машинах
+        :param rom: путь к ROM файлу
+        :param seeds: зёрна генераторов случайных чисел, по одному на машину
+        :return: наблюдения размером len(seeds) x 32 x ...
+        """
+        self.game = VectorCHIP8(len(seeds), seeds)
+        self.game.load_rom(rom)
+        self.frames = 0
+        self.done = False
+        return rows_to_observation(self.get_rows(), self.packed)
+
+    def step(self, action_keys, frameskip=1):
+        """
+        Задать каждой машине свою маску клавиш и выполнить frameskip кадров
+        :param action_keys: массив масок клавиш, по одной на машину
+        :param frameskip: число кадров за шаг
+        :return: (наблюдения, массив флагов окончания, словарь)
+        """
+        if self.done:
+            raise Exception("Episode is over, call reset()")
+        if frameskip < 1:
+            raise ValueError("frameskip must be at least 1")
+        start = time.perf_counter()
+        machines = self.game
+        machines.key_mask[:] = action_keys
+        if frameskip > 1:
+            machines.run_frames(frameskip - 1, self.cycles_per_frame)
+        previous = machines.rows.copy() if self.max_pool else None
+        machines.run_frames(1, self.cycles_per_frame)
+        self.frames += frameskip
+
+        done = machines.faulted.copy()
+        if self.max_frames is not None and self.frames >= self.max_frames:
+            done[:] = True
+        self.done = bool(done.all())
+        rows = machines.rows
+        if previous is not None:
+            rows = rows | previous
+        observation = rows_to_observation(rows, self.packed)
+
+        self.steps += 1
+        self.step_seconds += time.perf_counter() - start
+        info = {"frames": self.frames, "cycles": machines.cycles.copy(),
+                "errors": dict(machines.errors),
+                "steps_per_second": self.steps_per_second}
+        return observation, done, info
@@ -0,0 +1,117 @@
+import struct
+
+from display import WIDTH, HEIGHT
+
+__all__ = ['FrameBuffer', 'FRAME_SIZE']
+
+# Кадр в формате Display.tobytes
+FRAME_SIZE = WIDTH * HEIGHT // 8
+# Заголовок буфера: номер последнего опубликованного кадра
+HEADER = struct.Struct('<Q')
+# Заголовок ячейки: счётчик записи (нечётный - ячейка заполняется), номер
+# кадра и номер команды, после которой снят кадр
+SLOT_HEADER = struct.Struct('<QQQ')
+SLOT_SIZE = SLOT_HEADER.size + FRAME_SIZE
+
+
+class FrameBuffer:
+    """
+    Передача готовых кадров от потока, выполняющего команды (писатель),
+    потоку, который их показывает (читатель). Кадры пишутся по кругу в
+    несколько ячеек, так что писатель никогда не ждёт читателя, а
+    читатель берёт самый новый кадр. Каждая ячейка защищена счётчиком
+    записи: если читатель застал ячейку во время записи, кадр считается
+    рваным и не показывается.
+    Всё состояние хранится в одном буфере (bytearray или, например,
+    общая память между процессами), поэтому писатель и читатель могут
+    быть разными экземплярами над одним буфером. Писатель должен быть один
+    :param slots: число ячеек (2 - двойная буферизация, 3 - тройная)
+    :param buffer: буфер размером get_size(slots); по умолчанию создаётся
+    """
+
+    def __init__(self, slots=3, buffer=None):
+        if slots < 2:
+            raise ValueError("at least two slots are needed")
+        self.slots = slots
+        if buffer is None:
+            buffer = bytearray(self.get_size(slots))
+        elif len(buffer) < self.get_size(slots):
+            raise ValueError("buffer is too small for {} slots".format(slots))
+        self.buffer = buffer
+        # Счётчики читателя
+        self.last_taken = 0
+        self.presented = 0
+        self.dropped = 0
+        self.torn = 0
+
+    @staticmethod
+    def get_size(slots):
+        """
+        Сколько байт нужно буферу на slots ячеек
+        :return:
+        """
+        return HEADER.size + slots * SLOT_SIZE
+
+    @property
+    def published(self):
+        return HEADER.unpack_from(self.buffer)[0]
+
+    def get_slot_offset(self, number):
+        return HEADER.size + number % self.slots * SLOT_SIZE
+
+    def publish(self, frame, cycle=0):
+        """
+        Записать готовый кадр (вызывается писателем)
+        :param frame: кадр в формате Display.tobytes
+        :param cycle: номер команды, после которой снят кадр
+        :return: номер кадра
+        """
+        if len(frame) != FRAME_SIZE:
+            raise ValueError("frame must be {} bytes".format(FRAME_SIZE))
+        buffer = self.buffer
+        number = self.published + 1
+        offset = self.get_slot_offset(number)
+        sequence = SLOT_HEADER.unpack_from(buffer, offset)[0]
+        SLOT_HEADER.pack_into(buffer, offset, sequence + 1, number, cycle)
+        start = offset + SLOT_HEADER.size
+        buffer[start:start + FRAME_SIZE] = frame
+        SLOT_HEADER.pack_into(buffer, offset, sequence + 2, number, cycle)
+        HEADER.pack_into(buffer, 0, number)
+        return number
+
+    def take(self):
+        """
+        Взять самый новый кадр, если он ещё не был взят (вызывается
+        читателем). Пропущенные кадры считаются в dropped, рваные - в torn
+        :return: тройка (кадр, номер команды, номер кадра) или None
+        """
+        buffer = self.buffer
+        newest = HEADER.unpack_from(buffer)[0]
+        if newest == self.last_taken:
+            return None
+        offset = self.get_slot_offset(newest)
+        # Если писатель успел обойти круг, в ячейке окажется кадр ещё
+        # новее, поэтому номер кадра берётся из ячейки
+        sequence, number, cycle = SLOT_HEADER.unpack_from(buffer, offset)
+        start = offset + SLOT_HEADER.size
+        frame = bytes(buffer[start:start + FRAME_SIZE])
+        if sequence & 1 or \
+                SLOT_HEADER.unpack_from(buffer, offset)[0] != sequence:
+            self.torn += 1
+            return None
+        self.dropped += number - self.last_taken - 1
+        self.last_taken = number
+        self.presented += 1
+        return frame, cycle, number
+
+    def get_stats(self):
+        """
+        Сколько кадров опубликовано, показано, пропущено и порвано
+        :return: словарь
+        """
+        return {
+            "published": self.published,
+            "presented": self.presented,
+            "dropped": self.dropped,
+            "torn": self.torn,
+        }
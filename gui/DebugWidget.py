@@ -1,22 +1,66 @@
 from PyQt5 import QtWidgets
 from PyQt5.QtCore import Qt, pyqtSignal
-from PyQt5.QtGui import QFont
+from PyQt5.QtGui import QFont, QIntValidator
 from PyQt5.QtWidgets import QPushButton, QGridLayout, QLabel, \
     QLineEdit, QVBoxLayout
 
 from config import PC, TIMERS, V, SP, INDEX, SOUND, DELAY
 
+# Поля машины, которые показывают line edit'ы с этими именами
+REGISTER_FIELDS = {PC: "pc", INDEX: "index", SP: "sp", SOUND: "sound_timer",
+                   DELAY: "delay_timer"}
+# Подсветка регистров, изменившихся с прошлого обновления
+CHANGED_STYLE = "QLineEdit { background-color: #fff3a0; }"
+
 
 class DebugWidget(QtWidgets.QWidget):
     sig_execute = pyqtSignal()
+    sig_step_back = pyqtSignal()
+    sig_seek = pyqtSignal(int)
+    sig_run = pyqtSignal(bool)
 
-    def __init__(self, game, parent=None):
+    def __init__(self, game, checkpoints=None, breakpoints=None,
+                 parent=None):
         super().__init__(parent)
         super().setFont(QFont('Serif', 10, QFont.Light))
         self.game = game
+        self.checkpoints = checkpoints
+        self.breakpoints = breakpoints
         self.execute_button = QPushButton()
         self.execute_button.setText("EXECUTE")
         self.execute_button.released.connect(self.sig_execute.emit)
+        self.back_button = QPushButton()
+        self.back_button.setText("BACK")
+        self.back_button.released.connect(self.sig_step_back.emit)
+        self.back_button.setEnabled(checkpoints is not None)
+        self.run_button = QPushButton()
+        self.run_button.setText("RUN")
+        self.run_button.setCheckable(True)
+        self.run_button.toggled.connect(self.sig_run.emit)
+
+        self.seek_line_edit = QLineEdit()
+        self.seek_line_edit.setValidator(QIntValidator(0, 2 ** 31 - 1))
+        self.seek_line_edit.setPlaceholderText("cycle")
+        self.seek_line_edit.returnPressed.connect(self.emit_seek)
+        self.seek_line_edit.setEnabled(checkpoints is not None)
+        self.history_label = QLabel()
+
+        self.break_line_edit = QLineEdit()
+        self.break_line_edit.setPlaceholderText(
+            "0x248 if V3 == 7 / DXYN / write 0x300-0x30F")
+        self.break_line_edit.returnPressed.connect(self.add_breakpoint)
+        self.remove_break_button = QPushButton()
+        self.remove_break_button.setText("REMOVE")
+        self.remove_break_button.released.connect(self.remove_breakpoint)
+        self.clear_breaks_button = QPushButton()
+        self.clear_breaks_button.setText("CLEAR")
+        self.clear_breaks_button.released.connect(self.clear_breakpoints)
+        self.breakpoints_label = QLabel()
+        for widget in (self.break_line_edit, self.remove_break_button,
+                       self.clear_breaks_button):
+            widget.setEnabled(breakpoints is not None)
+        # Сколько срабатываний точек уже показано
+        self.shown_hits = 0
 
         reg_dump = self.game.get_reg_dump()
 
@@ -58,32 +102,156 @@ class DebugWidget(QtWidgets.QWidget):
         layout.setSpacing(5)
         layout.addLayout(_cur_code_layout)
         layout.addLayout(_reg_layout)
+        _history_layout = QGridLayout()
+        _history_layout.setSpacing(5)
+        _history_layout.addWidget(self.back_button, 0, 0)
+        _history_layout.addWidget(self.make_label("Go to cycle: "), 0, 1)
+        _history_layout.addWidget(self.seek_line_edit, 0, 2)
+
         layout.addWidget(self.execute_button)
+        layout.addWidget(self.run_button)
+        layout.addLayout(_history_layout)
+        layout.addWidget(self.history_label)
+        _break_layout = QGridLayout()
+        _break_layout.setSpacing(5)
+        _break_layout.addWidget(self.make_label("Break: "), 0, 0)
+        _break_layout.addWidget(self.break_line_edit, 0, 1)
+        _break_layout.addWidget(self.remove_break_button, 0, 2)
+        _break_layout.addWidget(self.clear_breaks_button, 0, 3)
+        layout.addLayout(_break_layout)
+        layout.addWidget(self.breakpoints_label)
         self.setLayout(layout)
+        # Все показываемые поля, функции, которые делают из значения
+        # текст (как get_reg_dump), последние показанные значения и какие
+        # поля сейчас подсвечены
+        self.fields = [(self.current_opcode, hex)] + \
+            [(line_edit, str) for line_edit in self.other_line_edits] + \
+            [(line_edit, bin) for line_edit in self.v_line_edits]
+        self.values = self.get_values()
+        self.highlighted = [False] * len(self.fields)
+        self.update_history()
+        self.update_breakpoints()
 
-    def update_registers(self):
-        reg_dump = self.game.get_reg_dump()
-        self.current_opcode.setText(reg_dump["current_opcode"])
-        self.current_opcode.setToolTip(
-            self.game.get_opcode_docstring(self.game.opcode))
+    def emit_seek(self):
+        text = self.seek_line_edit.text()
+        if text:
+            self.sig_seek.emit(int(text))
+
+    def add_breakpoint(self):
+        """
+        Добавить точку останова из поля ввода (формат - у
+        Breakpoints.add_text)
+        :return:
+        """
+        self.edit_breakpoints(self.breakpoints.add_text)
 
-        for i in range(0, 15 + 1):
-            self.v_line_edits[i].setText(reg_dump[V][i])
+    def remove_breakpoint(self):
+        self.edit_breakpoints(self.breakpoints.remove_text)
 
+    def clear_breakpoints(self):
+        self.breakpoints.clear()
+        self.update_breakpoints()
+
+    def edit_breakpoints(self, action):
+        text = self.break_line_edit.text()
+        if not text.strip():
+            return
+        try:
+            action(text)
+        except ValueError as error:
+            self.update_breakpoints(str(error))
+            return
+        self.break_line_edit.clear()
+        self.update_breakpoints()
+
+    def update_breakpoints(self, error=None):
+        """
+        Показать список точек останова и последнее срабатывание
+        :param error: сообщение об ошибке ввода
+        :return:
+        """
+        if self.breakpoints is None:
+            return
+        lines = self.breakpoints.describe()
+        hit = self.breakpoints.last_hit
+        if hit is not None:
+            lines.append("Stopped at 0x{:03X}: {}".format(
+                hit["pc"], hit["breakpoint"]))
+        if error is not None:
+            lines.append(error)
+        self.breakpoints_label.setText("\n".join(lines))
+        self.shown_hits = self.breakpoints.hits
+
+    def update_history(self):
+        """
+        Показать номер команды и состояние хранилища снимков
+        :return:
+        """
+        text = "Cycle: {}".format(self.game.cycles)
+        if self.checkpoints is not None:
+            stats = self.checkpoints.get_stats()
+            text += "\nHistory from cycle {}: {} checkpoints, {:.0f} KB" \
+                .format(stats["oldest_cycle"], stats["checkpoints"],
+                        stats["stored_bytes"] / 1024)
+            if stats["last_seek_ms"] is not None:
+                text += "\nLast seek: {:.2f} ms".format(stats["last_seek_ms"])
+        self.history_label.setText(text)
+
+    def set_running(self, running):
+        """
+        Показать, что машина выполняется в фоне: пока она работает, шаги,
+        перемотка и переход к команде недоступны
+        :param running:
+        :return:
+        """
+        self.run_button.blockSignals(True)
+        self.run_button.setChecked(running)
+        self.run_button.blockSignals(False)
+        self.run_button.setText("STOP" if running else "RUN")
+        self.execute_button.setEnabled(not running)
+        has_history = self.checkpoints is not None
+        self.back_button.setEnabled(has_history and not running)
+        self.seek_line_edit.setEnabled(has_history and not running)
+
+    def get_values(self):
+        """
+        Значения полей в порядке self.fields
+        :return: список чисел
+        """
+        game = self.game
+        values = [game.opcode]
         for line_edit in self.other_line_edits:
             name = line_edit.accessibleName()
-            if name == PC:
-                line_edit.setText(reg_dump[PC])
-            elif name == SP:
-                line_edit.setText(reg_dump[SP])
-            elif name == INDEX:
-                line_edit.setText(reg_dump[INDEX])
-            elif name == SOUND:
-                line_edit.setText(reg_dump[TIMERS][SOUND])
-            elif name == DELAY:
-                line_edit.setText(reg_dump[TIMERS][DELAY])
-            else:
+            if name not in REGISTER_FIELDS:
                 raise Exception("Unknown name. Should'n happen normally")
+            values.append(getattr(game, REGISTER_FIELDS[name]))
+        values.extend(game.v)
+        return values
+
+    def update_registers(self):
+        """
+        Показать регистры машины. Текст меняется только у полей, значение
+        которых изменилось с прошлого вызова, и они подсвечиваются; так
+        обновление дёшево и при частых вызовах во время выполнения
+        :return:
+        """
+        values = self.get_values()
+        for i, value in enumerate(values):
+            changed = value != self.values[i]
+            line_edit, to_text = self.fields[i]
+            if changed:
+                line_edit.setText(to_text(value))
+            if changed != self.highlighted[i]:
+                line_edit.setStyleSheet(CHANGED_STYLE if changed else "")
+                self.highlighted[i] = changed
+        if values[0] != self.values[0]:
+            self.current_opcode.setToolTip(
+                self.game.get_opcode_docstring(self.game.opcode))
+        self.values = values
+        self.update_history()
+        if self.breakpoints is not None \
+                and self.breakpoints.hits != self.shown_hits:
+            self.update_breakpoints()
 
     def get_other_regs(self, reg_dump):
         return [self.make_labeled_line_edit("Program  counter: ", reg_dump[PC], PC),
@@ -1,29 +1,82 @@
 import os
+import random
+import sys
 import threading
+import time
+from contextlib import nullcontext
 
 from PyQt5 import QtWidgets
-from PyQt5.QtCore import Qt, QUrl, QTimer, pyqtSlot
-from PyQt5.QtGui import QPainter
+from PyQt5.QtCore import Qt, QPoint, QRect, QSize, QTimer, QUrl, \
+    pyqtSignal, pyqtSlot
+from PyQt5.QtGui import QImage, QPainter, qRgb
 from PyQt5.QtMultimedia import QMediaContent, QMediaPlayer
 from PyQt5.QtWidgets import QMainWindow, QGridLayout
 
-from chip8 import CHIP8
+from breakpoints import Breakpoints
+from checkpoints import CheckpointStore
+from chip8 import CHIP8, STOP_PAUSED, STOP_BREAKPOINT, STOP_WATCHPOINT
+from emuprocess import EmulatorProcess
 # noinspection PyUnresolvedReferences
-from config import PIXEL_SIZE_DEBUG, PIXEL_SIZE, PIXEL_SIZE_DEBUG, KEYBOARD, WIDTH, HEIGHT
+from config import PIXEL_SIZE_DEBUG, PIXEL_SIZE, PIXEL_SIZE_DEBUG, WIDTH, \
+    HEIGHT, DEBUG_WINDOW_WIDTH
+from framebuffer import FrameBuffer
 from gui.DebugWidget import DebugWidget
+from gui.keyboard import KEYBOARD
+from gui.screen import get_changes, get_dirty_rects
+from movie import MoviePlayer, MovieRecorder
+from scheduler import Scheduler, DEFAULT_IPS, DEFAULT_TIMER_HZ
+
+# Цвета погашенного и зажжённого пикселя
+SCREEN_COLORS = [qRgb(0, 0, 0), qRgb(255, 255, 255)]
 
 
 class GameWindow(QMainWindow):
+    # Поток, выполняющий команды, остановился на точке останова
+    sig_breakpoint = pyqtSignal()
+
     DEBUG = False
+    # Во сколько раз перемотка назад быстрее игры
+    REWIND_SPEED = 2
+    # Перерисовывать весь экран, а не только изменившиеся области
+    # (для сравнения скорости)
+    FULL_REPAINT = False
+    # Выполнять игру в отдельном процессе (см. emuprocess), а не в потоке
+    PROCESS = False
+    # Сколько раз в секунду показывать кадр, если частоту обновления
+    # монитора узнать не удалось
+    PRESENT_HZ = 60
+    # На сколько секунд перематывают запись стрелки влево и вправо
+    MOVIE_SEEK_SECONDS = 5
+    # Сколько раз в секунду обновлять регистры в режиме отладки, пока
+    # игра выполняется в фоне (RUN)
+    DEBUG_REFRESH_HZ = 30
 
-    def __init__(self, rom, speed, delay, parent=None):
+    def __init__(self, rom, ips=DEFAULT_IPS, timer_hz=DEFAULT_TIMER_HZ,
+                 seed=None, record=None, movie=None, parent=None):
+        """
+        :param seed: зерно генератора случайных чисел
+        :param record: файл, в который записать игру (movie.Movie)
+        :param movie: movie.Movie, которую проиграть вместо игры
+        """
         super().__init__(parent)
         self.rom = rom
         title = rom
         if self.DEBUG:
             title += " (DEBUG)"
+        if movie is not None:
+            title += " (MOVIE)"
         self.setWindowTitle(title)
-        self.game = CHIP8()
+        if movie is not None:
+            self.movie_player = MoviePlayer(movie, rom)
+            self.game = self.movie_player.game
+            ips, timer_hz = movie.ips, movie.timer_hz
+        else:
+            self.movie_player = None
+            if record is not None and seed is None:
+                # Без зерна запись не повторила бы случайные числа
+                seed = random.randrange(2 ** 32)
+            self.game = CHIP8(seed=seed)
+            self.game.load_rom(self.rom)
 
         if self.DEBUG:
             global PIXEL_SIZE
@@ -31,110 +84,617 @@ class GameWindow(QMainWindow):
         else:
             global DEBUG_WINDOW_WIDTH
             DEBUG_WINDOW_WIDTH = 0
-        self.setFixedSize(WIDTH * PIXEL_SIZE + DEBUG_WINDOW_WIDTH,
-                          HEIGHT * PIXEL_SIZE)
+        self.resize(WIDTH * PIXEL_SIZE + DEBUG_WINDOW_WIDTH,
+                    HEIGHT * PIXEL_SIZE)
 
         url = QUrl.fromLocalFile(os.path.abspath("sound.wav"))
         content = QMediaContent(url)
         self.player = QMediaPlayer()
         self.player.setMedia(content)
-        self.game.load_rom(self.rom)
-
-        self.delay = delay
-        self.speed = speed
+        self.checkpoints = CheckpointStore(self.game)
+        # Хранилище снимков меняют оба потока: GUI (загрузка сохранения) и
+        # поток, выполняющий команды (клавиши, таймеры, снимки, перемотка)
+        self.checkpoints_lock = threading.Lock()
+        self.rewinding = False
+        # Клавиши, нажатые в GUI, применяются потоком, выполняющим
+        # команды, между порциями команд: так номер команды, на которой
+        # нажата клавиша, точно известен, и перемотка и запись повторяют
+        # игру в точности. seek_request - куда перемотать запись.
+        # Быстрое сохранение и загрузка тоже выполняются этим потоком между
+        # порциями команд, иначе состояние машины было бы порвано:
+        # save_requested - сохранить, load_request - состояние для загрузки
+        self.key_events = []
+        self.seek_request = None
+        self.save_requested = False
+        self.load_request = None
+        self.record = record
+        self.recorder = None
+        if record is not None:
+            self.recorder = MovieRecorder(self.game, rom, seed, ips, timer_hz)
+        self.scheduler = Scheduler(self.game, ips, timer_hz,
+                                   tick=self.tick_timers,
+                                   runner=self.movie_player)
+        self.sound_on = False
+        # Сколько команд выполнило последнее нажатие EXECUTE
+        self.last_executed = 0
+        # Счётчики перерисовки: число вызовов paintEvent, время в них и
+        # число нарисованных пикселей CHIP8
+        self.paint_count = 0
+        self.paint_seconds = 0.0
+        self.painted_pixels = 0
+        # Кадр как картинка 1 бит на пиксель, увеличенный кадр и кадр,
+        # который на нём нарисован (см. get_screen_image). screen_rect -
+        # где на окне рисуется экран, узнаётся при перерисовке после
+        # изменения размеров окна
+        self.frame_image = QImage(WIDTH, HEIGHT, QImage.Format_Mono)
+        self.frame_image.setColorTable(SCREEN_COLORS)
+        self.screen_image = None
+        self.screen_frame = None
+        self.screen_rect = None
+        # Готовые кадры публикует поток или процесс, выполняющий команды
+        # (в режиме отладки - сам GUI), а GUI забирает самый новый по
+        # своему таймеру. frame - показываемый кадр
+        if self.PROCESS:
+            self.process = EmulatorProcess(rom, ips, timer_hz, seed=seed)
+            self.frames = self.process.frames
+        else:
+            self.process = None
+            self.frames = FrameBuffer()
+        self.frame = self.game.display.tobytes()
+        present_hz = QtWidgets.QApplication.primaryScreen().refreshRate()
+        self.present_timer = QTimer(self)
+        self.present_timer.setTimerType(Qt.PreciseTimer)
+        self.present_timer.timeout.connect(self.present)
+        self.present_timer.start(round(1000 / (present_hz or self.PRESENT_HZ)))
 
         _layout = QGridLayout()
         _layout.setSpacing(5)
-        _layout.addWidget(ScreenFillerWidget(), 0, 0)
+        _layout.setContentsMargins(0, 0, 0, 0)
+        self.screen_filler = ScreenFillerWidget()
+        self.screen_filler.sig_geometry_changed.connect(
+            self.reset_screen_rect)
+        _layout.addWidget(self.screen_filler, 0, 0)
+        # Всё место, оставшееся при изменении размеров окна, отдаётся экрану
+        _layout.setColumnStretch(0, 1)
 
+        # Точки останова есть только в режиме отладки
+        self.breakpoints = None
         if self.DEBUG:
-            self.debug_widget = DebugWidget(self.game)
+            self.breakpoints = Breakpoints(self.game)
+            self.debug_widget = DebugWidget(self.game, self.checkpoints,
+                                            self.breakpoints)
             self.debug_widget.sig_execute.connect(self.execute_one_instruction)
+            self.debug_widget.sig_step_back.connect(self.step_back)
+            self.debug_widget.sig_seek.connect(self.seek)
+            self.debug_widget.sig_run.connect(self.set_running)
             _layout.addWidget(self.debug_widget, 0, 1)
+            self.debug_timer = QTimer(self)
+            self.debug_timer.timeout.connect(
+                self.debug_widget.update_registers)
+            self.sig_breakpoint.connect(self.stop_at_breakpoint)
 
-        else:
-            self.start_timer(delay, self.game.decrement_sound_timer)
-            self.start_timer(delay, self.game.decrement_delay_timer)
-
-            thread = threading.Thread(target=self.execute_instructions,
-                                      args=(delay, speed))
-
-            thread.start()
+        # Поток, выполняющий команды: всегда, кроме режима отладки и
+        # отдельного процесса; в режиме отладки - пока нажата RUN.
+        # stop_requested останавливает его, не закрывая игру
+        self.worker = None
+        self.stop_requested = False
+        if not self.DEBUG and not self.PROCESS:
+            self.worker = threading.Thread(target=self.execute_instructions)
+            self.worker.start()
 
         _window = QtWidgets.QWidget()
         _window.setLayout(_layout)
         self.setCentralWidget(_window)
 
-    def start_timer(self, interval, func):
-        timer = QTimer(self)
-        timer.setInterval(interval)
-        timer.timeout.connect(func)
-        timer.start()
-
     @pyqtSlot()
     def execute_one_instruction(self):
-        for _ in range(self.delay):
-            for _ in range(self.speed):
-                continue
+        """
+        Выполнить команды до следующего тика таймеров (один кадр)
+        :return:
+        """
+        _, self.last_executed = self.scheduler.run_frame()
+        self.update_history()
+        self.after_slice()
+        self.debug_widget.update_registers()
 
-            self.game.emulate_cycle()
+    @pyqtSlot(bool)
+    def set_running(self, running):
+        """
+        Запустить или остановить выполнение игры в фоновом потоке в режиме
+        отладки. Пока игра идёт, регистры обновляются по таймеру не чаще
+        DEBUG_REFRESH_HZ раз в секунду
+        :param running:
+        :return:
+        """
+        if running and self.worker is None:
+            self.stop_requested = False
+            self.worker = threading.Thread(target=self.execute_instructions)
+            self.worker.start()
+            self.debug_timer.start(round(1000 / self.DEBUG_REFRESH_HZ))
+        elif not running and self.worker is not None:
+            self.stop_requested = True
+            self.worker.join()
+            self.worker = None
+            # Дальше команды выполняет сам GUI: применить то, что поток
+            # не успел
+            self.apply_requests()
+            self.debug_timer.stop()
+            # BACK отменяет только нажатие EXECUTE
+            self.last_executed = 0
+        self.debug_widget.set_running(self.worker is not None)
+        self.debug_widget.update_registers()
 
-            if self.game.draw_flag:
-                self.update()
-                self.game.draw_flag = False
+    @pyqtSlot()
+    def stop_at_breakpoint(self):
+        self.set_running(False)
 
-        self.game.decrement_delay_timer()
-        self.game.decrement_sound_timer()
-        if self.game.timers['sound'] == 1:
-            self.player.play()
+    @pyqtSlot()
+    def step_back(self):
+        """
+        Отменить последнее нажатие EXECUTE
+        :return:
+        """
+        with self.suspend_breakpoints():
+            if self.movie_player is not None:
+                self.seek_movie(self.game.cycles - self.last_executed)
+            else:
+                self.checkpoints.step_back(self.last_executed)
+                self.after_seek()
+        self.last_executed = 0
+        self.debug_widget.update_registers()
 
+    @pyqtSlot(int)
+    def seek(self, cycle):
+        """
+        Перейти к состоянию после cycle команд
+        :param cycle:
+        :return:
+        """
+        with self.suspend_breakpoints():
+            if self.movie_player is not None:
+                self.seek_movie(cycle)
+            else:
+                oldest = self.checkpoints.oldest_cycle
+                self.checkpoints.seek(min(max(cycle, oldest),
+                                          self.game.cycles))
+                self.after_seek()
         self.debug_widget.update_registers()
 
-    def execute_instructions(self, delay, speed):
-        while self.game.running:
-            for _ in range(delay):
-                for _ in range(speed):
-                    continue
-                self.game.emulate_cycle()
+    def suspend_breakpoints(self):
+        """
+        Контекст, в котором точки останова не срабатывают: перемотка
+        выполняет команды заново
+        :return:
+        """
+        if self.breakpoints is None:
+            return nullcontext()
+        return self.breakpoints.suspended()
+
+    def after_seek(self):
+        """
+        Забыть записанное после текущей команды и показать кадр после
+        перемотки
+        :return:
+        """
+        if self.recorder is not None:
+            self.recorder.truncate()
+        self.publish_frame()
+
+    def seek_movie(self, cycle):
+        """
+        Перемотать проигрываемую запись к команде cycle
+        :param cycle:
+        :return:
+        """
+        with self.suspend_breakpoints():
+            self.movie_player.seek(max(cycle, 0))
+        with self.checkpoints_lock:
+            self.checkpoints.reset()
+        self.scheduler.reset_clock()
+        self.publish_frame()
+
+    def update_history(self):
+        """
+        Сделать снимок для перемотки и продлить запись игры после порции
+        команд
+        :return:
+        """
+        with self.checkpoints_lock:
+            self.checkpoints.update()
+        if self.recorder is not None:
+            self.recorder.update()
+
+    def apply_key(self, key, pressed):
+        self.checkpoints.set_key(key, pressed)
+        if self.recorder is not None:
+            self.recorder.set_key(key, pressed)
+
+    def apply_requests(self):
+        """
+        Применить нажатия клавиш, перемотку записи, быстрые загрузку и
+        сохранение, которые GUI передал потоку, выполняющему команды
+        :return:
+        """
+        with self.checkpoints_lock:
+            events, self.key_events = self.key_events, []
+            for key, pressed in events:
+                self.apply_key(key, pressed)
+            state, self.load_request = self.load_request, None
+            save, self.save_requested = self.save_requested, False
+        if state is not None:
+            self.load_state(state)
+        if save:
+            self.save_state()
+        cycle, self.seek_request = self.seek_request, None
+        if cycle is not None:
+            self.seek_movie(cycle)
+
+    def tick_timers(self):
+        """
+        Уменьшить таймеры. Тик таймеров - конец кадра машины, поэтому
+        здесь же публикуется готовый кадр
+        :return:
+        """
+        with self.checkpoints_lock:
+            self.checkpoints.tick_timers()
+        self.publish_frame()
+
+    def publish_frame(self):
+        """
+        Отдать кадр на показ, если он изменился с прошлой публикации.
+        Вызывается только потоком, который выполняет команды
+        :return:
+        """
+        display = self.game.display
+        dirty_rows, _ = display.take_dirty()
+        if dirty_rows:
+            self.frames.publish(display.tobytes(), self.game.cycles)
+
+    def after_slice(self, *_):
+        """
+        Включить звук после порции команд
+        :return:
+        """
+        self.update_sound(self.game.sound_timer)
+
+    def update_sound(self, sound_timer):
+        sound_on = sound_timer > 0
+        if sound_on and not self.sound_on:
+            self.player.play()
+        self.sound_on = sound_on
+
+    def poll_process(self):
+        """
+        Проверить, жив ли процесс с игрой, и включить звук по его таймеру
+        :return:
+        """
+        error = self.process.poll()
+        if error is not None:
+            print("Emulator process failed: {}".format(error),
+                  file=sys.stderr)
+            self.close()
+            return
+        status = self.process.get_status()
+        if status is not None:
+            self.update_sound(status["sound_timer"])
+
+    @pyqtSlot()
+    def present(self):
+        """
+        Забрать самый новый опубликованный кадр и попросить Qt перерисовать
+        изменившиеся области экрана (см. get_dirty_rects). Вызывается
+        таймером GUI
+        :return:
+        """
+        if self.process is not None:
+            self.poll_process()
+        taken = self.frames.take()
+        if taken is None:
+            return
+        frame = taken[0]
+        screen = self.screen_rect
+        if self.FULL_REPAINT or screen is None:
+            self.update()
+        else:
+            for rect in get_dirty_rects(*get_changes(self.frame, frame)):
+                self.update(self.scale_rect(rect).translated(screen.topLeft()))
+        self.frame = frame
+
+    def scale_rect(self, rect):
+        """
+        Перевести прямоугольник из пикселей CHIP8 в пиксели увеличенного
+        кадра. Граница пикселя x - x * ширина // 64, так что соседние
+        прямоугольники стыкуются без щелей и при дробном масштабе
+        :param rect: QRect в пикселях CHIP8
+        :return: QRect относительно левого верхнего угла экрана
+        """
+        width = self.screen_rect.width()
+        height = self.screen_rect.height()
+        left = rect.left() * width // WIDTH
+        top = rect.top() * height // HEIGHT
+        right = (rect.right() + 1) * width // WIDTH
+        bottom = (rect.bottom() + 1) * height // HEIGHT
+        return QRect(left, top, right - left, bottom - top)
 
-                if self.game.draw_flag:
-                    self.update()
-                    self.game.draw_flag = False
-                if self.game.timers['sound'] == 1:
-                    self.player.play()
+    def get_paint_stats(self):
+        """
+        Сколько раз и как долго перерисовывался экран и сколько кадров
+        было опубликовано, показано, пропущено и порвано
+        :return: словарь
+        """
+        stats = self.frames.get_stats()
+        stats.update({
+            "paints": self.paint_count,
+            "paint_ms": self.paint_seconds * 1000,
+            "ms_per_paint": self.paint_seconds * 1000 / self.paint_count
+            if self.paint_count else None,
+            "window_pixels_per_paint": self.painted_pixels / self.paint_count
+            if self.paint_count else None,
+        })
+        return stats
+
+    def execute_instructions(self):
+        scheduler = self.scheduler
+        scheduler.reset_clock()
+        while self.game.running and not self.stop_requested:
+            self.apply_requests()
+            if self.rewinding:
+                with self.checkpoints_lock:
+                    self.checkpoints.step_back(
+                        int(scheduler.cycles_per_tick * self.REWIND_SPEED))
+                self.after_seek()
+                scheduler.sleep(1 / scheduler.timer_hz)
+                scheduler.reset_clock()
+                continue
+            reason, _ = scheduler.run_slice()
+            if reason == STOP_PAUSED:
+                # Пока игра стоит, таймеры не тикают, а кадр может
+                # измениться после загрузки сохранения
+                self.publish_frame()
+            elif reason in (STOP_BREAKPOINT, STOP_WATCHPOINT):
+                # Режим отладки: остановиться и показать, где стоим
+                self.stop_requested = True
+                self.publish_frame()
+                self.sig_breakpoint.emit()
+            self.update_history()
+            self.after_slice()
+            scheduler.wait()
 
     def closeEvent(self, event):
         self.game.running = False
+        self.present_timer.stop()
+        if self.worker is not None:
+            self.worker.join()
+        if self.process is not None:
+            # Общую память нужно освободить, даже если процесс уже упал
+            self.process.stop()
+        if self.recorder is not None:
+            self.recorder.save(self.record)
         event.accept()
 
     def keyPressEvent(self, e):
         if e.key() in KEYBOARD.keys():
-            self.game.keys[KEYBOARD[e.key()]] = True
+            self.set_key(KEYBOARD[e.key()], True)
         if e.key() == Qt.Key_P:
-            self.game.is_paused = not self.game.is_paused
+            self.toggle_pause()
+        if e.key() == Qt.Key_F5:
+            self.quick_save()
+        if e.key() == Qt.Key_F9:
+            self.quick_load()
+        if e.key() == Qt.Key_Backspace and not self.DEBUG \
+                and self.movie_player is None:
+            self.set_rewinding(True)
+        if e.key() in (Qt.Key_Left, Qt.Key_Right) \
+                and self.movie_player is not None:
+            step = int(self.MOVIE_SEEK_SECONDS * self.scheduler.ips)
+            self.request_seek(self.game.cycles +
+                              (step if e.key() == Qt.Key_Right else -step))
         if e.key() == Qt.Key_Escape:
             self.close()
 
+    def set_key(self, key, pressed):
+        if self.process is not None:
+            self.process.set_key(key, pressed)
+            return
+        if self.movie_player is not None:
+            # Клавиши нажимает запись
+            return
+        if self.DEBUG and self.worker is None:
+            # Команды выполняет сам GUI
+            self.apply_key(key, pressed)
+            return
+        with self.checkpoints_lock:
+            self.key_events.append((key, pressed))
+
+    def request_seek(self, cycle):
+        if self.DEBUG and self.worker is None:
+            self.seek(cycle)
+        else:
+            self.seek_request = cycle
+
+    def toggle_pause(self):
+        if self.process is not None:
+            status = self.process.get_status()
+            if status is not None:
+                self.process.set_paused(not status["paused"])
+            return
+        self.game.is_paused = not self.game.is_paused
+
+    def set_rewinding(self, rewinding):
+        if self.process is not None:
+            self.process.set_rewinding(rewinding)
+        self.rewinding = rewinding
+
+    def quick_save(self):
+        """
+        Сохранить состояние игры в файл рядом с ROM (<rom>.state)
+        :return:
+        """
+        if self.process is not None or self.worker is None:
+            self.save_state()
+            return
+        with self.checkpoints_lock:
+            self.save_requested = True
+
+    def save_state(self):
+        """
+        Записать состояние игры в файл быстрого сохранения. Вызывается
+        потоком, который выполняет команды
+        :return:
+        """
+        if self.process is not None:
+            state = self.process.save_state()
+        else:
+            state = self.game.save_state()
+        with open(self.rom + ".state", "wb") as file:
+            file.write(state)
+
+    def quick_load(self):
+        """
+        Загрузить состояние, сохранённое quick_save
+        :return:
+        """
+        if self.movie_player is not None:
+            # Запись нельзя продолжить с другого состояния
+            return
+        try:
+            with open(self.rom + ".state", "rb") as file:
+                state = file.read()
+        except FileNotFoundError:
+            return
+        if self.process is not None:
+            self.process.load_state(state)
+            return
+        if self.worker is not None:
+            with self.checkpoints_lock:
+                self.load_request = state
+            return
+        self.load_state(state)
+        self.debug_widget.update_registers()
+
+    def load_state(self, state):
+        """
+        Загрузить состояние игры. Вызывается потоком, который выполняет
+        команды
+        :param state: результат CHIP8.save_state
+        :return:
+        """
+        with self.checkpoints_lock:
+            self.game.load_state(state)
+            self.checkpoints.reset()
+            if self.recorder is not None:
+                self.recorder.restart()
+        self.scheduler.reset_clock()
+        self.publish_frame()
+
     def keyReleaseEvent(self, e):
         if e.key() in KEYBOARD.keys():
-            self.game.keys[KEYBOARD[e.key()]] = False
+            self.set_key(KEYBOARD[e.key()], False)
+        if e.key() == Qt.Key_Backspace and not e.isAutoRepeat():
+            self.set_rewinding(False)
 
     def paintEvent(self, e):
+        start = time.perf_counter()
+        if self.screen_rect is None:
+            self.screen_rect = self.get_screen_rect()
+        image = self.get_screen_image()
         qp = QPainter()
         qp.begin(self)
-        self.draw(qp)
+        for rect in e.region().rects():
+            self.draw(qp, rect, image)
+        qp.end()
+        self.paint_count += 1
+        self.paint_seconds += time.perf_counter() - start
+
+    @pyqtSlot()
+    def reset_screen_rect(self):
+        self.screen_rect = None
+
+    def get_screen_rect(self):
+        """
+        Самый большой прямоугольник с соотношением сторон экрана CHIP8,
+        помещающийся в отведённое под экран место окна (по центру).
+        Масштаб может быть дробным
+        :return: QRect в координатах окна
+        """
+        area = QRect(self.screen_filler.mapTo(self, QPoint(0, 0)),
+                     self.screen_filler.size())
+        scale = min(area.width() / WIDTH, area.height() / HEIGHT)
+        width = max(round(WIDTH * scale), 1)
+        height = max(round(HEIGHT * scale), 1)
+        return QRect(area.x() + (area.width() - width) // 2,
+                     area.y() + (area.height() - height) // 2,
+                     width, height)
+
+    def get_screen_image(self):
+        """
+        Показываемый кадр, увеличенный до размера экрана. Кадр копируется
+        в 1-битную картинку одним куском (формат Display.tobytes совпадает
+        с QImage.Format_Mono), а в увеличенной картинке перерисовываются
+        только изменившиеся прямоугольники. Целиком она рисуется заново
+        только при изменении размеров окна
+        :return: QImage
+        """
+        frame = self.frame
+        size = self.screen_rect.size()
+        if self.screen_image is None or self.screen_image.size() != size:
+            self.screen_image = QImage(size, QImage.Format_RGB32)
+            rects = [QRect(0, 0, WIDTH, HEIGHT)]
+        elif frame == self.screen_frame:
+            return self.screen_image
+        else:
+            rects = get_dirty_rects(*get_changes(self.screen_frame, frame))
+        self.screen_frame = frame
+        bits = self.frame_image.bits()
+        bits.setsize(len(frame))
+        bits[0:len(frame)] = frame
+        # Увеличивать 32-битную картинку намного быстрее, чем 1-битную
+        image = self.frame_image.convertToFormat(QImage.Format_RGB32)
+        qp = QPainter()
+        qp.begin(self.screen_image)
+        for rect in rects:
+            qp.drawImage(self.scale_rect(rect), image, rect)
         qp.end()
+        return self.screen_image
 
-    def draw(self, qp):
-        for y in range(HEIGHT):
-            for x in range(WIDTH):
-                color = Qt.black if not self.game.screen[x][y] else Qt.white
-                qp.fillRect(x * PIXEL_SIZE, y * PIXEL_SIZE,
-                            PIXEL_SIZE, PIXEL_SIZE, color)
+    def draw(self, qp, rect, image):
+        """
+        Нарисовать часть окна rect: кусок увеличенного кадра и чёрные поля
+        вокруг экрана
+        :param qp: QPainter
+        :param rect: QRect в координатах окна
+        :param image: увеличенный кадр из get_screen_image
+        :return:
+        """
+        screen = self.screen_rect
+        if not screen.contains(rect):
+            qp.fillRect(rect, Qt.black)
+        visible = rect & screen
+        if visible.isEmpty():
+            return
+        qp.drawImage(visible, image,
+                     visible.translated(-screen.x(), -screen.y()))
+        self.painted_pixels += visible.width() * visible.height()
 
 
 class ScreenFillerWidget(QtWidgets.QWidget):
+    """
+    Место под экран в раскладке окна; сам экран рисует GameWindow
+    """
+    sig_geometry_changed = pyqtSignal()
+
     def __init__(self, parent=None):
         super().__init__(parent)
 
-        self.setFixedSize(WIDTH * PIXEL_SIZE, HEIGHT * PIXEL_SIZE)
+        self.setMinimumSize(WIDTH, HEIGHT)
+        self.setSizePolicy(QtWidgets.QSizePolicy.Expanding,
+                           QtWidgets.QSizePolicy.Expanding)
+
+    def sizeHint(self):
+        return QSize(WIDTH * PIXEL_SIZE, HEIGHT * PIXEL_SIZE)
+
+    def resizeEvent(self, e):
+        self.sig_geometry_changed.emit()
+
+    def moveEvent(self, e):
+        self.sig_geometry_changed.emit()
@@ -0,0 +1,50 @@
+from PyQt5.QtCore import QRect
+
+from config import WIDTH, HEIGHT
+
+# Байт в строке кадра Display.tobytes
+ROW_BYTES = WIDTH // 8
+
+
+def get_changes(old, new):
+    """
+    Сравнить два кадра в формате Display.tobytes
+    :return: пара масок (строки, столбцы), как у Display.take_dirty
+    """
+    dirty_rows = 0
+    dirty_columns = 0
+    for y in range(HEIGHT):
+        start = y * ROW_BYTES
+        end = start + ROW_BYTES
+        if old[start:end] != new[start:end]:
+            dirty_rows |= 1 << y
+            dirty_columns |= (int.from_bytes(old[start:end], 'big')
+                              ^ int.from_bytes(new[start:end], 'big'))
+    return dirty_rows, dirty_columns
+
+
+def get_dirty_rects(dirty_rows, dirty_columns):
+    """
+    Разбить изменившуюся часть экрана на прямоугольники: по одному на
+    каждую непрерывную группу изменившихся строк, шириной от первого до
+    последнего изменившегося столбца
+    :param dirty_rows: маска строк (бит y - строка y)
+    :param dirty_columns: маска столбцов, старший бит - столбец 0
+    :return: список QRect в пикселях CHIP8
+    """
+    rects = []
+    if not dirty_rows:
+        return rects
+    left = WIDTH - dirty_columns.bit_length()
+    right = WIDTH - (dirty_columns & -dirty_columns).bit_length()
+    y = 0
+    while dirty_rows:
+        while not dirty_rows & 1:
+            dirty_rows >>= 1
+            y += 1
+        top = y
+        while dirty_rows & 1:
+            dirty_rows >>= 1
+            y += 1
+        rects.append(QRect(left, top, right - left + 1, y - top))
+    return rects
@@ -0,0 +1,363 @@
+import argparse
+import hashlib
+import json
+import os
+import sys
+import time
+
+from breakpoints import Breakpoints
+from chip8 import CHIP8, STOP_CYCLES
+from compiler import BlockCompiler
+from movie import Movie, MoviePlayer, record_events, \
+    DEFAULT_KEYFRAME_INTERVAL
+from profiler import HandlerProfiler, AddressProfiler
+from scheduler import DEFAULT_IPS, DEFAULT_TIMER_HZ
+
+__all__ = ['run_headless', 'load_input_script', 'get_report', 'play_movie',
+           'profile_rom', 'main']
+
+# Сколько команд выполняется между уменьшениями таймеров (60 Гц)
+CYCLES_PER_FRAME = 10
+
+
+def load_input_script(path):
+    """
+    Прочитать сценарий нажатий клавиш. Каждая строка файла имеет вид
+        <номер команды> <клавиша 0-f> <down|up>
+    Пустые строки и всё после # пропускаются
+    :param path:
+    :return: список событий (номер команды, клавиша, нажата ли),
+             упорядоченный по номеру команды
+    """
+    events = []
+    with open(path) as file:
+        for line_number, line in enumerate(file, 1):
+            line = line.split("#", 1)[0].strip()
+            if not line:
+                continue
+            try:
+                cycle, key, action = line.split()
+                event = (int(cycle), int(key, 16), action == "down")
+            except ValueError:
+                raise ValueError("{}:{}: expected '<cycle> <key> <down|up>'"
+                                 .format(path, line_number))
+            if action not in ("down", "up") or not 0 <= event[1] < 16:
+                raise ValueError("{}:{}: bad key event".format(path,
+                                                               line_number))
+            events.append(event)
+    events.sort(key=lambda item: item[0])
+    return events
+
+
+def run_headless(runner, game, cycles=None, frames=None,
+                 cycles_per_frame=CYCLES_PER_FRAME, events=()):
+    """
+    Выполнять программу кадрами по cycles_per_frame команд, уменьшая
+    таймеры после каждого полного кадра. Останавливается, когда выполнено
+    frames кадров или cycles команд (что наступит раньше)
+    :param runner: то, что исполняет команды: CHIP8 или BlockCompiler
+    :param game: экземпляр CHIP8
+    :param cycles: наибольшее число команд (None - без ограничения)
+    :param frames: наибольшее число кадров (None - без ограничения)
+    :param cycles_per_frame: число команд за кадр
+    :param events: упорядоченные события клавиатуры (номер команды,
+                   клавиша, нажата ли); номер считается по game.cycles
+    :return: (причина остановки, число команд, число кадров)
+    """
+    reason = STOP_CYCLES
+    executed = 0
+    frame = 0
+    in_frame = 0
+    next_event = 0
+    while (frames is None or frame < frames) \
+            and (cycles is None or executed < cycles):
+        while next_event < len(events) \
+                and events[next_event][0] <= game.cycles:
+            _, key, pressed = events[next_event]
+            game.keys[key] = pressed
+            next_event += 1
+        budget = cycles_per_frame - in_frame
+        if cycles is not None:
+            budget = min(budget, cycles - executed)
+        if next_event < len(events):
+            budget = min(budget, events[next_event][0] - game.cycles)
+        reason, done = runner.run(budget)
+        executed += done
+        in_frame += done
+        if reason != STOP_CYCLES:
+            break
+        if in_frame == cycles_per_frame:
+            game.tick_timers()
+            frame += 1
+            in_frame = 0
+    return reason, executed, frame
+
+
+def get_report(game, reason, cycles, frames, seconds):
+    """
+    Собрать итоги запуска: кадр, регистры и статистику
+    :return: словарь, который можно сохранить в JSON
+    """
+    frame = game.display.tobytes()
+    return {
+        "frame": [frame[row:row + 8].hex() for row in range(0, 256, 8)],
+        "frame_sha1": hashlib.sha1(frame).hexdigest(),
+        "registers": game.get_reg_dump(),
+        "stats": {
+            "stop_reason": reason,
+            "cycles": cycles,
+            "frames": frames,
+            "seconds": seconds,
+            "cycles_per_second": cycles / seconds if seconds else None,
+        },
+    }
+
+
+def play_movie(path, rom, seek=None, cycles=None):
+    """
+    Проиграть запись (movie.Movie) на наибольшей скорости
+    :param path: файл записи
+    :param rom: путь к ROM файлу
+    :param seek: с какой команды начать (перемотка через опорные кадры)
+    :param cycles: на какой команде остановиться (None - в конце записи)
+    :return: отчёт, как у get_report, плюс время перемотки
+    """
+    player = MoviePlayer(Movie.load(path), rom)
+    game = player.game
+    seek_seconds = None
+    if seek is not None:
+        start = time.perf_counter()
+        player.seek(seek)
+        seek_seconds = time.perf_counter() - start
+    first = game.cycles
+    end = player.movie.length if cycles is None \
+        else min(cycles, player.movie.length)
+    start = time.perf_counter()
+    reason, executed = player.scheduler.run_cycles(max(end - first, 0))
+    seconds = time.perf_counter() - start
+    frames = executed * player.movie.timer_hz // player.movie.ips
+    report = get_report(game, reason, executed, frames, seconds)
+    report["rom"] = os.path.abspath(rom)
+    report["movie"] = player.movie.get_info()
+    report["stats"]["start_cycle"] = first
+    report["stats"]["seek_seconds"] = seek_seconds
+    return report
+
+
+def profile_rom(rom, cycles, cycles_per_frame=CYCLES_PER_FRAME, events=(),
+                seed=0, profiler_class=HandlerProfiler):
+    """
+    Выполнить ROM без окна под профилировщиком
+    :param rom: путь к ROM файлу
+    :param cycles: число команд
+    :param cycles_per_frame: число команд за кадр
+    :param events: события клавиатуры, как у run_headless
+    :param seed: зерно генератора случайных чисел
+    :param profiler_class: HandlerProfiler (обработчики команд) или
+                           AddressProfiler (адреса и подпрограммы ROM)
+    :return: профилировщик с результатами
+    """
+    game = CHIP8(seed=seed)
+    game.load_rom(rom)
+    with profiler_class(game) as profiler:
+        run_headless(game, game, cycles=cycles,
+                     cycles_per_frame=cycles_per_frame, events=events)
+    return profiler
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m chip8',
+        description='Run CHIP8 ROMs without a display.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    run = commands.add_parser(
+        'run', help='run a ROM as fast as possible',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    run.add_argument('rom', type=str, help='way to rom file')
+    run.add_argument('-c', '--cycles', type=int, default=None,
+                     help='stop after this many instructions')
+    run.add_argument('-f', '--frames', type=int, default=None,
+                     help='stop after this many 60 Hz frames')
+    run.add_argument('--cycles-per-frame', type=int, default=CYCLES_PER_FRAME,
+                     help='instructions executed between timer ticks')
+    run.add_argument('-s', '--seed', type=int, default=None,
+                     help='seed for the random number generator (CXNN)')
+    run.add_argument('-i', '--inputs', type=str, default=None,
+                     help='input script: "<cycle> <key> <down|up>" lines')
+    run.add_argument('--compile', action='store_true',
+                     help='execute ROM code through the block compiler')
+    run.add_argument('--cache-dir', type=str, default=None,
+                     help='directory for compiled blocks (with --compile)')
+    run.add_argument('-o', '--output', type=str, default='-',
+                     help='file for the JSON report, "-" for stdout')
+    run.add_argument('-b', '--break', dest='breaks', action='append',
+                     default=[], metavar='BREAKPOINT',
+                     help='stop at a breakpoint: an address ("0x248", '
+                          '"0x248 if V3 == 7"), an instruction class '
+                          '("DXYN", "FX33 if I >= 0x300") or a memory '
+                          'write ("write 0x300-0x30F"); can be repeated')
+
+    record = commands.add_parser(
+        'record', help='record a movie from an input script',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    record.add_argument('rom', type=str, help='way to rom file')
+    record.add_argument('movie', type=str, help='movie file to write')
+    record.add_argument('-c', '--cycles', type=int, required=True,
+                        help='length of the movie in instructions')
+    record.add_argument('-s', '--seed', type=int, default=0,
+                        help='seed for the random number generator (CXNN)')
+    record.add_argument('-i', '--inputs', type=str, default=None,
+                        help='input script: "<cycle> <key> <down|up>" lines')
+    record.add_argument('--ips', type=int, default=DEFAULT_IPS,
+                        help='instructions per second the movie is '
+                             'played at')
+    record.add_argument('--timer-hz', type=int, default=DEFAULT_TIMER_HZ,
+                        help='timer frequency')
+    record.add_argument('-k', '--keyframe-interval', type=int,
+                        default=DEFAULT_KEYFRAME_INTERVAL,
+                        help='instructions between state keyframes, '
+                             '0 for none')
+
+    play = commands.add_parser(
+        'play', help='play a movie back as fast as possible',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    play.add_argument('movie', type=str, help='movie file')
+    play.add_argument('rom', type=str, help='way to rom file')
+    play.add_argument('--seek', type=int, default=None,
+                      help='jump to this instruction (through keyframes) '
+                           'before playing')
+    play.add_argument('-c', '--cycles', type=int, default=None,
+                      help='stop at this instruction instead of the end')
+    play.add_argument('-o', '--output', type=str, default='-',
+                      help='file for the JSON report, "-" for stdout')
+
+    profile = commands.add_parser(
+        'profile', help='count executions and time of every instruction '
+                        'handler',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    profile.add_argument('roms', type=str, nargs='+', help='ROM files')
+    profile.add_argument('-c', '--cycles', type=int, default=200000,
+                         help='instructions to execute for each ROM')
+    profile.add_argument('-i', '--inputs', type=str, default=None,
+                         help='input script: "<cycle> <key> <down|up>" '
+                              'lines')
+    profile.add_argument('--json', type=str, default=None,
+                         help='write results of all ROMs to this JSON file')
+    profile.add_argument('--collapsed', type=str, default=None,
+                         help='write collapsed stacks (for flame graphs) '
+                              'to this file')
+
+    hotspots = commands.add_parser(
+        'hotspots', help='count executions of every ROM address and '
+                         'subroutine and print an annotated listing',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    hotspots.add_argument('rom', type=str, help='way to rom file')
+    hotspots.add_argument('-c', '--cycles', type=int, default=200000,
+                          help='instructions to execute')
+    hotspots.add_argument('-i', '--inputs', type=str, default=None,
+                          help='input script: "<cycle> <key> <down|up>" '
+                               'lines')
+    hotspots.add_argument('--executed-only', action='store_true',
+                          help='list only executed instructions')
+    hotspots.add_argument('--json', type=str, default=None,
+                          help='write counters to this JSON file')
+
+    args = parser.parse_args(argv)
+    if args.command == 'hotspots':
+        events = load_input_script(args.inputs) if args.inputs else ()
+        profiler = profile_rom(args.rom, args.cycles, events=events,
+                               profiler_class=AddressProfiler)
+        print("{} ({} instructions, {:.2f} s)".format(
+            os.path.basename(args.rom), args.cycles, profiler.seconds))
+        for row in profiler.get_subroutines():
+            print("sub_{address:03X}: {calls} calls, {inclusive} "
+                  "instructions inside ({share:.1%})".format(**row))
+        print()
+        print(profiler.format_listing(executed_only=args.executed_only))
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(profiler.to_json(), file, indent=2)
+        return
+    if args.command == 'profile':
+        events = load_input_script(args.inputs) if args.inputs else ()
+        results = {}
+        stacks = []
+        for rom in args.roms:
+            profiler = profile_rom(rom, args.cycles, events=events)
+            name = os.path.basename(rom)
+            print("{} ({} instructions, {:.2f} s)".format(
+                name, args.cycles, profiler.seconds))
+            print(profiler.format_table())
+            print()
+            results[name] = profiler.to_json()
+            stacks.append(profiler.to_collapsed(root=name))
+        if args.json:
+            with open(args.json, "w") as file:
+                json.dump(results, file, indent=2)
+        if args.collapsed:
+            with open(args.collapsed, "w") as file:
+                file.write("".join(stacks))
+        return
+    if args.command == 'record':
+        events = load_input_script(args.inputs) if args.inputs else ()
+        movie = record_events(args.rom, events, args.cycles, args.seed,
+                              args.ips, args.timer_hz,
+                              args.keyframe_interval or None)
+        movie.save(args.movie)
+        json.dump(movie.get_info(), sys.stdout, indent=2)
+        sys.stdout.write("\n")
+        return
+    if args.command == 'play':
+        report = play_movie(args.movie, args.rom, args.seek, args.cycles)
+        write_report(report, args.output)
+        return
+    if args.cycles is None and args.frames is None:
+        parser.error('at least one of --cycles and --frames is required')
+    if args.compile and args.breaks:
+        parser.error('breakpoints do not work with --compile')
+
+    game = CHIP8(seed=args.seed)
+    game.load_rom(args.rom)
+    events = load_input_script(args.inputs) if args.inputs else ()
+    runner = game
+    if args.compile:
+        runner = BlockCompiler(game, args.cache_dir)
+    breakpoints = None
+    if args.breaks:
+        breakpoints = Breakpoints(game)
+        for text in args.breaks:
+            try:
+                breakpoints.add_text(text)
+            except ValueError as error:
+                parser.error(str(error))
+
+    start = time.perf_counter()
+    reason, cycles, frames = run_headless(runner, game, args.cycles,
+                                          args.frames, args.cycles_per_frame,
+                                          events)
+    seconds = time.perf_counter() - start
+    if args.compile:
+        runner.save()
+
+    report = get_report(game, reason, cycles, frames, seconds)
+    report["rom"] = os.path.abspath(args.rom)
+    report["seed"] = args.seed
+    if breakpoints is not None:
+        report["breakpoint"] = breakpoints.last_hit
+    write_report(report, args.output)
+
+
+def write_report(report, output):
+    if output == '-':
+        json.dump(report, sys.stdout, indent=2)
+        sys.stdout.write("\n")
+    else:
+        with open(output, "w") as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
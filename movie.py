@@ -0,0 +1,448 @@
+import hashlib
+import struct
+import sys
+import zlib
+from array import array
+from bisect import bisect_right
+
+from chip8 import CHIP8, STATE_HEADER, STATE_SIZE, STOP_CYCLES, \
+    STOP_PAUSED
+from scheduler import Scheduler, DEFAULT_IPS, DEFAULT_TIMER_HZ
+
+__all__ = ['Movie', 'MovieRecorder', 'MoviePlayer', 'record_events',
+           'get_rom_hash']
+
+MOVIE_MAGIC = b'C8MV'
+MOVIE_VERSION = 1
+# Заголовок файла: сигнатура, версия, SHA-1 ROM, зерно генератора
+# случайных чисел, скорость (ips и timer_hz, от них зависят тики таймеров),
+# длина записи в командах, флаги, число событий и опорных кадров. Дальше
+# идёт сжатое zlib тело: начальное состояние (если есть), номера команд и
+# коды событий, номера команд опорных кадров, сколько событий было до
+# каждого из них, и сами опорные кадры - состояния CHIP8.save_state
+MOVIE_HEADER = struct.Struct('<4sH20sqIIQBII')
+FLAG_SEED = 1
+FLAG_START_STATE = 2
+# Через сколько команд MovieRecorder сохраняет опорный кадр
+DEFAULT_KEYFRAME_INTERVAL = 10000
+
+
+def get_rom_hash(path):
+    """
+    SHA-1 файла с ROM: запись можно проиграть только с тем же ROM
+    :param path: путь к ROM файлу
+    :return: 20 байт
+    """
+    with open(path, "rb") as file:
+        return hashlib.sha1(file.read()).digest()
+
+
+def get_key_code(key, pressed):
+    # Как в CheckpointStore: номер клавиши для нажатия, номер + 16 - для
+    # отпускания
+    return key if pressed else key + 16
+
+
+def to_little_endian(values):
+    values = array(values.typecode, values)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values.tobytes()
+
+
+def from_little_endian(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == 'big':
+        values.byteswap()
+    return values
+
+
+class Movie:
+    """
+    Запись игры: ROM (его SHA-1), зерно генератора случайных чисел и
+    нажатия клавиш с номерами команд, на которых они произошли, плюс
+    необязательные опорные кадры - полные состояния машины, с которых
+    можно начинать проигрывание при перемотке.
+    Тики таймеров не записываются: при той же скорости (ips, timer_hz) они
+    приходятся на те же команды (см. Scheduler.get_next_tick).
+    Если запись начата не с включения машины (или зерна нет), в ней
+    хранится начальное состояние
+    :param rom_hash: get_rom_hash(rom)
+    :param seed: зерно генератора случайных чисел или None
+    :param ips: команд в секунду
+    :param timer_hz: частота таймеров
+    :param start_state: состояние (CHIP8.save_state), с которого начата
+                        запись, или None - с включения машины
+    """
+
+    def __init__(self, rom_hash, seed=None, ips=DEFAULT_IPS,
+                 timer_hz=DEFAULT_TIMER_HZ, start_state=None):
+        if seed is None and start_state is None:
+            raise ValueError("movie needs either a seed or a start state")
+        self.rom_hash = rom_hash
+        self.seed = seed
+        self.ips = ips
+        self.timer_hz = timer_hz
+        self.start_state = start_state
+        self.length = 0
+        self.event_cycles = array('q')
+        self.event_codes = array('b')
+        self.keyframe_cycles = array('q')
+        self.keyframe_events = array('q')
+        self.keyframes = []
+
+    @property
+    def start_cycle(self):
+        if self.start_state is None:
+            return 0
+        # Номер команды - последнее поле заголовка состояния
+        return STATE_HEADER.unpack_from(self.start_state)[-1]
+
+    def add_event(self, cycle, key, pressed):
+        if self.event_cycles and cycle < self.event_cycles[-1]:
+            raise ValueError("events must be added in cycle order")
+        self.event_cycles.append(cycle)
+        self.event_codes.append(get_key_code(key, pressed))
+        self.length = max(self.length, cycle)
+
+    def add_keyframe(self, state, cycle):
+        """
+        Добавить опорный кадр: состояние после cycle команд и всех уже
+        добавленных событий
+        :param state: CHIP8.save_state
+        :param cycle: номер команды
+        :return:
+        """
+        if self.keyframe_cycles and cycle < self.keyframe_cycles[-1]:
+            raise ValueError("keyframes must be added in cycle order")
+        self.keyframe_cycles.append(cycle)
+        self.keyframe_events.append(len(self.event_codes))
+        self.keyframes.append(state)
+        self.length = max(self.length, cycle)
+
+    def truncate(self, cycle):
+        """
+        Забыть всё, что записано после cycle команд (например, после
+        перемотки назад)
+        :param cycle:
+        :return:
+        """
+        events = bisect_right(self.event_cycles, cycle)
+        del self.event_cycles[events:]
+        del self.event_codes[events:]
+        keyframes = bisect_right(self.keyframe_cycles, cycle)
+        while keyframes and self.keyframe_events[keyframes - 1] > events:
+            keyframes -= 1
+        del self.keyframe_cycles[keyframes:]
+        del self.keyframe_events[keyframes:]
+        del self.keyframes[keyframes:]
+        self.length = min(self.length, cycle)
+
+    def tobytes(self):
+        """
+        Запись в двоичном виде (формат описан у MOVIE_HEADER)
+        :return: bytes
+        """
+        flags = (FLAG_SEED if self.seed is not None else 0) | \
+            (FLAG_START_STATE if self.start_state is not None else 0)
+        header = MOVIE_HEADER.pack(
+            MOVIE_MAGIC, MOVIE_VERSION, self.rom_hash, self.seed or 0,
+            self.ips, self.timer_hz, self.length, flags,
+            len(self.event_codes), len(self.keyframes))
+        body = [self.start_state or b"",
+                to_little_endian(self.event_cycles),
+                self.event_codes.tobytes(),
+                to_little_endian(self.keyframe_cycles),
+                to_little_endian(self.keyframe_events)]
+        body.extend(self.keyframes)
+        return header + zlib.compress(b"".join(body))
+
+    @classmethod
+    def frombytes(cls, data):
+        """
+        Прочитать запись, сохранённую tobytes
+        :param data: bytes
+        :return: Movie
+        """
+        if len(data) < MOVIE_HEADER.size:
+            raise Exception("Movie is too short!")
+        (magic, version, rom_hash, seed, ips, timer_hz, length, flags,
+         events, keyframes) = MOVIE_HEADER.unpack_from(data)
+        if magic != MOVIE_MAGIC:
+            raise Exception("Not a CHIP8 movie!")
+        if version != MOVIE_VERSION:
+            raise Exception("Unsupported movie version {}".format(version))
+        try:
+            body = zlib.decompress(data[MOVIE_HEADER.size:])
+        except zlib.error:
+            raise Exception("Movie data is corrupted!")
+        sizes = [STATE_SIZE if flags & FLAG_START_STATE else 0,
+                 events * 8, events, keyframes * 8, keyframes * 8]
+        sizes.extend([STATE_SIZE] * keyframes)
+        if len(body) != sum(sizes):
+            raise Exception("Movie data has wrong size!")
+        parts = []
+        offset = 0
+        for size in sizes:
+            parts.append(body[offset:offset + size])
+            offset += size
+
+        movie = cls(rom_hash, seed if flags & FLAG_SEED else None, ips,
+                    timer_hz, parts[0] or None)
+        movie.length = length
+        movie.event_cycles = from_little_endian('q', parts[1])
+        movie.event_codes.frombytes(parts[2])
+        movie.keyframe_cycles = from_little_endian('q', parts[3])
+        movie.keyframe_events = from_little_endian('q', parts[4])
+        movie.keyframes = parts[5:]
+        return movie
+
+    def save(self, path):
+        with open(path, "wb") as file:
+            file.write(self.tobytes())
+
+    @classmethod
+    def load(cls, path):
+        with open(path, "rb") as file:
+            return cls.frombytes(file.read())
+
+    def get_info(self):
+        """
+        Что записано: скорость, длина, число событий и опорных кадров
+        :return: словарь
+        """
+        return {
+            "rom_sha1": self.rom_hash.hex(),
+            "seed": self.seed,
+            "ips": self.ips,
+            "timer_hz": self.timer_hz,
+            "start_cycle": self.start_cycle,
+            "length": self.length,
+            "seconds": (self.length - self.start_cycle) / self.ips,
+            "events": len(self.event_codes),
+            "keyframes": len(self.keyframes),
+            "bytes": len(self.tobytes()),
+        }
+
+
+class MovieRecorder:
+    """
+    Запись игры в Movie. Клавиши нужно нажимать через set_key, а после
+    каждой порции команд вызывать update. Чтобы запись проигрывалась так
+    же, как шла игра, клавиши должны нажиматься между порциями команд, а
+    не во время их выполнения (из другого потока)
+    :param game: экземпляр CHIP8, у которого загружен ROM
+    :param rom: путь к ROM файлу
+    :param seed: зерно, с которым создана машина (None - неизвестно, тогда
+                 сохраняется начальное состояние)
+    :param ips: команд в секунду
+    :param timer_hz: частота таймеров
+    :param keyframe_interval: через сколько команд сохранять опорный кадр,
+                              None - не сохранять
+    """
+
+    def __init__(self, game, rom, seed=None, ips=DEFAULT_IPS,
+                 timer_hz=DEFAULT_TIMER_HZ,
+                 keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+        self.game = game
+        self.rom_hash = get_rom_hash(rom)
+        self.seed = seed
+        self.ips = ips
+        self.timer_hz = timer_hz
+        self.keyframe_interval = keyframe_interval
+        self.movie = None
+        self.restart(game.cycles == 0 and seed is not None)
+
+    def restart(self, from_power_on=False):
+        """
+        Начать запись заново с текущего состояния машины (например, после
+        загрузки сохранения)
+        :param from_power_on: машина только что создана с зерном seed, и
+                              начальное состояние можно не хранить
+        :return:
+        """
+        start_state = None if from_power_on else self.game.save_state()
+        self.movie = Movie(self.rom_hash, self.seed, self.ips,
+                           self.timer_hz, start_state)
+        self.movie.length = self.game.cycles
+        self.last_keyframe = self.game.cycles
+
+    def set_key(self, key, pressed):
+        """
+        Нажать или отпустить клавишу и запомнить это
+        :param key: номер клавиши 0-f
+        :param pressed:
+        :return:
+        """
+        self.game.keys[key] = pressed
+        self.movie.add_event(self.game.cycles, key, pressed)
+
+    def update(self):
+        """
+        Продлить запись до текущей команды и, если пора, сохранить
+        опорный кадр. Вызывается после выполнения очередной порции команд
+        :return:
+        """
+        cycles = self.game.cycles
+        if self.keyframe_interval is not None and \
+                cycles - self.last_keyframe >= self.keyframe_interval:
+            self.movie.add_keyframe(self.game.save_state(), cycles)
+            self.last_keyframe = cycles
+        self.movie.length = max(self.movie.length, cycles)
+
+    def truncate(self):
+        """
+        Забыть всё, что записано после текущей команды (после перемотки)
+        :return:
+        """
+        cycles = self.game.cycles
+        self.movie.truncate(cycles)
+        self.movie.length = cycles
+        self.last_keyframe = min(self.last_keyframe, cycles)
+
+    def save(self, path):
+        self.update()
+        self.movie.save(path)
+
+
+class MoviePlayer:
+    """
+    Проигрывание Movie. Сам создаёт машину (game) и выполняет её команды,
+    нажимая записанные клавиши на записанных командах, поэтому передаётся
+    в Scheduler как runner: в реальном времени - через run_slice, на
+    наибольшей скорости - через run_cycles или play. Когда запись
+    кончается, машина ставится на паузу
+    :param movie: Movie
+    :param rom: путь к ROM файлу (должен совпадать с записанным)
+    """
+
+    def __init__(self, movie, rom):
+        if get_rom_hash(rom) != movie.rom_hash:
+            raise Exception("ROM {} does not match the movie".format(rom))
+        self.movie = movie
+        self.rom = rom
+        self.game = CHIP8(seed=movie.seed)
+        self.game.load_rom(rom)
+        self.scheduler = Scheduler(self.game, movie.ips, movie.timer_hz,
+                                   runner=self)
+        self.rewind()
+
+    @property
+    def finished(self):
+        return self.game.cycles >= self.movie.length
+
+    def rewind(self):
+        """
+        Вернуться к началу записи
+        :return:
+        """
+        game = self.game
+        if self.movie.start_state is not None:
+            game.load_state(self.movie.start_state)
+        else:
+            seeded = CHIP8(seed=self.movie.seed)
+            seeded.load_rom(self.rom)
+            game.load_state(seeded.save_state())
+        game.is_paused = False
+        self.next_event = 0
+        self.ended = False
+
+    def apply_events(self):
+        movie = self.movie
+        game = self.game
+        cycles, codes = movie.event_cycles, movie.event_codes
+        index = self.next_event
+        while index < len(codes) and cycles[index] <= game.cycles:
+            code = codes[index]
+            game.keys[code & 15] = code < 16
+            index += 1
+        self.next_event = index
+
+    def run(self, n_cycles):
+        """
+        Выполнить до n_cycles команд, как CHIP8.run, но не дальше
+        следующего записанного события и конца записи
+        :param n_cycles: число команд
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        game = self.game
+        self.apply_events()
+        budget = min(n_cycles, self.movie.length - game.cycles)
+        if budget <= 0 and n_cycles > 0:
+            game.is_paused = True
+            self.ended = True
+            return STOP_PAUSED, 0
+        if self.next_event < len(self.movie.event_codes):
+            budget = min(budget, self.movie.event_cycles[self.next_event]
+                         - game.cycles)
+        return game.run(budget)
+
+    def seek(self, cycle):
+        """
+        Перейти к состоянию после cycle команд: загрузить ближайший более
+        ранний опорный кадр (если он ближе текущей команды) и выполнить
+        команды от него
+        :param cycle: номер команды, не больше длины записи
+        :return:
+        """
+        movie = self.movie
+        game = self.game
+        cycle = min(cycle, movie.length)
+        # Пауза в конце записи после перемотки снимается
+        paused = game.is_paused and not self.ended
+        self.ended = False
+        position = bisect_right(movie.keyframe_cycles, cycle) - 1
+        if position >= 0 and (cycle < game.cycles or
+                              movie.keyframe_cycles[position] > game.cycles):
+            game.load_state(movie.keyframes[position])
+            self.next_event = movie.keyframe_events[position]
+        elif cycle < game.cycles:
+            self.rewind()
+        game.is_paused = False
+        self.scheduler.run_cycles(max(cycle - game.cycles, 0))
+        game.is_paused = paused
+        self.apply_events()
+        self.scheduler.reset_clock()
+
+    def play(self):
+        """
+        Проиграть запись до конца на наибольшей скорости
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        return self.scheduler.run_cycles(
+            max(self.movie.length - self.game.cycles, 0))
+
+
+def record_events(rom, events, cycles, seed=0, ips=DEFAULT_IPS,
+                  timer_hz=DEFAULT_TIMER_HZ,
+                  keyframe_interval=DEFAULT_KEYFRAME_INTERVAL):
+    """
+    Записать игру без окна по сценарию нажатий (headless.load_input_script)
+    :param rom: путь к ROM файлу
+    :param events: упорядоченные события (номер команды, клавиша, нажата)
+    :param cycles: длина записи в командах
+    :param seed: зерно генератора случайных чисел
+    :return: Movie
+    """
+    game = CHIP8(seed=seed)
+    game.load_rom(rom)
+    recorder = MovieRecorder(game, rom, seed, ips, timer_hz,
+                             keyframe_interval)
+    scheduler = Scheduler(game, ips, timer_hz)
+
+    def run_to(target):
+        while game.cycles < target:
+            reason, _ = scheduler.run_cycles(
+                min(target - game.cycles, keyframe_interval or target))
+            recorder.update()
+            if reason != STOP_CYCLES:
+                return False
+        return True
+
+    for cycle, key, pressed in events:
+        if cycle > cycles or not run_to(cycle):
+            break
+        recorder.set_key(key, pressed)
+    run_to(cycles)
+    return recorder.movie
@@ -0,0 +1,427 @@
+import time
+from array import array
+
+from chip8 import CHIP8
+from disasm import disassemble
+
+__all__ = ['HandlerProfiler', 'AddressProfiler', 'get_opcode_pattern']
+
+# Группы команд, которые в таблицах CHIP8 разбираются второй таблицей или
+# второй проверкой: в collapsed stacks они становятся общим кадром
+FAMILIES = {0x0: "00**", 0x8: "8XY*", 0xe: "EX**", 0xf: "FX**"}
+# Команды вида <код><аргументы>
+ARGUMENTS = {0x1: "NNN", 0x2: "NNN", 0x3: "XNN", 0x4: "XNN", 0x5: "XY0",
+             0x6: "XNN", 0x7: "XNN", 0x9: "XY0", 0xa: "NNN", 0xb: "NNN",
+             0xc: "XNN", 0xd: "XYN"}
+
+
+def get_opcode_pattern(opcode):
+    """
+    Название команды в обычной записи, например DXYN, 8XY4 или FX33
+    :param opcode: 16 битный опкод
+    :return: строка
+    """
+    operation = opcode >> 12
+    if operation in ARGUMENTS:
+        return "{:X}{}".format(operation, ARGUMENTS[operation])
+    if operation == 0x0:
+        if opcode in (0x00E0, 0x00EE):
+            return "{:04X}".format(opcode)
+        return "0NNN"
+    if operation == 0x8:
+        return "8XY{:X}".format(opcode & 0xf)
+    return "{:X}X{:02X}".format(operation, opcode & 0xff)
+
+
+class ProfiledDecodeCache(dict):
+    """
+    Кэш декодированных команд, который при промахе декодирует команду и
+    кладёт в кэш обработчик, обёрнутый профилировщиком (profiler.wrap).
+    CHIP8.run и другие циклы читают кэш как обычно, поэтому проверок в
+    самом цикле нет
+    """
+
+    def __init__(self, game, profiler):
+        super().__init__()
+        self.game = game
+        self.profiler = profiler
+
+    def __missing__(self, pc):
+        memory = self.game.memory
+        opcode, handler = self.game.decode((memory[pc] << 8) | memory[pc + 1])
+        entry = (opcode, self.profiler.wrap(opcode, handler, pc))
+        self[pc] = entry
+        return entry
+
+
+class DecodeCacheProfiler:
+    """
+    Общая часть профилировщиков, которые на время работы подменяют кэш
+    декодированных команд машины на ProfiledDecodeCache. stop возвращает
+    обычный кэш, поэтому без профилировщика интерпретатор ничего не
+    тратит. Одновременно может работать только один профилировщик, и не
+    вместе с точками останова (breakpoints.py). Наследники определяют
+    wrap(opcode, handler, pc) - обёртку обработчика команды
+    :param game: экземпляр CHIP8
+    """
+
+    def __init__(self, game):
+        self.game = game
+        self.started = None
+        self.seconds = 0.0
+
+    @property
+    def enabled(self):
+        cache = self.game.decode_cache
+        return isinstance(cache, ProfiledDecodeCache) and \
+            cache.profiler is self
+
+    def start(self):
+        """
+        Включить профилирование: подменить кэш декодированных команд
+        :return:
+        """
+        if self.enabled:
+            return
+        if type(self.game.decode_cache) is not dict:
+            raise Exception("The decode cache is already replaced")
+        self.game.decode_cache = ProfiledDecodeCache(self.game, self)
+        self.started = time.perf_counter()
+
+    def stop(self):
+        """
+        Выключить профилирование и вернуть обычный кэш
+        :return:
+        """
+        if not self.enabled:
+            return
+        self.game.decode_cache = {}
+        self.seconds += time.perf_counter() - self.started
+        self.started = None
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, *_):
+        self.stop()
+
+
+class HandlerProfiler(DecodeCacheProfiler):
+    """
+    Профилировщик обработчиков команд: для каждой команды (DXYN, 8XY4...)
+    считает, сколько раз она выполнена и сколько наносекунд
+    (perf_counter_ns) на это ушло. Время обёртки (вызов часов) измеряется
+    заранее и вычитается. Блоки BlockCompiler обработчики не вызывают и
+    не профилируются
+    :param game: экземпляр CHIP8
+    """
+
+    def __init__(self, game):
+        super().__init__(game)
+        # Название команды -> [число выполнений, наносекунд, обработчик]
+        self.counters = {}
+        self.wrappers = {}
+        self.overhead_ns = self.calibrate()
+
+    @staticmethod
+    def make_wrapper(handler, counter):
+        clock = time.perf_counter_ns
+
+        def profiled(game):
+            start = clock()
+            handler(game)
+            counter[1] += clock() - start
+            counter[0] += 1
+        return profiled
+
+    def calibrate(self, calls=5000, repeat=5):
+        """
+        Сколько наносекунд обёртка добавляет к одному вызову (лучшее из
+        repeat измерений)
+        :return:
+        """
+        timings = []
+        for _ in range(repeat):
+            counter = [0, 0, None]
+            wrapper = self.make_wrapper(lambda game: None, counter)
+            for _ in range(calls):
+                wrapper(None)
+            timings.append(counter[1] / calls)
+        return min(timings)
+
+    def wrap(self, opcode, handler, pc=None):
+        """
+        Обёртка обработчика, считающая время и число вызовов
+        :param opcode: опкод, для которого вызывается обработчик
+        :param handler: функция из таблиц CHIP8
+        :param pc: адрес команды (не используется)
+        :return: функция с тем же интерфейсом
+        """
+        pattern = get_opcode_pattern(opcode)
+        wrapper = self.wrappers.get(pattern)
+        if wrapper is None:
+            counter = self.counters.setdefault(pattern, [0, 0, handler])
+            wrapper = self.make_wrapper(handler, counter)
+            self.wrappers[pattern] = wrapper
+        return wrapper
+
+    def reset(self):
+        for counter in self.counters.values():
+            counter[0] = counter[1] = 0
+        self.seconds = 0.0
+
+    def get_stats(self):
+        """
+        Результаты по командам, от самой затратной
+        :return: список словарей: команда, обработчик, число выполнений,
+                 суммарное и среднее время без обёртки и доля времени
+        """
+        rows = []
+        for pattern, (count, total_ns, handler) in self.counters.items():
+            if not count:
+                continue
+            own_ns = max(total_ns - count * self.overhead_ns, 0)
+            rows.append({
+                "opcode": pattern,
+                "handler": handler.__name__,
+                "count": count,
+                "total_ns": own_ns,
+                "mean_ns": own_ns / count,
+            })
+        total = sum(row["total_ns"] for row in rows) or 1
+        for row in rows:
+            row["share"] = row["total_ns"] / total
+        rows.sort(key=lambda row: row["total_ns"], reverse=True)
+        return rows
+
+    def format_table(self):
+        """
+        Результаты get_stats в виде текстовой таблицы
+        :return: строка
+        """
+        lines = ["{:6} {:28} {:>10} {:>12} {:>9} {:>7}".format(
+            "opcode", "handler", "count", "total ms", "mean ns", "share")]
+        for row in self.get_stats():
+            lines.append(
+                "{opcode:6} {handler:28} {count:10} {total_ms:12.2f} "
+                "{mean_ns:9.0f} {share:7.1%}".format(
+                    total_ms=row["total_ns"] / 1e6, **row))
+        lines.append("wrapper overhead {:.0f} ns per call (subtracted)"
+                     .format(self.overhead_ns))
+        return "\n".join(lines)
+
+    def to_json(self):
+        """
+        Результаты для сохранения в JSON
+        :return: словарь
+        """
+        return {
+            "seconds": self.seconds,
+            "overhead_ns": self.overhead_ns,
+            "handlers": self.get_stats(),
+        }
+
+    def to_collapsed(self, root="CHIP8.run"):
+        """
+        Результаты в формате collapsed stacks (для flamegraph.pl,
+        speedscope и т.п.): строка "кадр;кадр;кадр наносекунды" на
+        команду. Команды 8XY*, FX**, EX** и 00** собраны под общим кадром
+        :param root: корневой кадр
+        :return: строка
+        """
+        lines = []
+        for row in self.get_stats():
+            frames = [root]
+            family = FAMILIES.get(int(row["opcode"][0], 16))
+            if family is not None:
+                frames.append(family)
+            frames.append("{} {}".format(row["opcode"], row["handler"]))
+            lines.append("{} {}".format(";".join(frames),
+                                        round(row["total_ns"])))
+        return "\n".join(lines) + "\n"
+
+
+class AddressProfiler(DecodeCacheProfiler):
+    """
+    Профилировщик кода самой игры: сколько раз выполнена команда по
+    каждому адресу, сколько раз вызвана каждая подпрограмма (2NNN) и
+    сколько команд выполнено внутри неё вместе с вложенными вызовами (до
+    00EE). Счётчики - массивы на 4096 адресов, а теневой стек вызовов не
+    длиннее стека машины, поэтому память не растёт со временем работы и
+    профилировщик можно не выключать в долгих прогонах.
+    Если состояние машины загружено во время профилирования, теневой
+    стек выравнивается по SP при следующих 2NNN/00EE
+    :param game: экземпляр CHIP8
+    """
+
+    def __init__(self, game):
+        super().__init__(game)
+        size = len(game.memory)
+        self.hits = array('Q', bytes(8 * size))
+        self.calls = array('Q', bytes(8 * size))
+        self.inclusive = array('Q', bytes(8 * size))
+        # Число выполненных под профилировщиком команд (в списке, чтобы
+        # обёртки могли его менять)
+        self.clock = [0]
+        # Вызовы, из которых ещё нет возврата: (адрес подпрограммы,
+        # значение clock при входе)
+        self.frames = []
+
+    def wrap(self, opcode, handler, pc):
+        """
+        Обёртка обработчика команды по адресу pc
+        :param opcode: опкод
+        :param handler: функция из таблиц CHIP8
+        :param pc: адрес команды
+        :return: функция с тем же интерфейсом
+        """
+        hits = self.hits
+        clock = self.clock
+        frames = self.frames
+        if handler is CHIP8.call_subroutine:
+            calls = self.calls
+
+            def counted(game):
+                handler(game)
+                hits[pc] += 1
+                clock[0] += 1
+                target = game.pc
+                calls[target] += 1
+                del frames[game.sp - 1:]
+                frames.append((target, clock[0]))
+        elif handler is CHIP8.return_from_subroutine:
+            inclusive = self.inclusive
+
+            def counted(game):
+                handler(game)
+                hits[pc] += 1
+                clock[0] += 1
+                while len(frames) > game.sp:
+                    target, entered = frames.pop()
+                    # При рекурсии время учитывается только у внешнего
+                    # вызова
+                    if all(frame[0] != target for frame in frames):
+                        inclusive[target] += clock[0] - entered
+        else:
+            def counted(game):
+                handler(game)
+                hits[pc] += 1
+                clock[0] += 1
+        return counted
+
+    def start(self):
+        del self.frames[:]
+        super().start()
+
+    def reset(self):
+        for counters in (self.hits, self.calls, self.inclusive):
+            counters[:] = array('Q', bytes(8 * len(counters)))
+        self.clock[0] = 0
+        del self.frames[:]
+        self.seconds = 0.0
+
+    @property
+    def total(self):
+        return self.clock[0]
+
+    def get_hot_spots(self, count=10):
+        """
+        Адреса, на которых выполнено больше всего команд
+        :param count: сколько адресов вернуть
+        :return: список словарей: адрес, опкод, команда, число выполнений,
+                 доля
+        """
+        memory = self.game.memory
+        addresses = sorted((address for address, hits in enumerate(self.hits)
+                            if hits), key=lambda address: -self.hits[address])
+        rows = []
+        for address in addresses[:count]:
+            opcode = (memory[address] << 8) | memory[address + 1]
+            rows.append({
+                "address": address,
+                "opcode": opcode,
+                "instruction": disassemble(opcode),
+                "hits": self.hits[address],
+                "share": self.hits[address] / (self.total or 1),
+            })
+        return rows
+
+    def get_subroutines(self):
+        """
+        Вызванные подпрограммы, от самой затратной
+        :return: список словарей: адрес, число вызовов, число команд внутри
+                 с вложенными вызовами, доля от всех команд
+        """
+        rows = [{
+            "address": address,
+            "calls": calls,
+            "inclusive": self.inclusive[address],
+            "share": self.inclusive[address] / (self.total or 1),
+        } for address, calls in enumerate(self.calls) if calls]
+        rows.sort(key=lambda row: row["inclusive"], reverse=True)
+        return rows
+
+    def get_code_end(self, start):
+        """
+        Адрес после последнего ненулевого байта памяти или выполненной
+        команды
+        :return:
+        """
+        memory = self.game.memory
+        end = len(memory)
+        while end > start and not memory[end - 1] and not self.hits[end - 2]:
+            end -= 1
+        return end + end % 2
+
+    def format_listing(self, start=0x200, end=None, executed_only=False):
+        """
+        Листинг ROM: адрес, опкод и команда с числом выполнений и долей
+        от всех команд. Перед адресом подпрограммы выводится строка с
+        числом вызовов и командами внутри неё.
+        Кроме адресов start, start + 2, ... выводятся выполненные адреса
+        другой чётности (данные вперемешку с кодом)
+        :param start: первый адрес
+        :param end: адрес после последнего, по умолчанию - конец ROM
+        :param executed_only: выводить только выполненные команды
+        :return: строка
+        """
+        if end is None:
+            end = self.get_code_end(start)
+        memory = self.game.memory
+        total = self.total or 1
+        addresses = set(address for address in range(start, end)
+                        if self.hits[address])
+        if not executed_only:
+            addresses.update(range(start, end - 1, 2))
+        lines = ["{:>6}  {:4}  {:20} {:>10} {:>6}".format(
+            "addr", "code", "instruction", "hits", "share")]
+        for address in sorted(addresses):
+            if self.calls[address]:
+                lines.append("sub_{:03X}: {} calls, {} instructions inside "
+                             "({:.1%})".format(
+                                address, self.calls[address],
+                                self.inclusive[address],
+                                self.inclusive[address] / total))
+            opcode = (memory[address] << 8) | memory[address + 1]
+            hits = self.hits[address]
+            line = "{:6X}  {:04X}  {:20}".format(address, opcode,
+                                                disassemble(opcode))
+            if hits:
+                line += " {:10} {:6.1%}".format(hits, hits / total)
+            lines.append(line.rstrip())
+        return "\n".join(lines)
+
+    def to_json(self):
+        """
+        Результаты для сохранения в JSON
+        :return: словарь
+        """
+        return {
+            "seconds": self.seconds,
+            "instructions": self.total,
+            "addresses": {"{:03X}".format(address): hits
+                          for address, hits in enumerate(self.hits)
+                          if hits},
+            "subroutines": self.get_subroutines(),
+        }
@@ -0,0 +1,4 @@
+@echo off
+python bench.py suite %*
+python bench.py compare
+pause
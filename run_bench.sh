@@ -0,0 +1,2 @@
+#!/bin/bash
+python3 bench.py suite "$@" && python3 bench.py compare
@@ -0,0 +1,156 @@
+import time
+
+from chip8 import STOP_CYCLES, STOP_PAUSED
+
+__all__ = ['Scheduler', 'DEFAULT_IPS', 'DEFAULT_TIMER_HZ']
+
+# Сколько команд в секунду выполняет машина по умолчанию
+DEFAULT_IPS = 700
+# Частота таймеров задержки и звука
+DEFAULT_TIMER_HZ = 60
+
+
+class Scheduler:
+    """
+    Планировщик, который выполняет команды со скоростью ips команд в
+    секунду по настоящим часам: команды выполняются порциями (run_slice),
+    а между порциями поток спит до следующего срока (wait).
+    Таймеры уменьшаются timer_hz раз за ips команд, то есть по времени
+    машины, а не по часам: если компьютер не успевает, игра замедляется
+    целиком, и программа видит те же интервалы, что и без нагрузки.
+    Отставать больше чем на max_lag секунд машина не может: лишнее
+    отставание просто пропускается, чтобы игра потом не ускорялась рывком
+    :param game: экземпляр CHIP8
+    :param ips: команд в секунду
+    :param timer_hz: частота таймеров
+    :param tick: что вызывать для уменьшения таймеров, по умолчанию
+                 game.tick_timers (например, CheckpointStore.tick_timers)
+    :param runner: то, что выполняет команды: CHIP8 (по умолчанию) или
+                   BlockCompiler
+    :param max_lag: наибольшее отставание от часов в секундах
+    :param clock: функция, возвращающая время в секундах
+    :param sleep: функция сна
+    """
+
+    def __init__(self, game, ips=DEFAULT_IPS, timer_hz=DEFAULT_TIMER_HZ,
+                 tick=None, runner=None, max_lag=0.25,
+                 clock=time.perf_counter, sleep=time.sleep):
+        if ips <= 0 or timer_hz <= 0:
+            raise ValueError("ips and timer_hz must be positive")
+        self.game = game
+        self.ips = ips
+        self.timer_hz = timer_hz
+        self.tick = tick if tick is not None else game.tick_timers
+        self.runner = runner if runner is not None else game
+        self.max_lag = max_lag
+        self.clock = clock
+        self.sleep = sleep
+        # Сколько команд пропущено из-за отставания от часов
+        self.dropped_cycles = 0
+        self.reset_clock()
+
+    @property
+    def cycles_per_tick(self):
+        return self.ips / self.timer_hz
+
+    def reset_clock(self):
+        """
+        Начать отсчёт времени заново с текущего момента, например, после
+        паузы или перемотки
+        :return:
+        """
+        self.base_time = self.clock()
+        self.base_cycles = self.game.cycles
+
+    def get_next_tick(self):
+        """
+        Номер команды, после которой таймеры уменьшатся в следующий раз.
+        Тики приходятся на команды с номерами ceil(k * ips / timer_hz)
+        :return:
+        """
+        ticks = self.game.cycles * self.timer_hz // self.ips
+        return -(-(ticks + 1) * self.ips // self.timer_hz)
+
+    def run_cycles(self, n_cycles):
+        """
+        Выполнить n_cycles команд, уменьшая таймеры в нужных местах
+        :param n_cycles: число команд
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        game = self.game
+        reason = STOP_CYCLES
+        executed = 0
+        while executed < n_cycles:
+            next_tick = self.get_next_tick()
+            budget = min(n_cycles - executed, next_tick - game.cycles)
+            reason, done = self.runner.run(budget)
+            executed += done
+            if game.cycles == next_tick:
+                self.tick()
+            if reason != STOP_CYCLES:
+                break
+        return reason, executed
+
+    def run_frame(self):
+        """
+        Выполнить команды до следующего уменьшения таймеров включительно
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        return self.run_cycles(self.get_next_tick() - self.game.cycles)
+
+    def run_slice(self):
+        """
+        Выполнить столько команд, сколько машина должна была успеть к
+        текущему моменту
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        now = self.clock()
+        target = self.base_cycles + int((now - self.base_time) * self.ips)
+        behind = target - self.game.cycles
+        max_behind = int(self.max_lag * self.ips)
+        if behind > max_behind:
+            self.dropped_cycles += behind - max_behind
+            self.base_cycles -= behind - max_behind
+            behind = max_behind
+        elif behind < -max_behind:
+            # Номер команды прыгнул вперёд (например, загружено состояние)
+            self.reset_clock()
+            behind = 0
+        reason, executed = self.run_cycles(behind)
+        if reason == STOP_PAUSED:
+            # Пока игра стоит, долг по командам не копится
+            self.reset_clock()
+        return reason, executed
+
+    def get_delay(self):
+        """
+        Сколько секунд осталось до момента, когда наберётся команд на один
+        тик таймеров (например, для asyncio.sleep)
+        :return:
+        """
+        due = self.game.cycles + self.cycles_per_tick - self.base_cycles
+        return max(self.base_time + due / self.ips - self.clock(), 0)
+
+    def wait(self):
+        """
+        Поспать до момента, когда наберётся команд на один тик таймеров
+        :return:
+        """
+        delay = self.get_delay()
+        if delay > 0:
+            self.sleep(delay)
+
+    def run(self, is_running, after_slice=None):
+        """
+        Выполнять порции команд, пока is_running() истинно
+        :param is_running: функция без аргументов
+        :param after_slice: функция, вызываемая после каждой порции с
+                            парой (причина остановки, число команд)
+        :return:
+        """
+        self.reset_clock()
+        while is_running():
+            result = self.run_slice()
+            if after_slice is not None:
+                after_slice(*result)
+            self.wait()
@@ -0,0 +1,500 @@
+import argparse
+import asyncio
+import json
+import os
+import socket
+import struct
+import sys
+import time
+
+from chip8 import CHIP8, STOP_PAUSED
+from display import WIDTH, HEIGHT
+from framebuffer import FRAME_SIZE
+from scheduler import Scheduler, DEFAULT_IPS, DEFAULT_TIMER_HZ
+
+__all__ = ['Session', 'Subscriber', 'FrameServer', 'FrameClient',
+           'DEFAULT_PORT', 'main']
+
+DEFAULT_PORT = 8765
+# Сообщение сервера: тип и длина данных. Кадр - номер кадра, номер
+# команды и кадр в формате Display.tobytes; статистика - JSON
+MESSAGE_HEADER = struct.Struct('<cI')
+FRAME_HEADER = struct.Struct('<QQ')
+MESSAGE_FRAME = b'F'
+MESSAGE_STATS = b'S'
+FRAME_MESSAGE_SIZE = MESSAGE_HEADER.size + FRAME_HEADER.size + FRAME_SIZE
+# Сколько байт может ждать отправки одному зрителю, прежде чем сервер
+# перестанет писать ему и начнёт пропускать кадры. Буферы сокетов тоже
+# уменьшаются, иначе медленный зритель накопил бы в них сотни старых
+# кадров и видел бы игру с опозданием
+WRITE_BUFFER_LIMIT = 4 * FRAME_MESSAGE_SIZE
+SOCKET_BUFFER_SIZE = 4 * FRAME_MESSAGE_SIZE
+
+
+def make_message(kind, payload):
+    return MESSAGE_HEADER.pack(kind, len(payload)) + payload
+
+
+class Subscriber:
+    """
+    Зритель сессии. Для него хранится только самый новый ещё не
+    отправленный кадр: пока зритель не успевает читать, новые кадры
+    заменяют неотправленный, и тот считается пропущенным, так что
+    медленный зритель не задерживает ни игру, ни других зрителей
+    :param writer: asyncio.StreamWriter
+    """
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.pending = None
+        self.ready = asyncio.Event()
+        self.sent = 0
+        self.dropped = 0
+
+    def offer(self, message):
+        if self.pending is not None:
+            self.dropped += 1
+        self.pending = message
+        self.ready.set()
+
+    async def send_frames(self):
+        """
+        Отправлять кадры, пока зритель не отключится
+        :return:
+        """
+        try:
+            while True:
+                await self.ready.wait()
+                self.ready.clear()
+                message, self.pending = self.pending, None
+                self.writer.write(message)
+                await self.writer.drain()
+                self.sent += 1
+        except ConnectionError:
+            pass
+
+
+class Session:
+    """
+    Игра, которую смотрят зрители: выполняется в реальном времени
+    (Scheduler) внутри цикла asyncio и на каждом тике таймеров рассылает
+    кадр, если он изменился
+    :param rom: путь к ROM файлу
+    :param ips: команд в секунду
+    :param timer_hz: частота таймеров
+    :param seed: зерно генератора случайных чисел
+    """
+
+    def __init__(self, rom, ips=DEFAULT_IPS, timer_hz=DEFAULT_TIMER_HZ,
+                 seed=None):
+        self.rom = rom
+        self.game = CHIP8(seed=seed)
+        self.game.load_rom(rom)
+        self.scheduler = Scheduler(self.game, ips, timer_hz,
+                                   tick=self.tick)
+        self.subscribers = set()
+        self.frame_number = 0
+        self.message = None
+        self.started = None
+        self.make_frame_message()
+
+    def make_frame_message(self):
+        self.frame_number += 1
+        payload = FRAME_HEADER.pack(self.frame_number, self.game.cycles) + \
+            self.game.display.tobytes()
+        self.message = make_message(MESSAGE_FRAME, payload)
+
+    def tick(self):
+        self.game.tick_timers()
+        self.publish()
+
+    def publish(self):
+        """
+        Разослать кадр, если он изменился с прошлой рассылки
+        :return:
+        """
+        if not self.game.display.take_dirty()[0]:
+            return
+        self.make_frame_message()
+        for subscriber in self.subscribers:
+            subscriber.offer(self.message)
+
+    def subscribe(self, writer):
+        """
+        Добавить зрителя; он сразу получает текущий кадр
+        :param writer: asyncio.StreamWriter
+        :return: Subscriber
+        """
+        subscriber = Subscriber(writer)
+        subscriber.offer(self.message)
+        self.subscribers.add(subscriber)
+        return subscriber
+
+    def set_key(self, key, pressed):
+        self.game.keys[key] = pressed
+
+    async def run(self):
+        """
+        Выполнять игру, пока она не остановится
+        :return:
+        """
+        scheduler = self.scheduler
+        scheduler.reset_clock()
+        self.started = time.perf_counter()
+        while self.game.running:
+            reason, _ = scheduler.run_slice()
+            if reason == STOP_PAUSED:
+                self.publish()
+            await asyncio.sleep(scheduler.get_delay())
+
+    def get_stats(self):
+        """
+        Скорость игры и счётчики зрителей
+        :return: словарь
+        """
+        seconds = time.perf_counter() - self.started if self.started \
+            else 0
+        return {
+            "rom": self.rom,
+            "cycles": self.game.cycles,
+            "cycles_per_second": self.game.cycles / seconds
+            if seconds else None,
+            "dropped_cycles": self.scheduler.dropped_cycles,
+            "frames": self.frame_number,
+            "viewers": len(self.subscribers),
+            "sent": sum(s.sent for s in self.subscribers),
+            "dropped": sum(s.dropped for s in self.subscribers),
+        }
+
+
+class FrameServer:
+    """
+    TCP сервер, на котором идут одна или несколько сессий. Клиент шлёт
+    текстовые строки: "WATCH <сессия>" - смотреть сессию (по умолчанию
+    первую), "KEY <клавиша 0-f> <1|0>" - нажать или отпустить клавишу в
+    этой сессии, "STATS" - получить статистику всех сессий. Сервер шлёт
+    сообщения MESSAGE_HEADER: кадры (MESSAGE_FRAME) и статистику
+    (MESSAGE_STATS)
+    :param sessions: словарь имя -> Session
+    """
+
+    def __init__(self, sessions):
+        if not sessions:
+            raise ValueError("at least one session is needed")
+        self.sessions = sessions
+        self.server = None
+        self.tasks = []
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """
+        Запустить сессии и начать принимать клиентов
+        :return: номер порта (полезно, если port=0)
+        """
+        self.tasks = [asyncio.ensure_future(session.run())
+                      for session in self.sessions.values()]
+        self.server = await asyncio.start_server(self.handle_client,
+                                                 host, port)
+        return self.server.sockets[0].getsockname()[1]
+
+    async def stop(self):
+        for session in self.sessions.values():
+            session.game.running = False
+        self.server.close()
+        await self.server.wait_closed()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+
+    def get_stats(self):
+        return {name: session.get_stats()
+                for name, session in self.sessions.items()}
+
+    async def handle_client(self, reader, writer):
+        writer.transport.set_write_buffer_limits(high=WRITE_BUFFER_LIMIT)
+        writer.get_extra_info('socket').setsockopt(
+            socket.SOL_SOCKET, socket.SO_SNDBUF, SOCKET_BUFFER_SIZE)
+        session = next(iter(self.sessions.values()))
+        subscriber = None
+        sender = None
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                words = line.decode("ascii", "replace").split()
+                if not words:
+                    continue
+                command = words[0].upper()
+                if command == "WATCH" and subscriber is None:
+                    if len(words) > 1:
+                        session = self.sessions.get(words[1])
+                        if session is None:
+                            break
+                    subscriber = session.subscribe(writer)
+                    sender = asyncio.ensure_future(subscriber.send_frames())
+                elif command == "KEY" and len(words) == 3:
+                    try:
+                        key = int(words[1], 16)
+                    except ValueError:
+                        continue
+                    if 0 <= key < 16:
+                        session.set_key(key, words[2] == "1")
+                elif command == "STATS":
+                    writer.write(make_message(
+                        MESSAGE_STATS, json.dumps(self.get_stats()).encode()))
+        except ConnectionError:
+            pass
+        finally:
+            if subscriber is not None:
+                session.subscribers.discard(subscriber)
+                sender.cancel()
+            writer.close()
+
+
+class FrameClient:
+    """
+    Клиент FrameServer
+    """
+
+    def __init__(self):
+        self.reader = None
+        self.writer = None
+
+    async def connect(self, host="127.0.0.1", port=DEFAULT_PORT,
+                      session=None):
+        """
+        Подключиться и начать смотреть сессию
+        :param session: имя сессии (None - первая)
+        :return:
+        """
+        sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        # Маленькие буферы приёма (в сокете и в StreamReader) - чтобы при
+        # медленном чтении кадры пропускал сервер, а не копились старые
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF,
+                        SOCKET_BUFFER_SIZE)
+        sock.setblocking(False)
+        await asyncio.get_running_loop().sock_connect(sock, (host, port))
+        self.reader, self.writer = await asyncio.open_connection(
+            sock=sock, limit=SOCKET_BUFFER_SIZE)
+        self.send_line("WATCH" if session is None
+                       else "WATCH {}".format(session))
+
+    def send_line(self, line):
+        self.writer.write(line.encode("ascii") + b"\n")
+
+    def send_key(self, key, pressed):
+        self.send_line("KEY {:x} {}".format(key, int(pressed)))
+
+    async def read_message(self):
+        """
+        :return: пара (тип, данные)
+        """
+        header = await self.reader.readexactly(MESSAGE_HEADER.size)
+        kind, size = MESSAGE_HEADER.unpack(header)
+        return kind, await self.reader.readexactly(size)
+
+    async def read_frame(self):
+        """
+        Дождаться следующего кадра (статистика пропускается)
+        :return: тройка (номер кадра, номер команды, кадр)
+        """
+        while True:
+            kind, payload = await self.read_message()
+            if kind == MESSAGE_FRAME:
+                number, cycle = FRAME_HEADER.unpack_from(payload)
+                return number, cycle, payload[FRAME_HEADER.size:]
+
+    async def get_stats(self):
+        """
+        Запросить статистику сервера (кадры, пришедшие до неё,
+        пропускаются)
+        :return: словарь
+        """
+        self.send_line("STATS")
+        while True:
+            kind, payload = await self.read_message()
+            if kind == MESSAGE_STATS:
+                return json.loads(payload.decode())
+
+    async def close(self):
+        self.writer.close()
+        await self.writer.wait_closed()
+
+
+def frame_to_text(frame):
+    """
+    Нарисовать кадр символами: две строки экрана на строку текста
+    :param frame: кадр в формате Display.tobytes
+    :return: строка
+    """
+    rows = [int.from_bytes(frame[y * 8:y * 8 + 8], 'big')
+            for y in range(HEIGHT)]
+    lines = []
+    for y in range(0, HEIGHT, 2):
+        line = []
+        for x in range(WIDTH - 1, -1, -1):
+            top = rows[y] >> x & 1
+            bottom = rows[y + 1] >> x & 1
+            line.append(" ▀▄█"[top | bottom << 1])
+        lines.append("".join(line))
+    return "\n".join(lines)
+
+
+async def serve(roms, host, port, ips, timer_hz):
+    sessions = {os.path.basename(rom): Session(rom, ips, timer_hz)
+                for rom in roms}
+    server = FrameServer(sessions)
+    port = await server.start(host, port)
+    print("serving {} on {}:{}".format(", ".join(sessions), host, port),
+          file=sys.stderr, flush=True)
+    await asyncio.gather(*server.tasks)
+
+
+async def watch(host, port, session, frames):
+    client = FrameClient()
+    await client.connect(host, port, session)
+    shown = 0
+    try:
+        while frames is None or shown < frames:
+            number, cycle, frame = await client.read_frame()
+            # Курсор в левый верхний угол терминала
+            sys.stdout.write("\x1b[H{}\nframe {} cycle {}\n".format(
+                frame_to_text(frame), number, cycle))
+            sys.stdout.flush()
+            shown += 1
+    finally:
+        await client.close()
+
+
+async def count_frames(client, counts, numbers, index, delay):
+    while True:
+        numbers[index] = (await client.read_frame())[0]
+        counts[index] += 1
+        if delay:
+            await asyncio.sleep(delay)
+
+
+async def load_test(rom, viewers, seconds, ips, slow, slow_delay):
+    """
+    Запустить сервер в отдельном процессе, подключить viewers зрителей
+    (из них slow медленных, которые ждут slow_delay секунд после каждого
+    кадра) и посчитать, сколько кадров получает каждый и насколько
+    отстаёт самый медленный
+    :return: словарь с результатами
+    """
+    process = await asyncio.create_subprocess_exec(
+        sys.executable, os.path.abspath(__file__), "serve", rom,
+        "--port", "0", "--ips", str(ips), stderr=asyncio.subprocess.PIPE)
+    try:
+        line = (await process.stderr.readline()).decode()
+        port = int(line.rsplit(":", 1)[1])
+        clients = []
+        for _ in range(viewers):
+            client = FrameClient()
+            await client.connect(port=port)
+            clients.append(client)
+        counts = [0] * viewers
+        # Номер последнего полученного кадра - насколько зритель отстаёт
+        numbers = [0] * viewers
+        tasks = [asyncio.ensure_future(count_frames(
+            client, counts, numbers, index,
+            slow_delay if index < slow else 0))
+            for index, client in enumerate(clients)]
+        await asyncio.sleep(seconds)
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        control = FrameClient()
+        await control.connect(port=port)
+        stats = (await control.get_stats())[os.path.basename(rom)]
+        await control.close()
+        for client in clients:
+            await client.close()
+    finally:
+        process.terminate()
+        await process.wait()
+    fast = counts[slow:] or [0]
+    return {
+        "viewers": viewers,
+        "slow_viewers": slow,
+        "frames_published_per_second": stats["frames"] / seconds,
+        "fast_viewer_fps_min": min(fast) / seconds,
+        "fast_viewer_fps_mean": sum(fast) / len(fast) / seconds,
+        "slow_viewer_fps_mean": sum(counts[:slow]) / slow / seconds
+        if slow else None,
+        "max_lag_frames": max(numbers) - min(numbers),
+        "dropped": stats["dropped"],
+        "server_cycles_per_second": stats["cycles_per_second"],
+        "server_dropped_cycles": stats["dropped_cycles"],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        usage='{} command'.format(os.path.basename(sys.argv[0])),
+        description='Stream CHIP8 sessions to remote viewers over TCP.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    serve_parser = commands.add_parser(
+        'serve', help='run ROMs and stream their frames',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    serve_parser.add_argument('roms', nargs='+',
+                              help='ROM files, one session per ROM named '
+                                   'after the file')
+    serve_parser.add_argument('--host', type=str, default='127.0.0.1')
+    serve_parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT,
+                              help='TCP port, 0 for any free port')
+    serve_parser.add_argument('-i', '--ips', type=int, default=DEFAULT_IPS,
+                              help='instructions executed per second')
+    serve_parser.add_argument('-t', '--timer-hz', type=int,
+                              default=DEFAULT_TIMER_HZ,
+                              help='timer frequency')
+
+    watch_parser = commands.add_parser(
+        'watch', help='show a session in the terminal',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    watch_parser.add_argument('--host', type=str, default='127.0.0.1')
+    watch_parser.add_argument('-p', '--port', type=int, default=DEFAULT_PORT)
+    watch_parser.add_argument('-s', '--session', type=str, default=None,
+                              help='session name (default: the first one)')
+    watch_parser.add_argument('-f', '--frames', type=int, default=None,
+                              help='exit after this many frames')
+
+    load = commands.add_parser(
+        'loadtest', help='measure how many viewers one server process '
+                         'can feed',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    load.add_argument('rom', type=str, help='way to rom file')
+    load.add_argument('-n', '--viewers', type=int, nargs='+',
+                      default=[1, 10, 100, 500],
+                      help='numbers of concurrent viewers to try')
+    load.add_argument('--seconds', type=float, default=5,
+                      help='duration of each run')
+    load.add_argument('-i', '--ips', type=int, default=DEFAULT_IPS,
+                      help='instructions executed per second')
+    load.add_argument('--slow', type=int, default=0,
+                      help='how many of the viewers read slowly')
+    load.add_argument('--slow-delay', type=float, default=0.1,
+                      help='seconds a slow viewer waits after each frame')
+
+    args = parser.parse_args(argv)
+    if args.command == 'serve':
+        asyncio.run(serve(args.roms, args.host, args.port, args.ips,
+                          args.timer_hz))
+    elif args.command == 'watch':
+        sys.stdout.write("\x1b[2J")
+        try:
+            asyncio.run(watch(args.host, args.port, args.session,
+                              args.frames))
+        except KeyboardInterrupt:
+            pass
+    elif args.command == 'loadtest':
+        for viewers in args.viewers:
+            result = asyncio.run(load_test(
+                args.rom, viewers, args.seconds, args.ips,
+                min(args.slow, viewers), args.slow_delay))
+            print(json.dumps(result))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,71 @@
+import json
+import os
+import shutil
+import tempfile
+import unittest
+
+from batch import make_jobs, run_job, load_completed, run_batch, parse_seeds
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAZE = os.path.join(ROOT, "games", "MAZE")
+
+
+class TestBatch(unittest.TestCase):
+    def test_parse_seeds(self):
+        self.assertEqual([0, 1, 2, 7], parse_seeds("0-2,7"))
+
+    def test_run_job(self):
+        job, = make_jobs([MAZE], [3], [None], 500)
+        first, second = run_job(job), run_job(job)
+        self.assertEqual(500, first["cycles"])
+        self.assertEqual(first["frame_sha1"], second["frame_sha1"])
+        self.assertEqual(first["registers"], second["registers"])
+
+    def test_bad_rom_reports_error(self):
+        job, = make_jobs([os.path.join(ROOT, "no such rom")], [0], [None], 10)
+        self.assertIn("error", run_job(job))
+
+    def test_resume(self):
+        jobs = make_jobs([MAZE], [0, 1, 2], [None], 200)
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.jsonl")
+            with open(output, "w") as file:
+                file.write(json.dumps(run_job(jobs[0])) + "\n")
+                file.write('{"id": "interrupted')
+            self.assertEqual({jobs[0]["id"]}, load_completed(output))
+
+            results = list(run_batch(jobs, output, workers=2))
+            self.assertEqual({job["id"] for job in jobs[1:]},
+                             {result["id"] for result in results})
+            with open(output) as file:
+                lines = [json.loads(line) for line in file]
+            self.assertEqual(3, len(lines))
+            self.assertEqual([], list(run_batch(jobs, output, workers=2)))
+
+    def test_line_without_newline_is_not_completed(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "results.jsonl")
+            with open(output, "w") as file:
+                file.write('{"id": "first"}\n{"id": "second"}')
+            self.assertEqual({"first"}, load_completed(output))
+            with open(output) as file:
+                self.assertEqual('{"id": "first"}\n', file.read())
+
+    def test_failed_job_is_retried(self):
+        with tempfile.TemporaryDirectory() as directory:
+            rom = os.path.join(directory, "MAZE")
+            output = os.path.join(directory, "results.jsonl")
+            jobs = make_jobs([rom], [0], [None], 100)
+            failed, = run_batch(jobs, output, workers=1)
+            self.assertIn("error", failed)
+            self.assertEqual(set(), load_completed(output))
+
+            shutil.copy(MAZE, rom)
+            result, = run_batch(jobs, output, workers=1)
+            self.assertNotIn("error", result)
+            self.assertEqual({jobs[0]["id"]}, load_completed(output))
+            self.assertEqual([], list(run_batch(jobs, output, workers=1)))
+
+
+if __name__ == '__main__':
+    unittest.main()
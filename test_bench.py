@@ -0,0 +1,60 @@
+import os
+import unittest
+
+from bench import compare_runs, find_run, get_suite_inputs, measure_rom
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAZE = os.path.join(ROOT, "games", "MAZE")
+
+
+def make_run(label, cycles_per_second, median_ns):
+    return {
+        "label": label,
+        "roms": {"MAZE": {"cycles_per_second": cycles_per_second,
+                          "seconds": 1.0}},
+        "micro": {"emulate_cycle": {"median_ns": median_ns}},
+    }
+
+
+class TestBench(unittest.TestCase):
+    def test_suite_inputs(self):
+        events = get_suite_inputs(3000, 10)
+        self.assertEqual([(600, 0, True), (900, 0, False),
+                          (1200, 1, True), (1500, 1, False),
+                          (1800, 2, True), (2100, 2, False),
+                          (2400, 3, True), (2700, 3, False)], events)
+
+    def test_measure_rom(self):
+        result = measure_rom(MAZE, 2000)
+        self.assertEqual(2000, result["cycles"])
+        self.assertGreater(result["cycles_per_second"], 0)
+        self.assertLessEqual(result["median_cycle_ns"],
+                             result["p99_cycle_ns"])
+
+    def test_compare_flags_regressions(self):
+        base = make_run("base", 1000, 100)
+        head = make_run("head", 850, 105)
+        rows = {name: (change, regression) for name, _, _, change, regression
+                in compare_runs(base, head, 0.1)}
+        # Время в секундах не сравнивается
+        self.assertEqual({"roms/MAZE/cycles_per_second",
+                          "micro/emulate_cycle/median_ns"}, set(rows))
+        self.assertAlmostEqual(-0.15, rows["roms/MAZE/cycles_per_second"][0])
+        self.assertTrue(rows["roms/MAZE/cycles_per_second"][1])
+        # Время выросло на 5% - изменение отрицательно, но в пределах порога
+        self.assertAlmostEqual(-0.05,
+                               rows["micro/emulate_cycle/median_ns"][0])
+        self.assertFalse(rows["micro/emulate_cycle/median_ns"][1])
+
+    def test_find_run(self):
+        runs = [make_run("a", 1, 1), make_run("b", 2, 2)]
+        self.assertIs(runs[1], find_run(runs, "-1"))
+        self.assertIs(runs[0], find_run(runs, "a"))
+        with self.assertRaises(Exception):
+            find_run(runs, "c")
+        with self.assertRaises(Exception):
+            find_run(runs, "5")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,149 @@
+import json
+import os
+import tempfile
+import unittest
+
+from breakpoints import Breakpoints, Condition
+from chip8 import CHIP8, STOP_BREAKPOINT, STOP_CYCLES, STOP_WATCHPOINT
+from headless import main
+from profiler import HandlerProfiler
+from scheduler import Scheduler
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BRIX = os.path.join(ROOT, "games", "BRIX")
+
+
+def make_game(program):
+    game = CHIP8()
+    game.memory[0x200:0x200 + len(program)] = bytes(program)
+    return game
+
+
+# 200: V3 += 1; 202: I = 0x300; 204: F333 (BCD V3 в 300-302); 206: JP 200
+COUNTER = (0x73, 0x01, 0xA3, 0x00, 0xF3, 0x33, 0x12, 0x00)
+
+
+class TestBreakpoints(unittest.TestCase):
+    def test_pc_breakpoint_stops_before_instruction(self):
+        game = make_game(COUNTER)
+        breakpoints = Breakpoints(game)
+        breakpoints.add(0x204)
+        self.assertEqual((STOP_BREAKPOINT, 2), game.run(100))
+        self.assertEqual(0x204, game.pc)
+        self.assertEqual(2, game.cycles)
+        self.assertEqual(0, game.memory[0x302])
+        # Продолжение выполняет команду, на которой стояли
+        self.assertEqual((STOP_BREAKPOINT, 4), game.run(100))
+        self.assertEqual(6, game.cycles)
+        self.assertEqual((2, 1), (game.v[3], game.memory[0x302]))
+        self.assertEqual({"reason": STOP_BREAKPOINT, "pc": 0x204,
+                          "breakpoint": "pc 0x204", "address": None},
+                         breakpoints.last_hit)
+        breakpoints.remove(0x204)
+        self.assertEqual((STOP_CYCLES, 100), game.run(100))
+
+    def test_condition_and_opcode_class(self):
+        game = make_game(COUNTER)
+        breakpoints = Breakpoints(game)
+        breakpoints.add(0x206, "V3 == 7 and I == 0x300")
+        self.assertEqual(STOP_BREAKPOINT, game.run(1000)[0])
+        self.assertEqual(7, game.v[3])
+        breakpoints.clear()
+        breakpoints.add_opcode("fx33", "V3 >= 10")
+        self.assertEqual(STOP_BREAKPOINT, game.run(1000)[0])
+        self.assertEqual((0x204, 10), (game.pc, game.v[3]))
+        self.assertEqual("FX33 if V3 >= 10",
+                         breakpoints.last_hit["breakpoint"])
+        with self.assertRaises(ValueError):
+            Condition("V3 = 7")
+        with self.assertRaises(ValueError):
+            breakpoints.add_opcode("1234")
+
+    def test_watchpoint_stops_after_write(self):
+        game = make_game(COUNTER)
+        breakpoints = Breakpoints(game)
+        breakpoints.watch(0x302)
+        self.assertEqual((STOP_WATCHPOINT, 3), game.run(100))
+        self.assertEqual((0x206, 1), (game.pc, game.memory[0x302]))
+        self.assertEqual(0x302, breakpoints.last_hit["address"])
+        self.assertEqual(0x204, breakpoints.last_hit["pc"])
+        with breakpoints.suspended():
+            self.assertEqual((STOP_CYCLES, 40), game.run(40))
+        with self.assertRaises(Exception):
+            game.emulate_cycle(0xF355)
+        self.assertEqual(44, game.cycles)
+
+    def test_same_result_as_without_breakpoints(self):
+        states = []
+        for add_breakpoints in (False, True):
+            game = CHIP8(seed=2)
+            game.load_rom(BRIX)
+            scheduler = Scheduler(game)
+            if add_breakpoints:
+                breakpoints = Breakpoints(game)
+                for text in ("0x248", "DXYN if V6 == 9", "write 0x30E-0x310"):
+                    breakpoints.add_text(text)
+            stops = 0
+            while game.cycles < 20000:
+                reason, _ = scheduler.run_cycles(20000 - game.cycles)
+                stops += reason != STOP_CYCLES
+            states.append(game.save_state())
+        self.assertGreater(stops, 10)
+        self.assertEqual(states[0], states[1])
+
+    def test_load_state_checks_the_instruction_again(self):
+        game = make_game(COUNTER)
+        state = game.save_state()
+        Breakpoints(game).add(0x200)
+        self.assertEqual((STOP_BREAKPOINT, 0), game.run(10))
+        game.load_state(state)
+        self.assertEqual((STOP_BREAKPOINT, 0), game.run(10))
+
+    def test_text_format(self):
+        breakpoints = Breakpoints(CHIP8())
+        texts = ["pc 0x248", "pc 0x24A if V3 == 7", "00E0", "DXYN",
+                 "FX33 if I >= 0x300", "write 0x30E", "write 0x300-0x30F"]
+        for text in texts:
+            breakpoints.add_text(text)
+        self.assertEqual(texts, breakpoints.describe())
+        breakpoints.add_text("0x248 if DT != 0")
+        self.assertEqual("pc 0x248 if DT != 0", breakpoints.describe()[0])
+        for text in texts:
+            breakpoints.remove_text(text)
+        self.assertEqual([], breakpoints.describe())
+        for text in ("write 0x300 if V0 == 1", "0x1000", "0x200-0x300",
+                     "zzz"):
+            with self.assertRaises(ValueError):
+                breakpoints.add_text(text)
+
+    def test_clone_and_profiler(self):
+        game = make_game(COUNTER)
+        breakpoints = Breakpoints(game)
+        breakpoints.add(0x202)
+        game.run(1)
+        with self.assertRaises(Exception):
+            HandlerProfiler(game).start()
+        with self.assertRaises(Exception):
+            Breakpoints(game)
+        clone = game.clone()
+        self.assertIsNone(clone.breakpoints)
+        self.assertEqual((STOP_CYCLES, 10), clone.run(10))
+        breakpoints.detach()
+        self.assertIs(dict, type(game.decode_cache))
+        self.assertEqual((STOP_CYCLES, 10), game.run(10))
+
+    def test_headless(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "report.json")
+            main(["run", BRIX, "-c", "100000", "-s", "0", "-b", "FX33",
+                  "-o", path])
+            with open(path) as file:
+                report = json.load(file)
+        self.assertEqual(STOP_BREAKPOINT, report["stats"]["stop_reason"])
+        self.assertEqual("FX33", report["breakpoint"]["breakpoint"])
+        self.assertEqual(str(report["breakpoint"]["pc"]),
+                         report["registers"]["pc"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+import os
+import random
+import unittest
+
+from checkpoints import CheckpointStore
+from chip8 import CHIP8
+
+BRIX = os.path.join(os.path.dirname(os.path.abspath(__file__)), "games",
+                    "BRIX")
+
+
+def without_draw_flag(state):
+    # После перемотки draw_flag ставится, чтобы экран перерисовался
+    state = bytearray(state)
+    state[18] = 0
+    return state
+
+
+class TestCheckpointStore(unittest.TestCase):
+    def play(self, frames, **options):
+        """
+        Сыграть frames кадров со случайными нажатиями, запоминая состояние
+        после каждого кадра
+        """
+        game = CHIP8(seed=2)
+        game.load_rom(BRIX)
+        store = CheckpointStore(game, **options)
+        rnd = random.Random(0)
+        history = {}
+        for _ in range(frames):
+            if rnd.random() < 0.1:
+                store.set_key(rnd.choice([4, 6]), rnd.random() < 0.5)
+            history[game.cycles] = game.save_state()
+            game.run(10)
+            store.tick_timers()
+            store.update()
+        return game, store, history
+
+    def assert_seek(self, game, store, history, cycle):
+        store.seek(cycle)
+        self.assertEqual(without_draw_flag(history[cycle]),
+                         without_draw_flag(game.save_state()), cycle)
+
+    def test_seek_is_exact(self):
+        game, store, history = self.play(500, interval=300,
+                                         keyframe_interval=4)
+        self.assertGreater(store.get_stats()["uncompressed_bytes"],
+                           store.stored_bytes)
+        for cycle in (4990, 3000, 2990, 1230, 10, 0):
+            self.assert_seek(game, store, history, cycle)
+        self.assertEqual(1, len(store.checkpoints))
+        self.assertIsNotNone(store.get_stats()["last_seek_ms"])
+
+    def test_new_timeline_after_seek(self):
+        game, store, history = self.play(200, interval=300)
+        store.seek(1000)
+        store.set_key(5, True)
+        game.run(10)
+        store.tick_timers()
+        store.update()
+        changed = game.save_state()
+        game.run(2000)
+        store.update()
+        store.seek(1010)
+        self.assertEqual(without_draw_flag(changed),
+                         without_draw_flag(game.save_state()))
+        with self.assertRaises(Exception):
+            store.seek(game.cycles + 1)
+
+    def test_memory_limit_drops_oldest(self):
+        game, store, history = self.play(1000, interval=200,
+                                         max_bytes=30000)
+        self.assertLessEqual(store.stored_bytes, 30000)
+        self.assertGreater(store.oldest_cycle, 0)
+        self.assert_seek(game, store, history, store.oldest_cycle + 50)
+        store.step_back(10 ** 6)
+        self.assertEqual(store.oldest_cycle, game.cycles)
+
+
+if __name__ == '__main__':
+    unittest.main()
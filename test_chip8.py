@@ -1,7 +1,9 @@
+import os
 import unittest
 from unittest.mock import patch
 
-from chip8 import CHIP8
+from chip8 import CHIP8, STOP_CYCLES, STOP_PAUSED, STOP_PC, STOP_DRAW, \
+    STOP_SOUND, STOP_KEY_WAIT, STATE_SIZE
 from config import PC, V, SP, INDEX, SOUND, DELAY
 
 
@@ -31,15 +33,32 @@ class TestHelperFunctions(unittest.TestCase):
                 self.game.emulate_cycle(opcode=0x2111)
 
     def test_clear_screen(self):
-        for i in range(2, 10):
-            for j in range(1, 6):
-                self.game.screen[i][j] = 1
+        for j in range(1, 6):
+            self.game.display.rows[j] = 0xff << 54
+        self.assertEqual(1, self.game.screen[2][1])
         self.game.opcode = 0x00E0
         self.game.clear_screen()
         for i in range(64):
             for j in range(32):
                 self.assertEqual(0, self.game.screen[i][j])
 
+    def test_screen_is_read_only(self):
+        with self.assertRaises(TypeError):
+            self.game.screen[0][0] = 1
+
+    def test_registers_view(self):
+        self.game.registers[INDEX] = 0x300
+        self.game.registers[SP] = 2
+        self.v_registers[5] = 7
+        self.assertEqual(0x300, self.game.index)
+        self.assertEqual(2, self.game.sp)
+        self.assertIs(self.game.v, self.game.registers[V])
+        self.assertEqual([PC, INDEX, SP, V], list(self.game.registers))
+        dump = self.game.get_reg_dump()
+        self.assertEqual(bin(7), dump[V][5])
+        self.assertEqual("768", dump[INDEX])
+        self.assertEqual({DELAY: "0", SOUND: "0"}, dump["timers"])
+
     def test_game_is_paused(self):
         self.game.emulate_cycle(0x0111)
         self.assertEqual(514, self.game.registers[PC])
@@ -54,6 +73,20 @@ class TestHelperFunctions(unittest.TestCase):
         self.assertEqual(0x0fff, self.game.opcode)
         self.assertEqual(514, self.game.registers[PC])
 
+    def test_self_modifying_code(self):
+        self.game.memory[512] = 0x60
+        self.game.memory[513] = 0x05
+        self.game.emulate_cycle()
+        self.assertEqual(5, self.v_registers[0])
+        self.v_registers[0] = 0x61
+        self.v_registers[1] = 0x07
+        self.game.registers[INDEX] = 512
+        self.game.emulate_cycle(opcode=0xf155)
+        self.game.registers[PC] = 512
+        self.game.emulate_cycle()
+        self.assertEqual(0x6107, self.game.opcode)
+        self.assertEqual(7, self.v_registers[1])
+
 
 class TestLogicalOperations(unittest.TestCase):
     """
@@ -202,6 +235,14 @@ class TestFFunctions(unittest.TestCase):
         self.assertEqual(10, self.v_registers[1])
         self.assertEqual(False, self.game.keys[10])
 
+    def test_put_highest_key_to_vx(self):
+        self.game.keys[3] = True
+        self.game.keys[12] = True
+        self.assertEqual(0b0001000000001000, self.game.key_mask)
+        self.game.emulate_cycle(opcode=0xf20a)
+        self.assertEqual(12, self.v_registers[2])
+        self.assertEqual(0b1000, self.game.key_mask)
+
     def test_skip_if_key_pressed(self):
         self.v_registers[1] = 1
         self.game.emulate_cycle(0xe19e)
@@ -284,13 +325,13 @@ class TestFFunctions(unittest.TestCase):
 
     def test_save_vx_to_memory_at_index(self):
         self.game.opcode = 0xf233
-        self.v_registers[2] = 333
+        self.v_registers[2] = 234
         self.game.registers[INDEX] = 555
         for i in range(555, 558):
             self.assertEqual(0, self.game.memory[i])
         self.game.store_vx_in_bcd()
-        for i in range(555, 558):
-            self.assertEqual(3, self.game.memory[i])
+        for i, digit in zip(range(555, 558), (2, 3, 4)):
+            self.assertEqual(digit, self.game.memory[i])
 
 
 class TestDifferentThings(unittest.TestCase):
@@ -496,5 +537,129 @@ class TestDifferentThings(unittest.TestCase):
                     self.assertEqual(1, self.game.screen[x][y])
 
 
+
+class TestRun(unittest.TestCase):
+    def setUp(self):
+        self.game = CHIP8()
+
+    def load_program(self, *opcodes):
+        for index, opcode in enumerate(opcodes):
+            self.game.memory[0x200 + 2 * index] = opcode >> 8
+            self.game.memory[0x201 + 2 * index] = opcode & 0xFF
+
+    def test_run(self):
+        self.load_program(0x7001, 0x1200)
+        self.assertEqual((STOP_CYCLES, 9), self.game.run(9))
+        self.assertEqual(5, self.game.registers[V][0])
+        self.assertEqual(0x202, self.game.registers[PC])
+        self.assertEqual(9, self.game.cycles)
+
+    def test_run_paused(self):
+        self.game.is_paused = True
+        self.assertEqual((STOP_PAUSED, 0), self.game.run(10))
+        self.assertEqual(512, self.game.registers[PC])
+
+    def test_run_counts_cycles_before_exception(self):
+        self.load_program(0x7001, 0x800f)
+        with self.assertRaises(Exception):
+            self.game.run(5)
+        self.assertEqual(1, self.game.cycles)
+
+    def test_run_frames_ticks_timers(self):
+        self.load_program(0x1200)
+        self.game.timers[DELAY] = 10
+        self.game.timers[SOUND] = 2
+        self.assertEqual((STOP_CYCLES, 12), self.game.run_frames(3, 4))
+        self.assertEqual(7, self.game.timers[DELAY])
+        self.assertEqual(0, self.game.timers[SOUND])
+
+    def test_run_until_pc(self):
+        self.load_program(0x7001, 0x7001, 0x7001, 0x1200)
+        self.assertEqual((STOP_PC, 2), self.game.run_until(100, pc=0x204))
+        self.assertEqual(2, self.game.registers[V][0])
+
+    def test_run_until_draw(self):
+        self.load_program(0x7001, 0xd001, 0x1200)
+        self.assertEqual((STOP_DRAW, 2), self.game.run_until(100, draw=True))
+
+    def test_run_until_sound(self):
+        self.load_program(0x6000, 0xf018, 0x6005, 0xf018, 0x1200)
+        self.assertEqual((STOP_SOUND, 4), self.game.run_until(100, sound=True))
+        self.assertEqual(5, self.game.timers[SOUND])
+
+    def test_run_until_key_wait(self):
+        self.load_program(0x7001, 0xf00a, 0x1200)
+        self.assertEqual((STOP_KEY_WAIT, 2),
+                         self.game.run_until(100, key_wait=True))
+        self.assertEqual(0x202, self.game.registers[PC])
+        self.game.keys[4] = True
+        self.assertEqual((STOP_CYCLES, 3),
+                         self.game.run_until(3, key_wait=True))
+        self.assertEqual(5, self.game.registers[V][0])
+
+    def test_run_until_budget(self):
+        self.load_program(0x1200)
+        self.assertEqual((STOP_CYCLES, 50),
+                         self.game.run_until(50, pc=0x300, draw=True))
+
+
+class TestSaveState(unittest.TestCase):
+    def setUp(self):
+        self.game = CHIP8(seed=5)
+        self.game.load_rom(os.path.join(os.path.dirname(__file__), "games",
+                                        "BRIX"))
+        self.game.keys[3] = True
+        self.game.run_frames(100, 10)
+
+    def test_round_trip(self):
+        state = self.game.save_state()
+        self.assertEqual(STATE_SIZE, len(state))
+        restored = CHIP8()
+        restored.load_state(memoryview(state))
+        self.assertEqual(state, restored.save_state())
+        self.assertEqual(self.game.display.tobytes(),
+                         restored.display.tobytes())
+        self.assertTrue(restored.keys[3])
+        self.game.run_frames(100, 10)
+        restored.run_frames(100, 10)
+        self.assertEqual(self.game.save_state(), restored.save_state())
+
+    def test_load_resets_decoded_code(self):
+        state = self.game.save_state()
+        self.game.memory[0x200:0x202] = bytes((0x60, 0x07))
+        self.game.invalidate_code(0x200, 0x202)
+        self.game.pc = 0x200
+        self.game.run(1)
+        self.game.load_state(state)
+        self.game.pc = 0x200
+        self.game.run(1)
+        self.assertNotEqual(0x6007, self.game.opcode)
+
+    def test_bad_state(self):
+        state = bytearray(self.game.save_state())
+        with self.assertRaises(Exception):
+            self.game.load_state(state[:-1])
+        state[4] = 99
+        with self.assertRaises(Exception):
+            self.game.load_state(state)
+        with self.assertRaises(Exception):
+            self.game.load_state(b"BAD!" + bytes(state[4:]))
+
+    def test_clones_are_independent(self):
+        clone = self.game.clone()
+        self.assertEqual(self.game.save_state(), clone.save_state())
+        clone.memory[0xfff] = 1
+        clone.v[0] ^= 1
+        clone.display.draw(b'\xff', 0, 0)
+        self.assertEqual(0, self.game.memory[0xfff])
+        self.assertNotEqual(self.game.v[0], clone.v[0])
+        self.assertNotEqual(self.game.display.tobytes(),
+                            clone.display.tobytes())
+        branches = [self.game.clone() for _ in range(2)]
+        for branch in branches:
+            branch.run_frames(50, 10)
+        self.assertEqual(branches[0].save_state(), branches[1].save_state())
+
+
 if __name__ == '__main__':
     unittest.main()
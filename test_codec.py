@@ -0,0 +1,71 @@
+import os
+import unittest
+from random import Random
+
+from chip8 import CHIP8
+from codec import FrameDecoder, FrameEncoder, is_keyframe, pack_runs, \
+    unpack_runs
+from framebuffer import FRAME_SIZE
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BRIX = os.path.join(ROOT, "games", "BRIX")
+
+
+class TestRuns(unittest.TestCase):
+    def test_round_trip(self):
+        rng = Random(1)
+        samples = [b"", b"a", b"aa", b"aaa", bytes(1000), b"ab" * 200,
+                   bytes(129) + b"xyz" + bytes([7]) * 300,
+                   bytes(rng.randrange(3) for _ in range(2000))]
+        for data in samples:
+            self.assertEqual(data, unpack_runs(pack_runs(data)))
+
+    def test_runs_are_short(self):
+        self.assertEqual(2, len(pack_runs(bytes(100))))
+        self.assertEqual(6, len(pack_runs(b"abcde")))
+
+    def test_truncated_data(self):
+        with self.assertRaises(ValueError):
+            unpack_runs(pack_runs(b"abcde")[:-1])
+
+
+class TestFrameCodec(unittest.TestCase):
+    def test_round_trip_of_a_game(self):
+        game = CHIP8(seed=3)
+        game.load_rom(BRIX)
+        encoder = FrameEncoder(keyframe_interval=10)
+        decoder = FrameDecoder()
+        for _ in range(100):
+            game.run(20)
+            frame = game.display.tobytes()
+            self.assertEqual(frame, decoder.decode(encoder.encode(frame)))
+        stats = encoder.get_stats()
+        self.assertEqual(10, stats["keyframes"])
+        self.assertGreater(stats["ratio"], 5)
+
+    def test_only_changed_rows_are_stored(self):
+        encoder = FrameEncoder()
+        frame = bytearray(FRAME_SIZE)
+        frame[8 * 5] = 0xff
+        self.assertTrue(is_keyframe(encoder.encode(bytes(frame))))
+        frame[8 * 7 + 3] = 0x18
+        packet = encoder.encode(bytes(frame))
+        self.assertFalse(is_keyframe(packet))
+        # Заголовок и одна строка, сжатая в две серии
+        self.assertLessEqual(len(packet), 5 + 8)
+        self.assertEqual(5, len(encoder.encode(bytes(frame))))
+
+    def test_decoding_starts_from_keyframe(self):
+        encoder = FrameEncoder(keyframe_interval=3)
+        frames = [bytes([value]) * FRAME_SIZE for value in range(6)]
+        packets = [encoder.encode(frame) for frame in frames]
+        decoder = FrameDecoder()
+        with self.assertRaises(Exception):
+            decoder.decode(packets[1])
+        self.assertEqual(frames[3], decoder.decode(packets[3]))
+        decoder.decode(packets[4])
+        self.assertEqual(frames[5], decoder.decode(packets[5]))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,119 @@
+import os
+import tempfile
+import unittest
+
+from chip8 import CHIP8, STOP_CYCLES
+from compiler import BlockCompiler
+from config import PC, V, INDEX
+
+
+def get_state(game):
+    return (bytes(game.v), game.pc, game.index, game.sp, list(game.stack),
+            game.delay_timer, game.sound_timer, bytes(game.memory),
+            [list(column) for column in game.screen])
+
+
+class TestBlockCompiler(unittest.TestCase):
+    def setUp(self):
+        self.game = CHIP8()
+
+    def load_program(self, *opcodes):
+        for index, opcode in enumerate(opcodes):
+            self.game.memory[0x200 + 2 * index] = opcode >> 8
+            self.game.memory[0x201 + 2 * index] = opcode & 0xFF
+
+    def test_straight_line_block(self):
+        self.load_program(0x6005, 0x6107, 0x8014, 0xa300, 0xf01e, 0x1200)
+        compiler = BlockCompiler(self.game)
+        self.assertEqual((STOP_CYCLES, 6), compiler.run(6))
+        self.assertEqual(6, self.game.cycles)
+        self.assertEqual(12, self.game.registers[V][0])
+        self.assertEqual(0, self.game.registers[V][15])
+        self.assertEqual(0x30c, self.game.registers[INDEX])
+        self.assertEqual(0x200, self.game.registers[PC])
+        self.assertEqual(0x1200, self.game.opcode)
+
+    def test_skip(self):
+        self.load_program(0x6003, 0x3003, 0x6101, 0x6202)
+        BlockCompiler(self.game).run(3)
+        self.assertEqual(0, self.game.registers[V][1])
+        self.assertEqual(2, self.game.registers[V][2])
+
+    def test_exact_cycle_budget(self):
+        self.load_program(0x7001, 0x7001, 0x7001, 0x1200)
+        compiler = BlockCompiler(self.game)
+        self.assertEqual((STOP_CYCLES, 5), compiler.run(5))
+        self.assertEqual(5, self.game.cycles)
+        self.assertEqual(4, self.game.registers[V][0])
+        self.assertEqual(0x202, self.game.registers[PC])
+
+    def test_self_modifying_code(self):
+        # V0 = 0x61, V1 = 0x07; I = 0x208; [I] = V0..V1; 0x208: 6000 -> 6107
+        self.load_program(0x6061, 0x6107, 0xa208, 0xf155, 0x6000)
+        compiler = BlockCompiler(self.game)
+        compiler.run(4)
+        self.assertIsNone(compiler.blocks[0x200])
+        self.game.registers[V][1] = 0
+        compiler.run(1)
+        self.assertEqual(7, self.game.registers[V][1])
+
+    def test_unsupported_operation(self):
+        self.load_program(0x6001, 0x800f)
+        with self.assertRaises(Exception):
+            BlockCompiler(self.game).run(2)
+
+    def test_memory_errors_match_interpreter(self):
+        # V0 = 5; I = 0xFFE; V1 = 1; [I] = V0..V3 - за концом памяти
+        for opcode in (0xf355, 0xf033, 0xf365):
+            results = []
+            for use_compiler in (False, True):
+                self.game = CHIP8()
+                self.load_program(0x6005, 0xaffe, 0x6101, opcode)
+                runner = BlockCompiler(self.game) if use_compiler \
+                    else self.game
+                with self.assertRaises(Exception) as context:
+                    runner.run(4)
+                results.append((str(context.exception), self.game.cycles,
+                                get_state(self.game)))
+            self.assertEqual(results[0], results[1])
+            self.assertEqual(3, results[1][1])
+            if opcode != 0xf033:
+                self.assertEqual("Out of memory!", results[1][0])
+
+    def test_matches_interpreter(self):
+        rom = os.path.join(os.path.dirname(__file__), "games", "BRIX")
+        states = []
+        for use_compiler in (False, True):
+            game = CHIP8(seed=0)
+            game.load_rom(rom)
+            compiler = BlockCompiler(game) if use_compiler else None
+            for _ in range(300):
+                if compiler is not None:
+                    compiler.run(20)
+                else:
+                    for _ in range(20):
+                        game.emulate_cycle()
+                game.decrement_delay_timer()
+                game.decrement_sound_timer()
+            states.append(get_state(game))
+        self.assertEqual(states[0], states[1])
+
+    def test_disk_cache(self):
+        self.load_program(0x6005, 0x7001, 0x1200)
+        with tempfile.TemporaryDirectory() as cache_dir:
+            compiler = BlockCompiler(self.game, cache_dir)
+            compiler.run(3)
+            compiler.save()
+            self.assertTrue(os.path.exists(compiler.cache_path))
+
+            game = CHIP8()
+            for address in range(0x200, 0x206):
+                game.memory[address] = self.game.memory[address]
+            restored = BlockCompiler(game, cache_dir)
+            self.assertIn(0x200, restored.code_cache)
+            restored.run(3)
+            self.assertEqual(6, game.registers[V][0])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,31 @@
+import unittest
+
+from disasm import disassemble, disassemble_memory
+
+
+class TestDisassembler(unittest.TestCase):
+    def test_instructions(self):
+        listing = {0x00E0: "CLS", 0x00EE: "RET", 0x0123: "SYS 0x123",
+                   0x2ABC: "CALL 0xABC", 0x3A0F: "SE VA, 0x0F",
+                   0x5120: "SE V1, V2", 0x8AB6: "SHR VA, VB",
+                   0x9120: "SNE V1, V2", 0xB200: "JP V0, 0x200",
+                   0xD125: "DRW V1, V2, 5", 0xE3A1: "SKNP V3",
+                   0xF533: "LD B, V5", 0xF065: "LD V0, [I]"}
+        for opcode, text in listing.items():
+            self.assertEqual(text, disassemble(opcode))
+
+    def test_unknown_opcodes_are_data(self):
+        for opcode in (0x5121, 0x8AB8, 0xE100, 0xF0FF):
+            self.assertEqual("DW 0x{:04X}".format(opcode),
+                             disassemble(opcode))
+
+    def test_memory(self):
+        memory = bytearray(0x206)
+        memory[0x200:0x205] = bytes((0x00, 0xE0, 0x12, 0x00, 0xFF))
+        self.assertEqual([(0x200, 0x00E0, "CLS"), (0x202, 0x1200, "JP 0x200"),
+                          (0x204, 0xFF00, "DW 0xFF00")],
+                         disassemble_memory(memory))
+
+
+if __name__ == '__main__':
+    unittest.main()
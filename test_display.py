@@ -0,0 +1,108 @@
+import random
+import unittest
+
+from chip8 import CHIP8
+from display import Display, NumpyDisplay, numpy
+
+
+class TestDisplay(unittest.TestCase):
+    def setUp(self):
+        self.display = Display()
+
+    def test_wrap_around_right_edge(self):
+        self.assertEqual(0, self.display.draw(b'\xff', 60, 0))
+        self.assertEqual(0xf00000000000000f, self.display.rows[0])
+
+    def test_wrap_around_bottom_edge(self):
+        self.display.draw(b'\x80\x80', 0, 31)
+        self.assertEqual(1 << 63, self.display.rows[31])
+        self.assertEqual(1 << 63, self.display.rows[0])
+
+    def test_collision(self):
+        self.display.draw(b'\x80', 63, 0)
+        self.assertEqual(1, self.display.draw(b'\x01', 56, 0))
+        self.assertEqual(0, self.display.rows[0])
+        self.assertEqual(0, self.display.draw(b'\x01', 56, 0))
+
+    def test_tobytes(self):
+        self.display.draw(b'\xa5', 8, 1)
+        data = self.display.tobytes()
+        self.assertEqual(256, len(data))
+        self.assertEqual(0xa5, data[9])
+        self.assertEqual(1, data.count(0xa5))
+
+    def test_frombytes(self):
+        self.display.draw(b'\xa5\x3c', 60, 31)
+        other = Display()
+        other.frombytes(self.display.tobytes())
+        self.assertEqual(self.display.rows, other.rows)
+        copy = other.copy()
+        other.clear()
+        self.assertEqual(self.display.rows, copy.rows)
+
+    def test_take_dirty(self):
+        self.assertEqual((0, 0), self.display.take_dirty())
+        self.display.draw(b'\x80\x00\x01', 62, 31)
+        rows, columns = self.display.take_dirty()
+        # Строка 31 и (с переносом) строка 1 со столбцами 62 и 5;
+        # пустая строка 0 не менялась
+        self.assertEqual(1 << 31 | 1 << 1, rows)
+        self.assertEqual(1 << 63 - 62 | 1 << 63 - 5, columns)
+        self.assertEqual((0, 0), self.display.take_dirty())
+
+    def test_redrawn_sprite_is_not_dirty(self):
+        self.display.draw(b'\xff', 8, 4)
+        self.display.take_dirty()
+        self.display.draw(b'\xff', 8, 4)
+        self.display.draw(b'\xff', 8, 4)
+        self.assertEqual((0, 0), self.display.take_dirty())
+        self.display.clear()
+        self.assertEqual((1 << 4, 0xff << 48), self.display.take_dirty())
+
+    def test_packed_frame_is_read_only(self):
+        frame = self.display.get_frame()
+        self.assertEqual(32, len(frame))
+        with self.assertRaises(TypeError):
+            frame[0] = 1
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestNumpyDisplay(unittest.TestCase):
+    def test_matches_bit_packed_display(self):
+        rnd = random.Random(0)
+        displays = Display(), NumpyDisplay()
+        for _ in range(500):
+            if rnd.random() < 0.02:
+                for display in displays:
+                    display.clear()
+                continue
+            sprite = bytes(rnd.randrange(256)
+                           for _ in range(rnd.randrange(16)))
+            x, y = rnd.randrange(256), rnd.randrange(256)
+            collisions = {display.draw(sprite, x, y) for display in displays}
+            self.assertEqual(1, len(collisions))
+            self.assertEqual(displays[0].tobytes(), displays[1].tobytes())
+            self.assertEqual(displays[0].take_dirty(),
+                             displays[1].take_dirty())
+        restored = NumpyDisplay()
+        restored.frombytes(displays[0].tobytes())
+        self.assertTrue((restored.frame == displays[1].frame).all())
+
+    def test_frame_is_view(self):
+        game = CHIP8(display=NumpyDisplay())
+        frame = game.get_frame()
+        self.assertEqual((32, 64), frame.shape)
+        self.assertEqual(numpy.uint8, frame.dtype)
+        self.assertFalse(frame.flags.writeable)
+        game.memory[0x300] = 0xff
+        game.index = 0x300
+        game.emulate_cycle(0xd001)
+        self.assertEqual(8, frame[0].sum())
+        self.assertEqual(1, game.screen[7][0])
+        self.assertEqual(0xff, game.get_frame(packed=True)[0, 0])
+        game.emulate_cycle(0x00e0)
+        self.assertEqual(0, frame.sum())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,86 @@
+import os
+import time
+import unittest
+
+from chip8 import CHIP8
+from emuprocess import STATUS, EmulatorProcess, read_status, write_status
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAZE = os.path.join(ROOT, "games", "MAZE")
+NO_SUCH_ROM = os.path.join(ROOT, "games", "NO_SUCH_ROM")
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.perf_counter() + timeout
+    while time.perf_counter() < deadline:
+        result = condition()
+        if result:
+            return result
+        time.sleep(0.01)
+    raise AssertionError("timed out")
+
+
+class TestStatus(unittest.TestCase):
+    def test_round_trip(self):
+        game = CHIP8()
+        game.v[3] = 7
+        game.pc = 0x234
+        game.sound_timer = 5
+        game.is_paused = True
+        view = memoryview(bytearray(STATUS.size))
+        write_status(view, game)
+        status = read_status(view)
+        self.assertEqual(0x234, status["pc"])
+        self.assertEqual(5, status["sound_timer"])
+        self.assertEqual(7, status["v"][3])
+        self.assertTrue(status["paused"])
+        self.assertTrue(status["running"])
+
+    def test_status_being_written_is_not_read(self):
+        view = memoryview(bytearray(STATUS.size))
+        write_status(view, CHIP8())
+        view[0] |= 1
+        self.assertIsNone(read_status(view))
+
+
+class TestEmulatorProcess(unittest.TestCase):
+    in_thread = False
+
+    def test_run_pause_and_states(self):
+        with EmulatorProcess(MAZE, ips=5000,
+                             in_thread=self.in_thread) as emulator:
+            frame = wait_for(emulator.frames.take)[0]
+            self.assertTrue(any(frame))
+            wait_for(lambda: emulator.get_status()["cycles"] > 100)
+
+            emulator.set_paused(True)
+            wait_for(lambda: emulator.get_status()["paused"])
+            state = emulator.save_state()
+            cycles = emulator.get_status()["cycles"]
+            time.sleep(0.05)
+            self.assertEqual(cycles, emulator.get_status()["cycles"])
+
+            game = CHIP8()
+            game.load_state(state)
+            self.assertEqual(cycles, game.cycles)
+            emulator.load_state(CHIP8().save_state())
+            wait_for(lambda: emulator.get_status()["cycles"] == 0)
+            self.assertIsNone(emulator.poll())
+        self.assertFalse(emulator.process.is_alive())
+        self.assertGreater(emulator.frames.get_stats()["published"], 0)
+
+    def test_error_is_reported(self):
+        emulator = EmulatorProcess(NO_SUCH_ROM, in_thread=self.in_thread)
+        try:
+            error = wait_for(emulator.poll)
+        finally:
+            emulator.stop()
+        self.assertIn("NO_SUCH_ROM", error)
+
+
+class TestEmulatorThread(TestEmulatorProcess):
+    in_thread = True
+
+
+if __name__ == '__main__':
+    unittest.main()
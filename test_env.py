@@ -0,0 +1,79 @@
+import os
+import unittest
+
+from chip8 import CHIP8
+from env import Environment, BatchEnvironment, get_key_mask, numpy
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BRIX = os.path.join(ROOT, "games", "BRIX")
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestEnvironment(unittest.TestCase):
+    def test_key_mask(self):
+        self.assertEqual(0x8011, get_key_mask([0, 4, 15]))
+        self.assertEqual(0x50, get_key_mask(0x50))
+        with self.assertRaises(ValueError):
+            get_key_mask([16])
+
+    def test_step_matches_run_frames(self):
+        env = Environment(max_pool=False)
+        env.reset(BRIX, seed=3)
+        game = CHIP8(seed=3)
+        game.load_rom(BRIX)
+        for keys in (0, [4], [6], 0):
+            observation, done, info = env.step(keys, frameskip=5)
+            game.key_mask = get_key_mask(keys)
+            game.run_frames(5, env.cycles_per_frame)
+        self.assertFalse(done)
+        self.assertEqual(20, info["frames"])
+        self.assertEqual(game.cycles, info["cycles"])
+        self.assertEqual((32, 64), observation.shape)
+        self.assertEqual(game.display.tobytes(),
+                         numpy.packbits(observation, axis=1).tobytes())
+
+    def test_max_pool_keeps_flickering_sprite(self):
+        for max_pool, expected in ((False, 0), (True, 0xf0)):
+            env = Environment(cycles_per_frame=1, max_pool=max_pool,
+                              packed=True)
+            env.reset(BRIX)
+            # V0 = 0; draw the "0" sprite at (0, 0), then erase it
+            env.game.memory[0x200:0x208] = bytes((0x60, 0x00, 0xd0, 0x05,
+                                                  0xd0, 0x05, 0x12, 0x06))
+            observation, _, _ = env.step(0, frameskip=3)
+            self.assertEqual((32, 8), observation.shape)
+            self.assertEqual(expected, observation[0, 0])
+
+    def test_error_and_time_limit_end_episode(self):
+        env = Environment(max_frames=4)
+        env.reset(BRIX)
+        self.assertFalse(env.step(0, frameskip=3)[1])
+        self.assertTrue(env.step(0)[1])
+        with self.assertRaises(Exception):
+            env.step(0)
+        env.reset(BRIX)
+        env.game.memory[0x200:0x202] = bytes((0x80, 0x0f))
+        _, done, info = env.step(0)
+        self.assertTrue(done)
+        self.assertIn("not supported", info["error"])
+        self.assertGreater(env.steps_per_second, 0)
+
+    def test_batch_matches_single(self):
+        seeds = [0, 1, 2]
+        batch = BatchEnvironment(max_frames=6)
+        self.assertEqual((3, 32, 64), batch.reset(BRIX, seeds).shape)
+        singles = [Environment() for _ in seeds]
+        for env, seed in zip(singles, seeds):
+            env.reset(BRIX, seed)
+        actions = numpy.array([0, 1 << 4, 1 << 6])
+        for _ in range(3):
+            observations, done, _ = batch.step(actions, frameskip=2)
+            for index, env in enumerate(singles):
+                observation, _, _ = env.step(int(actions[index]), 2)
+                self.assertTrue((observation == observations[index]).all())
+        self.assertTrue(done.all())
+        self.assertTrue(batch.done)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import threading
+import unittest
+
+from framebuffer import FRAME_SIZE, SLOT_HEADER, FrameBuffer
+
+
+def make_frame(value):
+    return bytes([value]) * FRAME_SIZE
+
+
+class TestFrameBuffer(unittest.TestCase):
+    def test_take_newest(self):
+        frames = FrameBuffer()
+        self.assertIsNone(frames.take())
+        frames.publish(make_frame(1), 10)
+        self.assertEqual((make_frame(1), 10, 1), frames.take())
+        self.assertIsNone(frames.take())
+        for value in range(2, 7):
+            frames.publish(make_frame(value), value * 10)
+        self.assertEqual((make_frame(6), 60, 6), frames.take())
+        self.assertEqual({"published": 6, "presented": 2, "dropped": 4,
+                          "torn": 0}, frames.get_stats())
+
+    def test_torn_frame_is_not_taken(self):
+        frames = FrameBuffer(slots=2)
+        frames.publish(make_frame(1))
+        # Писатель начал заполнять ячейку, но ещё не закончил
+        offset = frames.get_slot_offset(1)
+        sequence, number, cycle = SLOT_HEADER.unpack_from(frames.buffer,
+                                                          offset)
+        SLOT_HEADER.pack_into(frames.buffer, offset, sequence + 1, number,
+                              cycle)
+        self.assertIsNone(frames.take())
+        self.assertEqual(1, frames.torn)
+        SLOT_HEADER.pack_into(frames.buffer, offset, sequence + 2, number,
+                              cycle)
+        self.assertEqual(make_frame(1), frames.take()[0])
+
+    def test_reader_over_shared_buffer(self):
+        writer = FrameBuffer(slots=3)
+        reader = FrameBuffer(slots=3, buffer=writer.buffer)
+        done = threading.Event()
+
+        def write():
+            for value in range(2000):
+                writer.publish(make_frame(value % 256), value)
+            done.set()
+
+        thread = threading.Thread(target=write)
+        thread.start()
+        last = -1
+        while not done.is_set() or reader.last_taken != writer.published:
+            taken = reader.take()
+            if taken is not None:
+                frame, cycle, number = taken
+                self.assertEqual(make_frame(cycle % 256), frame)
+                self.assertEqual(number - 1, cycle)
+                self.assertGreater(cycle, last)
+                last = cycle
+        thread.join()
+        self.assertEqual(1999, last)
+        stats = reader.get_stats()
+        self.assertEqual(2000, stats["presented"] + stats["dropped"])
+
+    def test_bad_arguments(self):
+        with self.assertRaises(ValueError):
+            FrameBuffer(slots=1)
+        with self.assertRaises(ValueError):
+            FrameBuffer(slots=3, buffer=bytearray(10))
+        with self.assertRaises(ValueError):
+            FrameBuffer().publish(b'\0')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import unittest
+
+from chip8 import CHIP8, STOP_CYCLES
+from headless import run_headless, load_input_script, get_report, main
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAZE = os.path.join(ROOT, "games", "MAZE")
+
+
+class TestHeadless(unittest.TestCase):
+    def run_maze(self, seed, **limits):
+        game = CHIP8(seed=seed)
+        game.load_rom(MAZE)
+        result = run_headless(game, game, **limits)
+        return game, result
+
+    def test_frames_and_cycles_limits(self):
+        _, result = self.run_maze(1, frames=5)
+        self.assertEqual((STOP_CYCLES, 50, 5), result)
+        _, result = self.run_maze(1, cycles=55, frames=10)
+        self.assertEqual((STOP_CYCLES, 55, 5), result)
+
+    def test_seed_is_reproducible(self):
+        frames = set()
+        for _ in range(2):
+            game, _ = self.run_maze(7, frames=300)
+            frames.add(game.display.tobytes())
+        self.assertEqual(1, len(frames))
+        game, _ = self.run_maze(8, frames=300)
+        self.assertNotIn(game.display.tobytes(), frames)
+
+    def test_report(self):
+        game, (reason, cycles, frames) = self.run_maze(1, frames=3)
+        report = get_report(game, reason, cycles, frames, 0.5)
+        self.assertEqual(32, len(report["frame"]))
+        self.assertEqual(str(game.pc), report["registers"]["pc"])
+        self.assertEqual(60, report["stats"]["cycles_per_second"])
+
+    def test_input_script(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "inputs.txt")
+            with open(path, "w") as file:
+                file.write("# comment\n7 a up\n3 A down  # press A\n")
+            events = load_input_script(path)
+        self.assertEqual([(3, 10, True), (7, 10, False)], events)
+
+        game = CHIP8()
+        # 0x200: V0 = key (FX0A); 0x202: jump to itself
+        game.memory[0x200:0x204] = bytes((0xf0, 0x0a, 0x12, 0x02))
+        run_headless(game, game, cycles=10, events=events)
+        self.assertEqual(10, game.v[0])
+        self.assertFalse(game.keys[10])
+
+    def test_main_writes_json(self):
+        with tempfile.TemporaryDirectory() as directory:
+            output = os.path.join(directory, "report.json")
+            main(["run", MAZE, "--frames", "10", "--seed", "1",
+                  "--output", output])
+            with open(output) as file:
+                report = json.load(file)
+        self.assertEqual(100, report["stats"]["cycles"])
+        self.assertEqual(1, report["seed"])
+
+    def test_does_not_import_qt(self):
+        code = "import sys, chip8, headless; print('PyQt5' in sys.modules)"
+        output = subprocess.check_output([sys.executable, "-c", code],
+                                         cwd=ROOT)
+        self.assertEqual(b"False", output.strip())
+
+
+if __name__ == '__main__':
+    unittest.main()
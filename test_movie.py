@@ -0,0 +1,116 @@
+import os
+import tempfile
+import unittest
+
+from chip8 import CHIP8
+from headless import play_movie
+from movie import Movie, MoviePlayer, MovieRecorder, record_events, \
+    get_rom_hash
+from scheduler import Scheduler
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BRIX = os.path.join(ROOT, "games", "BRIX")
+MAZE = os.path.join(ROOT, "games", "MAZE")
+EVENTS = [(cycle, cycle // 300 % 16, cycle // 150 % 2 == 0)
+          for cycle in range(150, 30000, 150)]
+
+
+def play_events(target, seed=5):
+    """
+    Та же игра без записи: клавиши нажимаются прямо на нужных командах
+    """
+    game = CHIP8(seed=seed)
+    game.load_rom(BRIX)
+    scheduler = Scheduler(game)
+    for cycle, key, pressed in EVENTS:
+        if cycle > target:
+            break
+        scheduler.run_cycles(cycle - game.cycles)
+        game.keys[key] = pressed
+    scheduler.run_cycles(target - game.cycles)
+    return game.save_state()
+
+
+class TestMovie(unittest.TestCase):
+    def setUp(self):
+        self.movie = record_events(BRIX, EVENTS, 30000, seed=5,
+                                   keyframe_interval=4000)
+
+    def test_round_trip_and_playback(self):
+        movie = Movie.frombytes(self.movie.tobytes())
+        self.assertEqual(len(EVENTS), len(movie.event_codes))
+        self.assertEqual(7, len(movie.keyframes))
+        self.assertEqual(30000, movie.length)
+        player = MoviePlayer(movie, BRIX)
+        player.play()
+        self.assertEqual(play_events(30000), player.game.save_state())
+        self.assertTrue(player.finished)
+
+    def test_seek(self):
+        player = MoviePlayer(self.movie, BRIX)
+        for cycle in (20000, 4000, 4001, 150, 29999, 0):
+            player.seek(cycle)
+            self.assertEqual(cycle, player.game.cycles)
+            self.assertEqual(play_events(cycle), player.game.save_state())
+
+    def test_end_of_movie_pauses(self):
+        player = MoviePlayer(self.movie, BRIX)
+        player.seek(29990)
+        reason, executed = player.scheduler.run_cycles(100)
+        self.assertEqual(10, executed)
+        self.assertTrue(player.game.is_paused)
+        player.seek(100)
+        self.assertFalse(player.game.is_paused)
+
+    def test_truncate_after_rewind(self):
+        game = CHIP8(seed=1)
+        game.load_rom(BRIX)
+        recorder = MovieRecorder(game, BRIX, seed=1, keyframe_interval=100)
+        self.assertIsNone(recorder.movie.start_state)
+        recorder.set_key(4, True)
+        game.run(250)
+        recorder.update()
+        recorder.set_key(4, False)
+        state = game.save_state()
+        game.run(250)
+        recorder.update()
+        recorder.set_key(6, True)
+        game.load_state(state)
+        recorder.truncate()
+        movie = recorder.movie
+        self.assertEqual(2, len(movie.event_codes))
+        self.assertEqual(1, len(movie.keyframes))
+        self.assertEqual(250, movie.length)
+
+    def test_recording_without_seed_keeps_start_state(self):
+        game = CHIP8()
+        game.load_rom(BRIX)
+        game.run(10)
+        recorder = MovieRecorder(game, BRIX)
+        movie = Movie.frombytes(recorder.movie.tobytes())
+        self.assertEqual(game.save_state(), movie.start_state)
+        self.assertEqual(10, movie.start_cycle)
+
+    def test_wrong_rom_and_bad_data(self):
+        with self.assertRaises(Exception):
+            MoviePlayer(self.movie, MAZE)
+        data = self.movie.tobytes()
+        with self.assertRaises(Exception):
+            Movie.frombytes(b"XXXX" + data[4:])
+        with self.assertRaises(Exception):
+            Movie.frombytes(data[:-10])
+        self.assertEqual(20, len(get_rom_hash(BRIX)))
+
+    def test_headless_playback(self):
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, "brix.c8m")
+            self.movie.save(path)
+            report = play_movie(path, BRIX, seek=25000)
+            full = play_movie(path, BRIX)
+        self.assertEqual(25000, report["stats"]["start_cycle"])
+        self.assertEqual(5000, report["stats"]["cycles"])
+        self.assertEqual(full["frame_sha1"], report["frame_sha1"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+import os
+import unittest
+
+from chip8 import CHIP8
+from profiler import AddressProfiler, HandlerProfiler, get_opcode_pattern
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+BRIX = os.path.join(ROOT, "games", "BRIX")
+
+
+class TestProfiler(unittest.TestCase):
+    def test_opcode_patterns(self):
+        patterns = {0x00E0: "00E0", 0x00EE: "00EE", 0x0123: "0NNN",
+                    0x1234: "1NNN", 0x3A12: "3XNN", 0x5AB0: "5XY0",
+                    0x8AB4: "8XY4", 0x8ABE: "8XYE", 0xD125: "DXYN",
+                    0xE19E: "EX9E", 0xF133: "FX33", 0xF10A: "FX0A"}
+        for opcode, pattern in patterns.items():
+            self.assertEqual(pattern, get_opcode_pattern(opcode))
+
+    def test_counts_and_swap(self):
+        game = CHIP8()
+        # 6005: V0 = 5; 8014: V0 += V1; 1202: переход на 8014
+        game.memory[0x200:0x206] = bytes((0x60, 0x05, 0x80, 0x14,
+                                          0x12, 0x02))
+        game.run(3)
+        profiler = HandlerProfiler(game)
+        with profiler:
+            self.assertTrue(profiler.enabled)
+            game.run(101)
+        self.assertIs(dict, type(game.decode_cache))
+        self.assertFalse(profiler.enabled)
+        game.run(10)
+        stats = {row["opcode"]: row for row in profiler.get_stats()}
+        self.assertEqual({"8XY4", "1NNN"}, set(stats))
+        self.assertEqual(51, stats["8XY4"]["count"])
+        self.assertEqual(50, stats["1NNN"]["count"])
+        self.assertEqual("sum_vx_and_vy", stats["8XY4"]["handler"])
+        self.assertAlmostEqual(1, sum(row["share"]
+                                      for row in stats.values()))
+
+    def test_exports(self):
+        game = CHIP8(seed=0)
+        game.load_rom(BRIX)
+        with HandlerProfiler(game) as profiler:
+            game.run(2000)
+        self.assertIn("DXYN", profiler.format_table())
+        data = profiler.to_json()
+        self.assertEqual(2000, sum(row["count"] for row in data["handlers"]))
+        for line in profiler.to_collapsed().splitlines():
+            stack, value = line.rsplit(" ", 1)
+            self.assertTrue(stack.startswith("CHIP8.run;"))
+            self.assertGreaterEqual(int(value), 0)
+        self.assertIn("CHIP8.run;FX**;FX33 store_vx_in_bcd ",
+                      profiler.to_collapsed())
+
+
+class TestAddressProfiler(unittest.TestCase):
+    def test_hits_and_subroutines(self):
+        game = CHIP8()
+        # 200: CALL 206; 202: CALL 206; 204: JP 204
+        # 206: CALL 20A; 208: RET; 20A: LD V0, 1; 20C: RET
+        game.memory[0x200:0x20E] = bytes((0x22, 0x06, 0x22, 0x06,
+                                          0x12, 0x04, 0x22, 0x0A,
+                                          0x00, 0xEE, 0x60, 0x01,
+                                          0x00, 0xEE))
+        profiler = AddressProfiler(game)
+        with profiler:
+            game.run(15)
+        self.assertIs(dict, type(game.decode_cache))
+        self.assertEqual(15, profiler.total)
+        self.assertEqual(5, profiler.hits[0x204])
+        self.assertEqual(2, profiler.hits[0x20A])
+        subroutines = {row["address"]: row
+                       for row in profiler.get_subroutines()}
+        self.assertEqual({0x206, 0x20A}, set(subroutines))
+        self.assertEqual(2, subroutines[0x206]["calls"])
+        self.assertEqual(8, subroutines[0x206]["inclusive"])
+        self.assertEqual(4, subroutines[0x20A]["inclusive"])
+        self.assertEqual(0x204, profiler.get_hot_spots(1)[0]["address"])
+        listing = profiler.format_listing()
+        self.assertIn("sub_206: 2 calls, 8 instructions inside", listing)
+        self.assertIn("   206  220A  CALL 0x20A", listing)
+        self.assertEqual(len(game.memory), len(profiler.hits))
+
+    def test_only_one_profiler_at_a_time(self):
+        game = CHIP8()
+        with AddressProfiler(game):
+            with self.assertRaises(Exception):
+                HandlerProfiler(game).start()
+
+
+if __name__ == '__main__':
+    unittest.main()
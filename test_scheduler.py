@@ -0,0 +1,83 @@
+import unittest
+
+from chip8 import CHIP8, STOP_CYCLES, STOP_PAUSED
+from scheduler import Scheduler
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.now += seconds
+
+
+class TestScheduler(unittest.TestCase):
+    def setUp(self):
+        self.game = CHIP8()
+        # 0x200: jump to itself
+        self.game.memory[0x200:0x202] = bytes((0x12, 0x00))
+        self.clock = FakeClock()
+        self.ticks = []
+        self.scheduler = Scheduler(self.game, ips=700, timer_hz=60,
+                                   tick=self.tick, clock=self.clock,
+                                   sleep=self.clock.sleep)
+
+    def tick(self):
+        self.ticks.append(self.game.cycles)
+
+    def test_ticks_follow_emulated_time(self):
+        self.assertEqual((STOP_CYCLES, 700), self.scheduler.run_cycles(700))
+        self.assertEqual(60, len(self.ticks))
+        self.assertEqual([12, 24, 35, 47], self.ticks[:4])
+        self.assertEqual(700, self.ticks[-1])
+
+    def test_run_frame(self):
+        self.assertEqual((STOP_CYCLES, 12), self.scheduler.run_frame())
+        self.assertEqual((STOP_CYCLES, 12), self.scheduler.run_frame())
+        self.assertEqual((STOP_CYCLES, 11), self.scheduler.run_frame())
+        self.assertEqual([12, 24, 35], self.ticks)
+
+    def test_slices_follow_clock(self):
+        self.clock.now = 0.2
+        self.assertEqual((STOP_CYCLES, 140), self.scheduler.run_slice())
+        self.scheduler.wait()
+        self.assertAlmostEqual(0.2 + 1 / 60, self.clock.now)
+        self.scheduler.run_slice()
+        self.assertEqual(151, self.game.cycles)
+        self.assertEqual(12, len(self.ticks))
+
+    def test_lag_is_dropped(self):
+        self.clock.now = 10
+        _, executed = self.scheduler.run_slice()
+        self.assertEqual(175, executed)
+        self.assertEqual(7000 - 175, self.scheduler.dropped_cycles)
+        self.clock.now = 10.1
+        self.assertEqual(70, self.scheduler.run_slice()[1])
+
+    def test_pause_does_not_build_up_debt(self):
+        self.game.is_paused = True
+        self.clock.now = 0.25
+        self.assertEqual((STOP_PAUSED, 0), self.scheduler.run_slice())
+        self.game.is_paused = False
+        self.clock.now = 0.375
+        self.assertEqual(87, self.scheduler.run_slice()[1])
+
+    def test_run_until_stopped(self):
+        slices = []
+
+        def after_slice(reason, executed):
+            slices.append(executed)
+
+        self.scheduler.run(lambda: len(slices) < 5, after_slice)
+        self.assertEqual(5, len(slices))
+        self.assertEqual(sum(slices), self.game.cycles)
+        self.assertAlmostEqual(self.game.cycles / 700, self.clock.now,
+                               delta=2 / 60)
+
+
+if __name__ == '__main__':
+    unittest.main()
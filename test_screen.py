@@ -0,0 +1,59 @@
+import unittest
+
+from PyQt5.QtCore import QRect
+
+from display import Display
+from gui.screen import get_changes, get_dirty_rects
+
+
+class TestScreen(unittest.TestCase):
+    def setUp(self):
+        self.display = Display()
+        self.old = self.display.tobytes()
+
+    def get_rects(self):
+        return get_dirty_rects(
+            *get_changes(self.old, self.display.tobytes()))
+
+    def test_no_change(self):
+        self.assertEqual((0, 0), get_changes(self.old, self.old))
+        self.assertEqual([], get_dirty_rects(0, 0))
+
+    def test_one_pixel(self):
+        self.display.draw(b'\x80', 10, 5)
+        self.assertEqual((1 << 5, 1 << 53),
+                         get_changes(self.old, self.display.tobytes()))
+        self.assertEqual([QRect(10, 5, 1, 1)], self.get_rects())
+
+    def test_matches_take_dirty(self):
+        self.display.take_dirty()
+        self.display.draw(b'\xa5\x18', 20, 7)
+        self.assertEqual(self.display.take_dirty(),
+                         get_changes(self.old, self.display.tobytes()))
+
+    def test_wrap_around_columns(self):
+        # Спрайт на столбцах 60-63 и 0-3: прямоугольник во всю ширину
+        self.display.draw(b'\xff', 60, 2)
+        self.assertEqual([QRect(0, 2, 64, 1)], self.get_rects())
+
+    def test_wrap_around_rows(self):
+        # Строки 31 и 0 - две отдельные группы
+        self.display.draw(b'\x80\x80', 0, 31)
+        self.assertEqual([QRect(0, 0, 1, 1), QRect(0, 31, 1, 1)],
+                         self.get_rects())
+
+    def test_separate_row_groups(self):
+        self.display.draw(b'\x80\x80', 4, 1)
+        self.display.draw(b'\x01', 8, 10)
+        self.assertEqual([QRect(4, 1, 12, 2), QRect(4, 10, 12, 1)],
+                         self.get_rects())
+
+    def test_clear(self):
+        self.display.frombytes(b'\xff' * len(self.old))
+        self.old = self.display.tobytes()
+        self.display.clear()
+        self.assertEqual([QRect(0, 0, 64, 32)], self.get_rects())
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,85 @@
+import asyncio
+import os
+import unittest
+
+from display import WIDTH, HEIGHT
+from server import FrameClient, FrameServer, Session, Subscriber, \
+    frame_to_text
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+MAZE = os.path.join(ROOT, "games", "MAZE")
+
+
+class FakeWriter:
+    def __init__(self):
+        self.written = []
+
+    def write(self, data):
+        self.written.append(data)
+
+    async def drain(self):
+        pass
+
+
+class TestServer(unittest.TestCase):
+    def run_with_server(self, check):
+        async def run():
+            session = Session(MAZE, ips=5000, seed=1)
+            server = FrameServer({"MAZE": session})
+            port = await server.start(port=0)
+            client = FrameClient()
+            try:
+                await client.connect(port=port)
+                await asyncio.wait_for(check(session, client), 5)
+            finally:
+                await client.close()
+                await server.stop()
+        asyncio.run(run())
+
+    def test_viewer_gets_frames(self):
+        async def check(session, client):
+            number, cycle, frame = await client.read_frame()
+            self.assertEqual(WIDTH * HEIGHT // 8, len(frame))
+            while not any(frame):
+                number, cycle, frame = await client.read_frame()
+            self.assertGreater(cycle, 0)
+            self.assertLessEqual(number, session.frame_number)
+        self.run_with_server(check)
+
+    def test_key_and_stats(self):
+        async def check(session, client):
+            client.send_key(0xa, True)
+            stats = await client.get_stats()
+            self.assertTrue(session.game.keys[0xa])
+            self.assertEqual(1, stats["MAZE"]["viewers"])
+            client.send_key(0xa, False)
+            await client.get_stats()
+            self.assertFalse(session.game.keys[0xa])
+        self.run_with_server(check)
+
+    def test_slow_subscriber_keeps_only_newest_frame(self):
+        async def check():
+            writer = FakeWriter()
+            subscriber = Subscriber(writer)
+            for message in (b"1", b"2", b"3"):
+                subscriber.offer(message)
+            sender = asyncio.ensure_future(subscriber.send_frames())
+            await asyncio.sleep(0)
+            sender.cancel()
+            self.assertEqual([b"3"], writer.written)
+            self.assertEqual(2, subscriber.dropped)
+        asyncio.run(check())
+
+    def test_frame_to_text(self):
+        frame = bytearray(WIDTH * HEIGHT // 8)
+        frame[0] = 0x80
+        frame[8] = 0xa0
+        frame[16] = 0x40
+        lines = frame_to_text(bytes(frame)).split("\n")
+        self.assertEqual(HEIGHT // 2, len(lines))
+        self.assertEqual("█ ▄", lines[0][:3])
+        self.assertEqual(" ▀", lines[1][:2])
+
+
+if __name__ == '__main__':
+    unittest.main()
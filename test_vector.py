@@ -0,0 +1,61 @@
+import os
+import unittest
+
+from chip8 import CHIP8
+from vector import VectorCHIP8, cross_check, numpy
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+
+
+@unittest.skipIf(numpy is None, "NumPy is not installed")
+class TestVectorCHIP8(unittest.TestCase):
+    def load_program(self, machines, *opcodes):
+        for index, opcode in enumerate(opcodes):
+            machines.memory[:, 0x200 + 2 * index] = opcode >> 8
+            machines.memory[:, 0x201 + 2 * index] = opcode & 0xFF
+
+    def test_matches_interpreter_on_roms(self):
+        for name in ("BRIX", "MAZE", "TETRIS", "VERS"):
+            rom = os.path.join(ROOT, "games", name)
+            self.assertEqual([], cross_check(rom, [0, 1, 2], 100), name)
+
+    def test_machines_diverge_on_registers(self):
+        machines = VectorCHIP8(2)
+        # V0 = 5, V1 = 3; the second machine runs 8017 instead of 8015
+        self.load_program(machines, 0x6005, 0x6103, 0x8015)
+        machines.memory[1, 0x205] = 0x17
+        machines.run(3)
+        self.assertEqual([2, 254], machines.v[:, 0].tolist())
+        self.assertEqual([1, 0], machines.v[:, 15].tolist())
+
+    def test_fault_stops_only_one_machine(self):
+        machines = VectorCHIP8(2)
+        self.load_program(machines, 0x7001, 0x1200)
+        machines.memory[1, 0x202:0x204] = (0x80, 0x0f)
+        _, executed = machines.run(4)
+        self.assertEqual(5, executed)
+        self.assertEqual([False, True], machines.faulted.tolist())
+        self.assertEqual({1: "Operation 0x800f is not supported"},
+                         machines.errors)
+        self.assertEqual([4, 1], machines.cycles.tolist())
+
+    def test_frames_match_display(self):
+        machines = VectorCHIP8(1)
+        game = CHIP8()
+        # V0 = 62, V1 = 30; draw the "0" sprite across both edges
+        program = (0x603e, 0x611e, 0xd015)
+        self.load_program(machines, *program)
+        for index, opcode in enumerate(program):
+            game.memory[0x200 + 2 * index] = opcode >> 8
+            game.memory[0x201 + 2 * index] = opcode & 0xFF
+        machines.run(3)
+        game.run(3)
+        self.assertEqual(list(game.display.rows), machines.rows[0].tolist())
+        frame = machines.get_frames()[0]
+        self.assertEqual((32, 64), frame.shape)
+        self.assertEqual(game.screen[62][30], frame[30, 62])
+        self.assertEqual(game.screen[63][31], frame[31, 63])
+
+
+if __name__ == '__main__':
+    unittest.main()
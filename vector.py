@@ -0,0 +1,623 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from random import Random
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from chip8 import CHIP8, FONTS, STOP_CYCLES
+
+__all__ = ['VectorCHIP8', 'cross_check', 'main']
+
+MEMORY_SIZE = 4096
+STACK_SIZE = 17
+HEIGHT = 32
+
+
+class VectorCHIP8:
+    """
+    Много машин CHIP8, выполняющих команды в ногу. Состояние всех машин
+    хранится в массивах NumPy (первое измерение - номер машины), за один
+    шаг каждая машина выполняет одну команду: машины группируются по
+    старшей тетраде опкода, и для каждой группы выполняется одно
+    векторное обновление.
+    Команды выполняются так же, как CHIP8.emulate_cycle. Машина, на которой
+    CHIP8 выбросил бы исключение, останавливается: faulted[i] становится
+    True, текст ошибки сохраняется в errors[i]
+    :param count: число машин
+    :param seeds: зёрна для CXNN, по одному на машину. С ними каждая машина
+                  получает свой random.Random(seed), как CHIP8(seed=seed),
+                  и случайные числа совпадают с интерпретатором. Без них
+                  числа берутся из numpy.random (так быстрее)
+    """
+    __slots__ = ('count', 'machines', 'memory', 'v', 'stack', 'pc', 'index',
+                 'sp', 'delay_timer', 'sound_timer', 'key_mask', 'rows',
+                 'opcode', 'draw_flag', 'cycles', 'faulted', 'errors',
+                 'rngs', 'numpy_rng')
+
+    def __init__(self, count, seeds=None):
+        if numpy is None:
+            raise ImportError("NumPy is required for VectorCHIP8")
+        if seeds is not None and len(seeds) != count:
+            raise ValueError("expected {} seeds, got {}".format(count,
+                                                                len(seeds)))
+        self.count = count
+        self.machines = numpy.arange(count)
+        self.memory = numpy.zeros((count, MEMORY_SIZE), numpy.uint8)
+        self.memory[:, :len(FONTS)] = FONTS
+        self.v = numpy.zeros((count, 16), numpy.uint8)
+        self.stack = numpy.zeros((count, STACK_SIZE), numpy.uint16)
+        self.pc = numpy.full(count, 512, numpy.int32)
+        self.index = numpy.zeros(count, numpy.int32)
+        # SP бывает отрицательным после лишнего 00EE, как и в CHIP8
+        self.sp = numpy.zeros(count, numpy.int32)
+        self.delay_timer = numpy.zeros(count, numpy.uint8)
+        self.sound_timer = numpy.zeros(count, numpy.uint8)
+        self.key_mask = numpy.zeros(count, numpy.int32)
+        # Экран каждой машины - 32 строки по 64 бита, как в display.Display
+        self.rows = numpy.zeros((count, HEIGHT), numpy.uint64)
+        self.opcode = numpy.zeros(count, numpy.int32)
+        self.draw_flag = numpy.zeros(count, bool)
+        self.cycles = numpy.zeros(count, numpy.int64)
+        self.faulted = numpy.zeros(count, bool)
+        self.errors = {}
+        if seeds is None:
+            self.rngs = None
+            self.numpy_rng = numpy.random.default_rng()
+        else:
+            self.rngs = [Random(seed) for seed in seeds]
+            self.numpy_rng = None
+
+    def load_rom(self, rom):
+        """
+        Загрузить ROM файл в память всех машин
+        :param rom:
+        :return:
+        """
+        with open(rom, "rb") as file:
+            data = numpy.frombuffer(file.read(), numpy.uint8)
+        self.memory[:, 0x200:0x200 + len(data)] = data
+
+    def get_frames(self, packed=False):
+        """
+        Кадры всех машин (создаются заново при каждом вызове): массив uint8
+        размером count x 32 x 64, по байту на пиксель, или, если packed,
+        count x 32 x 8, по биту на пиксель
+        :param packed:
+        :return:
+        """
+        frames = self.rows.astype('>u8').view(numpy.uint8).reshape(
+            self.count, HEIGHT, 8)
+        if packed:
+            return frames
+        return numpy.unpackbits(frames, axis=2)
+
+    def fault(self, machines, opcodes, message):
+        """
+        Остановить машины, на которых команда завершилась ошибкой
+        :param machines: номера машин
+        :param opcodes: их опкоды
+        :param message: текст ошибки; {} заменяется на опкод
+        :return:
+        """
+        self.faulted[machines] = True
+        for machine, opcode in zip(machines.tolist(), opcodes.tolist()):
+            self.errors[machine] = message.format(hex(opcode))
+
+    def split_faults(self, machines, opcodes, bad, message, *arrays):
+        """
+        Остановить машины, отмеченные в bad, и вернуть остальные
+        :param machines: номера машин
+        :param opcodes: их опкоды
+        :param bad: булев массив: на каких машинах команда завершилась
+                    ошибкой
+        :param message: текст ошибки
+        :param arrays: другие массивы по этим машинам, их тоже нужно
+                       отфильтровать
+        :return: (machines, opcodes, *arrays) для оставшихся машин
+        """
+        if bad.any():
+            self.fault(machines[bad], opcodes[bad], message)
+            good = ~bad
+            return (machines[good], opcodes[good]) + \
+                tuple(array[good] for array in arrays)
+        return (machines, opcodes) + arrays
+
+    def step(self):
+        """
+        Выполнить по одной команде на каждой работающей машине
+        :return: число выполненных команд
+        """
+        machines = self.machines[~self.faulted]
+        pc = self.pc[machines]
+        # CHIP8 падает на выборке опкода за концом памяти, не сдвигая PC
+        bad = pc >= MEMORY_SIZE - 1
+        if bad.any():
+            self.fault(machines[bad], pc[bad], "Out of memory!")
+            machines, pc = machines[~bad], pc[~bad]
+        memory = self.memory
+        opcodes = (memory[machines, pc].astype(numpy.int32) << 8) \
+            | memory[machines, pc + 1]
+        self.opcode[machines] = opcodes
+        self.pc[machines] = pc + 2
+
+        operations = opcodes >> 12
+        table = self.operation_table
+        for operation in numpy.unique(operations).tolist():
+            group = operations == operation
+            table[operation](self, machines[group], opcodes[group])
+
+        done = machines[~self.faulted[machines]]
+        self.cycles[done] += 1
+        return len(done)
+
+    def run(self, n_steps):
+        """
+        Выполнить n_steps шагов
+        :param n_steps: число шагов
+        :return: пара (причина остановки, число выполненных команд на всех
+                 машинах)
+        """
+        executed = 0
+        for _ in range(n_steps):
+            executed += self.step()
+        return STOP_CYCLES, executed
+
+    def run_frames(self, n_frames, cycles_per_frame):
+        """
+        Выполнить n_frames кадров по cycles_per_frame шагов, уменьшая
+        таймеры в конце каждого кадра
+        :return: пара (причина остановки, число выполненных команд)
+        """
+        executed = 0
+        for _ in range(n_frames):
+            executed += self.run(cycles_per_frame)[1]
+            self.tick_timers()
+        return STOP_CYCLES, executed
+
+    def tick_timers(self):
+        """
+        Уменьшить таймеры всех машин (происходит 60 раз в секунду)
+        :return:
+        """
+        numpy.subtract(self.delay_timer, 1, out=self.delay_timer,
+                       where=self.delay_timer > 0)
+        numpy.subtract(self.sound_timer, 1, out=self.sound_timer,
+                       where=self.sound_timer > 0)
+
+    def set_pc(self, machines, opcodes, values):
+        """
+        Установить PC с той же проверкой, что CHIP8.set_pc_to_val
+        :return:
+        """
+        machines, _, values = self.split_faults(
+            machines, opcodes, values > MEMORY_SIZE, "Out of memory!",
+            values)
+        self.pc[machines] = values
+
+    def skip_if(self, machines, opcodes, condition):
+        """
+        Пропустить следующую команду на машинах, где condition истинно
+        :return:
+        """
+        machines, opcodes = machines[condition], opcodes[condition]
+        self.set_pc(machines, opcodes, self.pc[machines] + 2)
+
+    def unsupported_operation(self, machines, opcodes):
+        self.fault(machines, opcodes, "Operation {} is not supported")
+
+    def return_clear(self, machines, opcodes):
+        """
+        opcode: 0x00E0, 0x00EE и 0x0NNN (игнорируется)
+        :return:
+        """
+        operation = opcodes & 0x0FFF
+        clear = machines[operation == 0x00E0]
+        self.rows[clear] = 0
+
+        back = operation == 0x00EE
+        machines, opcodes = machines[back], opcodes[back]
+        sp = self.sp[machines]
+        machines, opcodes, sp = self.split_faults(
+            machines, opcodes, sp < -STACK_SIZE,
+            "Stack index out of range", sp)
+        self.set_pc(machines, opcodes,
+                    self.stack[machines, sp % STACK_SIZE].astype(numpy.int32))
+        self.sp[machines] = sp - 1
+
+    def jump_to_address(self, machines, opcodes):
+        self.pc[machines] = opcodes & 0x0FFF
+
+    def call_subroutine(self, machines, opcodes):
+        sp = self.sp[machines]
+        machines, opcodes, sp = self.split_faults(
+            machines, opcodes, sp >= 16, "Stack Overflow!", sp)
+        sp = sp + 1
+        self.sp[machines] = sp
+        self.stack[machines, sp % STACK_SIZE] = self.pc[machines]
+        self.pc[machines] = opcodes & 0x0FFF
+
+    def skip_if_vx_equals_value(self, machines, opcodes):
+        vx = self.v[machines, (opcodes >> 8) & 0xF]
+        self.skip_if(machines, opcodes, vx == (opcodes & 0xFF))
+
+    def skip_if_vx_not_equals_value(self, machines, opcodes):
+        vx = self.v[machines, (opcodes >> 8) & 0xF]
+        self.skip_if(machines, opcodes, vx != (opcodes & 0xFF))
+
+    def skip_if_vx_equals_vy(self, machines, opcodes):
+        vx = self.v[machines, (opcodes >> 8) & 0xF]
+        vy = self.v[machines, (opcodes >> 4) & 0xF]
+        self.skip_if(machines, opcodes, vx == vy)
+
+    def skip_if_vx_not_equals_vy(self, machines, opcodes):
+        vx = self.v[machines, (opcodes >> 8) & 0xF]
+        vy = self.v[machines, (opcodes >> 4) & 0xF]
+        self.skip_if(machines, opcodes, vx != vy)
+
+    def put_value_to_vx(self, machines, opcodes):
+        self.v[machines, (opcodes >> 8) & 0xF] = opcodes & 0xFF
+
+    def sum_value_and_vx(self, machines, opcodes):
+        x = (opcodes >> 8) & 0xF
+        self.v[machines, x] = (self.v[machines, x] + (opcodes & 0xFF)) & 0xFF
+
+    def call_logical_operation(self, machines, opcodes):
+        """
+        opcode: 0x8XY*
+        VF записывается раньше VX, поэтому при X = F остаётся результат,
+        как и в CHIP8
+        :return:
+        """
+        v = self.v
+        x = (opcodes >> 8) & 0xF
+        vx = v[machines, x].astype(numpy.int32)
+        vy = v[machines, (opcodes >> 4) & 0xF].astype(numpy.int32)
+        operation = opcodes & 0xF
+        result = numpy.empty_like(vx)
+        flag = numpy.full_like(vx, -1)
+        for code in numpy.unique(operation).tolist():
+            group = operation == code
+            a, b = vx[group], vy[group]
+            if code == 0x0:
+                result[group] = b
+            elif code == 0x1:
+                result[group] = a | b
+            elif code == 0x2:
+                result[group] = a & b
+            elif code == 0x3:
+                result[group] = a ^ b
+            elif code == 0x4:
+                result[group] = (a + b) & 0xFF
+                flag[group] = a + b >= 256
+            elif code == 0x5:
+                result[group] = (a - b) & 0xFF
+                flag[group] = a >= b
+            elif code == 0x6:
+                result[group] = a >> 1
+                flag[group] = a & 1
+            elif code == 0x7:
+                result[group] = (b - a) & 0xFF
+                flag[group] = b >= a
+            elif code == 0xE:
+                result[group] = (a << 1) & 0xFF
+                flag[group] = a >> 7
+            else:
+                self.unsupported_operation(machines[group], opcodes[group])
+        ok = ~self.faulted[machines]
+        with_flag = ok & (flag >= 0)
+        v[machines[with_flag], 15] = flag[with_flag]
+        v[machines[ok], x[ok]] = result[ok]
+
+    def put_value_to_index(self, machines, opcodes):
+        self.index[machines] = opcodes & 0x0FFF
+
+    def jump_to_address_plus_v0(self, machines, opcodes):
+        self.set_pc(machines, opcodes,
+                    self.v[machines, 0] + (opcodes & 0x0FFF))
+
+    def put_rnd_to_vx(self, machines, opcodes):
+        if self.rngs is None:
+            values = self.numpy_rng.integers(0, 256, len(machines))
+        else:
+            values = numpy.array([self.rngs[machine].randint(0, 255)
+                                  for machine in machines.tolist()],
+                                 numpy.int32)
+        self.v[machines, (opcodes >> 8) & 0xF] = values & opcodes & 0xFF
+
+    def draw_sprite(self, machines, opcodes):
+        """
+        opcode: 0xdXYN
+        Спрайт рисуется построчно сразу на всех машинах группы: строка
+        спрайта циклически сдвигается на X и складывается по модулю 2 со
+        строкой экрана (см. display.Display.draw)
+        :return:
+        """
+        v = self.v
+        xs = v[machines, (opcodes >> 8) & 0xF].astype(numpy.uint64) % 64
+        ys = v[machines, (opcodes >> 4) & 0xF].astype(numpy.int32)
+        heights = opcodes & 0xF
+        v[machines, 15] = 0
+        index = self.index[machines]
+        machines, opcodes, xs, ys, heights, index = self.split_faults(
+            machines, opcodes, index + heights > MEMORY_SIZE,
+            "Out of memory!", xs, ys, heights, index)
+        if not len(machines):
+            return
+        rows = self.rows
+        collision = numpy.zeros(len(machines), bool)
+        for line in range(int(heights.max())):
+            drawn = heights > line
+            group = machines[drawn]
+            x = xs[drawn]
+            byte = self.memory[group, index[drawn] + line].astype(
+                numpy.uint64) << numpy.uint64(56)
+            bits = (byte >> x) | (byte << ((numpy.uint64(64) - x) % 64))
+            y = (ys[drawn] + line) % HEIGHT
+            row = rows[group, y]
+            collision[drawn] |= (row & bits) != 0
+            rows[group, y] = row ^ bits
+        v[machines, 15] = collision
+        self.draw_flag[machines] = True
+
+    def skip_if_key(self, machines, opcodes):
+        operation = opcodes & 0xFF
+        pressed = (self.key_mask[machines]
+                   >> self.v[machines, (opcodes >> 8) & 0xF]) & 1 == 1
+        self.skip_if(machines, opcodes,
+                     (operation == 0x9e) & pressed
+                     | (operation == 0xa1) & ~pressed)
+        other = (operation != 0x9e) & (operation != 0xa1)
+        if other.any():
+            self.unsupported_operation(machines[other], opcodes[other])
+
+    def call_f_operations(self, machines, opcodes):
+        operation = opcodes & 0xFF
+        table = self.f_operations_table
+        for code in numpy.unique(operation).tolist():
+            group = operation == code
+            handler = table.get(code, VectorCHIP8.unsupported_operation)
+            handler(self, machines[group], opcodes[group])
+
+    def put_delay_to_vx(self, machines, opcodes):
+        self.v[machines, (opcodes >> 8) & 0xF] = self.delay_timer[machines]
+
+    def put_key_to_vx(self, machines, opcodes):
+        """
+        opcode: 0xfX0a
+        Без нажатых клавиш команда повторяется; иначе в VX кладётся
+        клавиша с наибольшим номером и отпускается
+        :return:
+        """
+        mask = self.key_mask[machines]
+        waiting = mask == 0
+        self.pc[machines[waiting]] -= 2
+        pressed = ~waiting
+        machines, opcodes, mask = \
+            machines[pressed], opcodes[pressed], mask[pressed]
+        keys = numpy.log2(mask).astype(numpy.int32)
+        self.v[machines, (opcodes >> 8) & 0xF] = keys
+        self.key_mask[machines] = mask & ~(1 << keys)
+
+    def put_vx_to_delay(self, machines, opcodes):
+        self.delay_timer[machines] = self.v[machines, (opcodes >> 8) & 0xF]
+
+    def put_vx_to_sound(self, machines, opcodes):
+        self.sound_timer[machines] = self.v[machines, (opcodes >> 8) & 0xF]
+
+    def sum_idx_and_vx(self, machines, opcodes):
+        self.index[machines] = (self.index[machines] + self.v[
+            machines, (opcodes >> 8) & 0xF]) & 0xFFFF
+
+    def put_vx_sprite_to_idx(self, machines, opcodes):
+        self.index[machines] = self.v[
+            machines, (opcodes >> 8) & 0xF].astype(numpy.int32) * 5
+
+    def store_vx_in_bcd(self, machines, opcodes):
+        """
+        opcode: 0xfX33
+        CHIP8 записывает разряды по одному, поэтому у I близко к концу
+        памяти часть разрядов успевает записаться до ошибки
+        :return:
+        """
+        source = self.v[machines, (opcodes >> 8) & 0xF]
+        index = self.index[machines]
+        digits = source // 100, source // 10 % 10, source % 10
+        for offset, digit in enumerate(digits):
+            fits = index + offset < MEMORY_SIZE
+            self.memory[machines[fits], index[fits] + offset] = digit[fits]
+        self.split_faults(machines, opcodes, index + 2 >= MEMORY_SIZE,
+                          "Out of memory!")
+
+    def put_v_reg_to_memory(self, machines, opcodes):
+        x = (opcodes >> 8) & 0xF
+        index = self.index[machines]
+        machines, opcodes, x, index = self.split_faults(
+            machines, opcodes, index + x >= MEMORY_SIZE, "Out of memory!",
+            x, index)
+        for register in range(16):
+            group = x >= register
+            self.memory[machines[group], index[group] + register] = \
+                self.v[machines[group], register]
+
+    def put_memory_to_v_reg(self, machines, opcodes):
+        x = (opcodes >> 8) & 0xF
+        index = self.index[machines]
+        machines, opcodes, x, index = self.split_faults(
+            machines, opcodes, index + x >= MEMORY_SIZE, "Out of memory!",
+            x, index)
+        for register in range(16):
+            group = x >= register
+            self.v[machines[group], register] = \
+                self.memory[machines[group], index[group] + register]
+
+    operation_table = {
+        0x0: return_clear,
+        0x1: jump_to_address,
+        0x2: call_subroutine,
+        0x3: skip_if_vx_equals_value,
+        0x4: skip_if_vx_not_equals_value,
+        0x5: skip_if_vx_equals_vy,
+        0x6: put_value_to_vx,
+        0x7: sum_value_and_vx,
+        0x8: call_logical_operation,
+        0x9: skip_if_vx_not_equals_vy,
+        0xa: put_value_to_index,
+        0xb: jump_to_address_plus_v0,
+        0xc: put_rnd_to_vx,
+        0xd: draw_sprite,
+        0xe: skip_if_key,
+        0xf: call_f_operations,
+    }
+    f_operations_table = {
+        0x7: put_delay_to_vx,
+        0xa: put_key_to_vx,
+        0x15: put_vx_to_delay,
+        0x18: put_vx_to_sound,
+        0x1e: sum_idx_and_vx,
+        0x29: put_vx_sprite_to_idx,
+        0x33: store_vx_in_bcd,
+        0x55: put_v_reg_to_memory,
+        0x65: put_memory_to_v_reg,
+    }
+
+
+def get_scalar_state(game):
+    return (bytes(game.v), game.pc, game.index, game.sp, list(game.stack),
+            game.delay_timer, game.sound_timer, game.key_mask,
+            bytes(game.memory), list(game.display.rows))
+
+
+def get_vector_state(machines, i):
+    return (machines.v[i].tobytes(), int(machines.pc[i]),
+            int(machines.index[i]), int(machines.sp[i]),
+            machines.stack[i].tolist(), int(machines.delay_timer[i]),
+            int(machines.sound_timer[i]), int(machines.key_mask[i]),
+            machines.memory[i].tobytes(), machines.rows[i].tolist())
+
+
+STATE_FIELDS = ('v', 'pc', 'index', 'sp', 'stack', 'delay_timer',
+                'sound_timer', 'key_mask', 'memory', 'rows')
+
+
+def cross_check(rom, seeds, frames, cycles_per_frame=10, key_seed=0):
+    """
+    Выполнить ROM на VectorCHIP8 и на отдельных CHIP8 с теми же зёрнами и
+    сравнить состояние машин после каждого кадра. Перед каждым кадром
+    машинам задаются случайные нажатия клавиш, одинаковые для обоих движков
+    :param rom: путь к ROM файлу
+    :param seeds: зёрна, по машине на зерно
+    :param frames: число кадров
+    :param cycles_per_frame: число команд за кадр
+    :param key_seed: зерно для нажатий клавиш
+    :return: список расхождений (кадр, номер машины, поле) на первом кадре,
+             где они нашлись; пустой список, если движки совпали
+    """
+    machines = VectorCHIP8(len(seeds), seeds)
+    machines.load_rom(rom)
+    games = []
+    for seed in seeds:
+        game = CHIP8(seed=seed)
+        game.load_rom(rom)
+        games.append(game)
+    scalar_faulted = [False] * len(games)
+    keys = Random(key_seed)
+
+    for frame in range(frames):
+        for i, game in enumerate(games):
+            # Клавиши нажимаются редко, чтобы FX0A успевал подождать
+            mask = keys.getrandbits(16) if keys.random() < 0.2 else 0
+            game.key_mask = mask
+            machines.key_mask[i] = mask
+        for i, game in enumerate(games):
+            if scalar_faulted[i]:
+                continue
+            try:
+                for _ in range(cycles_per_frame):
+                    game.emulate_cycle()
+            except Exception:
+                scalar_faulted[i] = True
+            game.tick_timers()
+        machines.run_frames(1, cycles_per_frame)
+
+        mismatches = []
+        for i, game in enumerate(games):
+            if scalar_faulted[i] != machines.faulted[i]:
+                mismatches.append((frame, i, 'faulted'))
+                continue
+            expected = get_scalar_state(game)
+            actual = get_vector_state(machines, i)
+            for field, left, right in zip(STATE_FIELDS, expected, actual):
+                if left != right:
+                    mismatches.append((frame, i, field))
+        if mismatches:
+            return mismatches
+    return []
+
+
+def main(argv=None):
+    from batch import parse_seeds
+
+    parser = argparse.ArgumentParser(
+        usage='{} command'.format(os.path.basename(sys.argv[0])),
+        description='Lockstep vectorized CHIP8 engine.',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    commands = parser.add_subparsers(dest='command')
+    commands.required = True
+
+    check = commands.add_parser(
+        'check', help='compare against the scalar core on bundled ROMs',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    check.add_argument('--roms', nargs='+', default=None,
+                       help='ROM files (default: every file in games/)')
+    check.add_argument('--seeds', type=parse_seeds, default=list(range(8)),
+                       help='seeds, one machine per seed')
+    check.add_argument('-f', '--frames', type=int, default=300,
+                       help='60 Hz frames to run')
+    check.add_argument('--cycles-per-frame', type=int, default=10,
+                       help='instructions executed between timer ticks')
+
+    speed = commands.add_parser(
+        'speed', help='measure throughput on many machines',
+        formatter_class=argparse.ArgumentDefaultsHelpFormatter)
+    speed.add_argument('rom', type=str, help='way to rom file')
+    speed.add_argument('-n', '--machines', type=int, default=1000,
+                       help='number of machines')
+    speed.add_argument('--steps', type=int, default=1000,
+                       help='lockstep steps to run')
+
+    args = parser.parse_args(argv)
+    if args.command == 'check':
+        roms = args.roms
+        if roms is None:
+            games = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                                 "games")
+            roms = sorted(glob.glob(os.path.join(games, "*")))
+        failed = False
+        for rom in roms:
+            mismatches = cross_check(rom, args.seeds, args.frames,
+                                     args.cycles_per_frame)
+            if mismatches:
+                failed = True
+                print("{}: MISMATCH {}".format(os.path.basename(rom),
+                                               mismatches[:5]))
+            else:
+                print("{}: ok".format(os.path.basename(rom)))
+        sys.exit(1 if failed else 0)
+    elif args.command == 'speed':
+        machines = VectorCHIP8(args.machines)
+        machines.load_rom(args.rom)
+        start = time.perf_counter()
+        _, executed = machines.run(args.steps)
+        seconds = time.perf_counter() - start
+        print("{} machines: {:.0f} steps/s, {:.0f} instructions/s".format(
+            args.machines, args.steps / seconds, executed / seconds))
+
+
+if __name__ == '__main__':
+    main()